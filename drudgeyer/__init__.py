@@ -1,13 +1,16 @@
 import typer
 
-from drudgeyer.cli import add, delete, log, run, show
+from drudgeyer.cli import add, cancel, delete, log, run, search, show, tracker
 
 app = typer.Typer()
 app.command("run")(run.main)
 app.command("add")(add.main)
 app.command("list")(show.main)
 app.command("delete")(delete.main)
+app.command("cancel")(cancel.main)
 app.command("log")(log.main)
+app.command("tracker")(tracker.main)
+app.command("search")(search.main)
 
 
 @app.callback()
@@ -14,6 +14,12 @@ def main(
         None, "-d", "--dir", help="directory for dependencies"
     ),
     queue: Queues = typer.Option("file", "-q", help="select queue"),
+    retries: int = typer.Option(
+        0, "--retries", min=0, help="re-queue failed job up to this many times"
+    ),
+    backoff: float = typer.Option(
+        0, "--backoff", min=0, help="initial retry delay, doubled each attempt [sec]"
+    ),
 ) -> None:
     """Applicatin: Pass new job into Queue
     For:
@@ -27,8 +33,8 @@ def main(
     dep = CopyDep(directory, BASEDIR / "dep")
     queue_ = QUEUE_CLASSES[queue](path=BASEDIR / "queue", depends=dep)
 
-    item = queue_.enqueue(command)
+    item = queue_.enqueue(command, retries=retries, backoff=backoff)
     typer.secho(
-        f"Queued:\n- Order: {item.order}\n- ID: {item.id}\n- Command: {item.command}\n- Workdir: {item.workdir}",
+        f"Queued:\n- Order: {item.order}\n- ID: {item.id}\n- Command: {item.command}\n- Workdir: {item.workdir}\n- Retries: {item.retries}",
         fg=typer.colors.CYAN,
     )
@@ -0,0 +1,29 @@
+import requests
+import typer
+
+
+def main(
+    id: str = typer.Argument(..., help="Unique target ID of running job"),
+    url: str = typer.Argument("127.0.0.1:8000", help="log-tracker server URL"),
+    preempt: bool = typer.Option(
+        False, "--preempt", help="put the job back to queue instead of failing it"
+    ),
+) -> None:
+    """Application: Cancel running job
+    For:
+    - on-premise: Access with runner via http
+    """
+    try:
+        resp = requests.post(
+            f"http://{url}/queue/cancel", json={"id": id, "preempt": preempt}
+        )
+    except requests.RequestException:
+        typer.secho("runner not found", fg=typer.colors.RED)
+        raise typer.Abort()
+
+    if resp.status_code != 200:
+        typer.secho("Invalid ID", fg=typer.colors.RED)
+        raise typer.Abort()
+
+    action = "Preempt" if preempt else "Cancel"
+    typer.secho(f"{action} job: {id}", fg=typer.colors.CYAN)
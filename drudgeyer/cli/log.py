@@ -1,32 +1,76 @@
 import asyncio
+import json
+from typing import Optional
 
 import typer
 import websockets
 
+from drudgeyer.log_tracker.record import FRAME_OFFSET
 
-async def entry_point(uri: str) -> None:
-    try:
-        async with websockets.connect(uri) as websocket:
-            async for msg in websocket:
-                typer.echo(msg, nl=False)
-    except websockets.ConnectionClosedError:
-        typer.secho("Connection closed", fg=typer.colors.RED)
-    except OSError:
-        typer.secho("not found", fg=typer.colors.RED)
-    except Exception as e:
-        typer.secho(str(e), fg=typer.colors.RED)
+
+async def entry_point(uri: str, resume: bool = False, retries: int = 0) -> None:
+    """print log streamed from uri.
+    with resume, reconnect up to `retries` times resuming after the last log
+    """
+    offset = 0
+    connected = False
+    for attempt in range(retries + 1):
+        if attempt:
+            await asyncio.sleep(1)
+            typer.secho("Reconnecting", fg=typer.colors.YELLOW)
+        try:
+            url = f"{uri}&offset={offset}" if resume else uri
+            # log is repetitive text, compressed well
+            async with websockets.connect(url, compression="deflate") as websocket:
+                connected = True
+                async for msg in websocket:
+                    if isinstance(msg, bytes):
+                        # binary frame: utf-8 log, prefixed with offset in resume
+                        if resume:
+                            (seq,) = FRAME_OFFSET.unpack_from(msg)
+                            offset = max(offset, seq)
+                            msg = msg[FRAME_OFFSET.size :]
+                        msg = msg.decode("utf-8", errors="replace")
+                    elif resume:
+                        frame = json.loads(msg)
+                        offset = max(offset, frame["offset"])
+                        msg = frame["log"]
+                    typer.echo(msg, nl=False)
+            return
+        except websockets.ConnectionClosedError:
+            typer.secho("Connection closed", fg=typer.colors.RED)
+        except OSError:
+            typer.secho("not found", fg=typer.colors.RED)
+            if not connected:
+                return
+        except Exception as e:
+            typer.secho(str(e), fg=typer.colors.RED)
+            return
 
 
 def main(
     id: str = typer.Argument(..., help="check task id using drudgeyer list"),
     url: str = typer.Argument("127.0.0.1:8000", help="log-tracker server URL"),
+    tail: Optional[int] = typer.Option(
+        None, "--tail", min=0, help="show only the last N lines of saved log"
+    ),
+    start: Optional[int] = typer.Option(
+        None, "--from", min=0, help="show saved log from line K (0-origin)"
+    ),
+    retries: int = typer.Option(
+        3, "--retry", min=0, help="reconnect times resuming where it left off"
+    ),
 ) -> None:
     """Application: tracking task logs from log-tracker application
     For:
     - on-premise: Access with Queue directly
     - cloud (future): send string of command and zip file of dependencies
     """
-    url = f"ws://{url}/log-trace?id={id}"
+    url = f"ws://{url}/log-trace?id={id}&binary=true"
+    if tail is not None:
+        url += f"&tail={tail}"
+    if start is not None:
+        url += f"&from={start}"
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(entry_point(url))
+    loop.run_until_complete(entry_point(url, resume=True, retries=retries))
     raise typer.Exit(1)
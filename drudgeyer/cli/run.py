@@ -1,18 +1,98 @@
 import asyncio
+import importlib
+import multiprocessing
+from enum import Enum
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from signal import Signals
+from types import FrameType
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import typer
 
 from drudgeyer.cli import BASEDIR
+from drudgeyer.job_scheduler.cache import ResultCache
 from drudgeyer.job_scheduler.dependency import CopyDep
+from drudgeyer.job_scheduler.lease import LeaseManager
 from drudgeyer.job_scheduler.queue import QUEUE_CLASSES, Queues
 from drudgeyer.log_tracker import log_streamer
 from drudgeyer.log_tracker.broadcasting import (
     LocalReadStreamer,
     create_app,
     run_receiver,
+    tracker_process,
 )
-from drudgeyer.worker.logger import LOGGER_CLASSES, Loggers, StreamingLogger
-from drudgeyer.worker.shell import Worker
+from drudgeyer.worker.logger import (
+    LOG_WRITER,
+    LOGGER_CLASSES,
+    BaseLog,
+    Loggers,
+    LogPolicy,
+    StreamingLogger,
+)
+from drudgeyer.worker.shell import RemoteWorker, Worker
+
+MiB = 2 ** 20
+
+
+class Loops(Enum):
+    auto = "auto"
+    asyncio = "asyncio"
+    uvloop = "uvloop"
+
+
+def new_event_loop(loop: Loops) -> asyncio.AbstractEventLoop:
+    """set uvloop event loop if available, otherwise asyncio event loop.
+    NOTE: loop must be set before instantiating logger, queue and so on bound to it.
+    """
+    if loop != Loops.asyncio:
+        try:
+            # optional dependency
+            uvloop: Any = importlib.import_module("uvloop")
+        except ImportError:
+            if loop == Loops.uvloop:
+                typer.secho("uvloop is not installed. use asyncio", fg=typer.colors.RED)
+        else:
+            event_loop: asyncio.AbstractEventLoop = uvloop.new_event_loop()
+            asyncio.set_event_loop(event_loop)
+            return event_loop
+    return asyncio.get_event_loop()
+
+
+def start_tracker(port: int) -> Tuple[BaseProcess, Connection]:
+    """log tracker in child process, so that serving logs and running jobs
+    do not block each other. return the process and pipe to push logs into it
+    """
+    limits: Dict[str, int] = {}
+    for name in ["max_head", "max_tail", "max_total"]:
+        value = getattr(LOG_WRITER, name)
+        if value is not None:
+            limits[name] = value
+
+    # fresh interpreter, without event loop and signal handlers of runner
+    context = multiprocessing.get_context("spawn")
+    reader, writer = context.Pipe(duplex=False)
+    process = context.Process(
+        target=tracker_process,
+        args=(str(BASEDIR / "log"), "127.0.0.1", port, reader, limits),
+        # not killed at exit, before it saves logs (see stop_tracker)
+        daemon=False,
+    )
+    process.start()
+    reader.close()
+    pipe: Connection = writer
+    return process, pipe
+
+
+def stop_tracker(
+    process: BaseProcess, pusher: log_streamer.PipeHandler, timeout: float = 10
+) -> None:
+    """push the rest of logs, and wait for log tracker to save them and exit"""
+    pusher.shutdown()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
 
 
 def main(
@@ -25,26 +105,112 @@ def main(
     frequency: float = typer.Option(
         3, "--freq", help="worker inspection frequency [sec]"
     ),
+    log_policy: LogPolicy = typer.Option(
+        "block", "--log-policy", help="behavior when log buffer is full"
+    ),
+    remote: Optional[str] = typer.Option(
+        None, "--remote", help="pull jobs from another runner's URL"
+    ),
+    cache: bool = typer.Option(
+        False,
+        "--cache",
+        help="skip jobs with dependency which already succeeded with same inputs",
+    ),
+    cache_age: float = typer.Option(
+        7 * 24 * 60 * 60, "--cache-age", help="evict cached results older than [sec]"
+    ),
+    cache_size: int = typer.Option(
+        1000, "--cache-size", help="maximum number of cached results"
+    ),
+    event_loop: Loops = typer.Option(
+        "auto", "--loop", help="event loop (auto: uvloop if installed)"
+    ),
+    log_head: Optional[int] = typer.Option(
+        None, "--log-head", min=0, help="keep first [MiB] of each job log"
+    ),
+    log_tail: Optional[int] = typer.Option(
+        None, "--log-tail", min=0, help="keep last [MiB] of each job log"
+    ),
+    log_total: Optional[int] = typer.Option(
+        None, "--log-total", min=0, help="budget [MiB] of all job logs on disk"
+    ),
+    tracker: Optional[str] = typer.Option(
+        None, "--tracker", help="push job logs to log tracker URL (remote streamer)"
+    ),
+    tracker_port: Optional[int] = typer.Option(
+        None, "--tracker-port", help="serve job logs from a child process on port"
+    ),
 ) -> None:
     """Managements Runner for:
     - Worker: run or wait worker subprocess for the latest job in queue, including logging.
     - Queue: CRUD for Queue (add job, get jobs, ...)
     """
+    if tracker and tracker_port is not None:
+        raise typer.BadParameter("--tracker and --tracker-port are exclusive")
+    if (
+        streamer == log_streamer.LogStreamers.remote
+        and not tracker
+        and tracker_port is None
+    ):
+        raise typer.BadParameter(
+            "--tracker or --tracker-port is required for remote log streamer"
+        )
+    if tracker or tracker_port is not None:
+        streamer = log_streamer.LogStreamers.remote
+
+    loop = new_event_loop(event_loop)
+    loop.set_debug(False)
+
+    # truncate runaway logs between head and tail
+    if log_head is not None:
+        LOG_WRITER.max_head = log_head * MiB
+    if log_tail is not None:
+        LOG_WRITER.max_tail = log_tail * MiB
+    if log_total is not None:
+        LOG_WRITER.max_total = log_total * MiB
 
     dep = CopyDep(None, BASEDIR / "dep")
     queue_ = QUEUE_CLASSES[queue](path=BASEDIR / "queue", depends=dep)
 
-    logger_ = LOGGER_CLASSES[logger]()
-
-    loop = asyncio.get_event_loop()
-    loop.set_debug(False)
+    logger_: BaseLog
+    if logger == Loggers.stream:
+        logger_ = StreamingLogger(policy=log_policy)
+    else:
+        logger_ = LOGGER_CLASSES[logger]()
 
-    worker = Worker(logger_, queue_, freq=frequency)
+    worker: Worker
+    leases: Optional[LeaseManager] = None
+    # log tracker in child process
+    child: Optional[Tuple[BaseProcess, log_streamer.PipeHandler]] = None
+    if remote:
+        worker = RemoteWorker(logger_, remote, dep, freq=frequency)
+    else:
+        cache_: Optional[ResultCache] = None
+        if cache:
+            cache_ = ResultCache(
+                BASEDIR / "cache", max_age=cache_age, max_entries=cache_size
+            )
+        worker = Worker(logger_, queue_, freq=frequency, cache=cache_)
+        leases = LeaseManager(queue_, depends=dep)
 
     if http:
         log_streamer_handler = log_streamer.QueueHandler()
         log_streamer_class = log_streamer.LOGSTREAMER_CLASSES[streamer]
-        if log_streamer_class == log_streamer.LocalLogStreamer and isinstance(
+        log_streamer_: Optional[log_streamer.LocalLogStreamer] = None
+        read_streamer: Optional[LocalReadStreamer] = None
+        if log_streamer_class == log_streamer.RemoteLogStreamer and isinstance(
+            logger_, StreamingLogger
+        ):
+            pusher: log_streamer.BasePushHandler
+            if tracker_port is None:
+                # log tracker serves logs of all runners
+                pusher = log_streamer.PushHandler(str(tracker))
+            else:
+                process, pipe = start_tracker(tracker_port)
+                pusher = log_streamer.PipeHandler(pipe)
+                child = (process, pusher)
+            log_streamer_ = log_streamer.RemoteLogStreamer(logger_, pusher)
+        elif log_streamer_class == log_streamer.LocalLogStreamer and isinstance(
             logger_, StreamingLogger
         ):
             log_streamer_ = log_streamer.LocalLogStreamer(
@@ -56,10 +222,16 @@ def main(
             )
             read_streamer = LocalReadStreamer(log_streamer_)
 
-            app = create_app(read_streamer)
-            server = run_receiver(
-                app, loop, [worker.handle_exit, log_streamer_.handle_exit]
-            )
+        if log_streamer_:
+            app = create_app(read_streamer, leases, worker, queue_)
+            handlers: List[Callable[[Signals, Optional[FrameType]], None]] = [
+                worker.handle_exit,
+                log_streamer_.handle_exit,
+            ]
+            if leases:
+                handlers += [leases.handle_exit]
+                loop.create_task(leases.entry_point())
+            server = run_receiver(app, loop, handlers)
             loop.create_task(server.serve())
             loop.create_task(log_streamer_.entry_point())
 
@@ -67,3 +239,7 @@ def main(
         loop.run_until_complete(worker._run(loop))
     except KeyboardInterrupt:
         pass
+    finally:
+        if child:
+            stop_tracker(*child)
+        LOG_WRITER.shutdown()
@@ -0,0 +1,49 @@
+from typing import List, Optional
+
+import requests
+import typer
+from pydantic import parse_obj_as
+
+from drudgeyer.cli import BASEDIR
+from drudgeyer.log_tracker.search import SearchHit, search
+
+
+def main(
+    pattern: str = typer.Argument(..., help="text to search (not regex)"),
+    ignore_case: bool = typer.Option(False, "-i", "--ignore-case"),
+    limit: int = typer.Option(100, "--limit", min=1, help="max lines to show"),
+    url: Optional[str] = typer.Option(
+        None, "--url", help="search via log-tracker server instead of local logs"
+    ),
+) -> None:
+    """Application: Search saved job logs
+    For:
+    - on-premise: Access with logs directly, or with log-tracker via http
+    """
+    hits: List[SearchHit]
+    if url:
+        try:
+            resp = requests.get(
+                f"http://{url}/log-trace/search",
+                params={
+                    "q": pattern,
+                    "ignore_case": str(ignore_case),
+                    "limit": str(limit),
+                },
+            )
+        except requests.RequestException:
+            typer.secho("log-tracker not found", fg=typer.colors.RED)
+            raise typer.Abort()
+        if resp.status_code != 200:
+            typer.secho("log-tracker has no saved logs", fg=typer.colors.RED)
+            raise typer.Abort()
+        hits = parse_obj_as(List[SearchHit], resp.json())
+    else:
+        hits = search(BASEDIR / "log", pattern, ignore_case, limit)
+
+    if not hits:
+        typer.secho("Not found", fg=typer.colors.YELLOW)
+        raise typer.Exit(1)
+    for hit in hits:
+        typer.secho(f"{hit.id}:{hit.line}: ", fg=typer.colors.CYAN, nl=False)
+        typer.echo(hit.log.rstrip("\r\n"))
@@ -54,6 +54,8 @@ def main(
         else:
             fg = typer.colors.RED
             badge = "💥"
+        attempt = f" [retry {item.attempt}/{item.retries}]" if item.attempt else ""
         typer.secho(
-            f"{badge} {item.order}: ({item.id}) {item.command} in {item.workdir}", fg=fg
+            f"{badge} {item.order}: ({item.id}) {item.command} in {item.workdir}{attempt}",
+            fg=fg,
         )
@@ -0,0 +1,21 @@
+import typer
+
+from drudgeyer.cli import BASEDIR
+from drudgeyer.cli.run import Loops, new_event_loop
+from drudgeyer.log_tracker.broadcasting import run_tracker
+
+
+def main(
+    host: str = typer.Option("127.0.0.1", "--host", help="bind address"),
+    port: int = typer.Option(8000, "--port", help="bind port"),
+    event_loop: Loops = typer.Option(
+        "auto", "--loop", help="event loop (auto: uvloop if installed)"
+    ),
+) -> None:
+    """Application: Central log tracker
+    For:
+    - on-premise: runners push job logs (drudgeyer run --tracker URL),
+      and viewers track logs of all jobs from here (drudgeyer log)
+    """
+    loop = new_event_loop(event_loop)
+    run_tracker(loop, str(BASEDIR / "log"), host, port)
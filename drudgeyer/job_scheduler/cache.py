@@ -0,0 +1,96 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+from pydantic import BaseModel
+
+from drudgeyer.job_scheduler.queue import BaseQueueModel
+
+
+class CacheModel(BaseModel):
+    """successful run which is reused for the same job"""
+
+    id: str
+    command: str
+    workdir: Path = Path("")
+    created: datetime
+
+
+class ResultCache:
+    """Memoize successful jobs keyed by command, dependency and environment.
+    Jobs without dependency snapshot are not memoized, as their inputs are unknown.
+    Entries are evicted when older than max_age [sec] or beyond max_entries.
+    """
+
+    def __init__(
+        self,
+        path: Path = Path("cache"),
+        max_age: float = 7 * 24 * 60 * 60,
+        max_entries: int = 1000,
+        env: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.path = path
+        if not path.is_dir():
+            path.mkdir(parents=True, exist_ok=True)
+        self.max_age = timedelta(seconds=max_age)
+        self.max_entries = max_entries
+        self._env = env
+
+    def key(self, task: BaseQueueModel) -> Optional[str]:
+        """hash of command, contents of dependency and environment.
+        None if the job has no dependency snapshot
+        """
+        if task.workdir == Path("") or not task.workdir.is_dir():
+            return None
+        sha = hashlib.sha256()
+        sha.update(task.command.encode())
+
+        env = self._env if self._env is not None else dict(os.environ)
+        for name in sorted(env):
+            sha.update(f"\0{name}={env[name]}".encode())
+
+        for root, dirs, files in os.walk(task.workdir):
+            dirs.sort()
+            for name in sorted(files):
+                file = Path(root) / name
+                sha.update(b"\0" + str(file.relative_to(task.workdir)).encode())
+                with file.open("rb") as f:
+                    for chunk in iter(lambda: f.read(2 ** 16), b""):
+                        sha.update(chunk)
+        return sha.hexdigest()
+
+    def get(self, key: str) -> Optional[CacheModel]:
+        file = self.path / key
+        if not file.is_file():
+            return None
+        entry = CacheModel.parse_file(file)
+        if datetime.now() - entry.created > self.max_age or (
+            # outputs of previous run are pruned
+            entry.workdir != Path("")
+            and not entry.workdir.is_dir()
+        ):
+            file.unlink()
+            return None
+        return entry
+
+    def put(self, key: str, task: BaseQueueModel) -> None:
+        entry = CacheModel(
+            id=task.id,
+            command=task.command,
+            workdir=task.workdir,
+            created=datetime.now(),
+        )
+        with (self.path / key).open("w") as f:
+            f.write(entry.json())
+        self.evict()
+
+    def evict(self) -> None:
+        files = sorted(self.path.iterdir(), key=lambda f: f.stat().st_mtime)
+        expired = datetime.now() - self.max_age
+        for idx, file in enumerate(files):
+            if idx < len(files) - self.max_entries or (
+                datetime.fromtimestamp(file.stat().st_mtime) < expired
+            ):
+                file.unlink()
@@ -0,0 +1,137 @@
+import asyncio
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from signal import Signals
+from types import FrameType
+from typing import Dict, List, Optional
+
+from drudgeyer.job_scheduler.dependency import BaseDep
+from drudgeyer.job_scheduler.queue import BaseQueue, BaseQueueModel, Status
+
+
+@dataclass
+class Lease:
+    """Job lent to a remote worker until expires"""
+
+    id: str
+    worker: str
+    expires: float
+    # cancelled, and waits for the worker to stop the job
+    preempted: bool = False
+
+
+class LeaseManager:
+    """Lend jobs in queue to remote workers.
+    Jobs of workers who stop heartbeat are re-queued when the lease expires.
+    """
+
+    def __init__(
+        self,
+        queue: BaseQueue,
+        depends: Optional[BaseDep] = None,
+        ttl: float = 60,
+        freq: float = 5,
+    ) -> None:
+        self._queue = queue
+        self._depends = depends
+        self.ttl = ttl
+        self.freq = freq
+        self._leases: Dict[str, Lease] = {}
+        self.should_exit = False
+        self.force_exit = False
+
+    def lease(self, worker: str) -> Optional[BaseQueueModel]:
+        """dequeue job for worker. workdir is relative to the dependency"""
+        self.expire()
+        task = self._queue.dequeue()
+        if task is None:
+            return None
+        self._leases[task.id] = Lease(
+            id=task.id, worker=worker, expires=time.monotonic() + self.ttl
+        )
+
+        workdir = Path("")
+        if self._depends and task.workdir != Path(""):
+            try:
+                workdir = task.workdir.relative_to(self._depends.path / task.id)
+            except ValueError:
+                pass
+        return task.copy(update={"workdir": workdir})
+
+    def heartbeat(self, id: str, worker: str) -> bool:
+        lease = self._leases.get(id)
+        if lease is None or lease.worker != worker or lease.preempted:
+            return False
+        lease.expires = time.monotonic() + self.ttl
+        return True
+
+    def complete(self, id: str, worker: str, status: Status) -> bool:
+        lease = self._leases.get(id)
+        if lease is None or lease.worker != worker:
+            return False
+        del self._leases[id]
+        self._queue.worked(id, status)
+        return True
+
+    def cancel(self, id: str, preempt: bool = False) -> bool:
+        """revoke lease. the remote worker stops the job at the next heartbeat.
+        preempted job is re-queued when the worker completes it or the lease
+        expires, so that it does not run on two workers at once
+        """
+        lease = self._leases.get(id)
+        if lease is None or (preempt and lease.preempted):
+            return False
+        if preempt:
+            lease.preempted = True
+            return True
+        del self._leases[id]
+        self._queue.worked(id, Status.failed, retry=False)
+        return True
+
+    def expire(self) -> List[str]:
+        """re-queue jobs whose lease is expired"""
+        now = time.monotonic()
+        expired = [lease.id for lease in self._leases.values() if lease.expires < now]
+        for id in expired:
+            del self._leases[id]
+            try:
+                self._queue.requeue(id)
+            except FileNotFoundError:
+                pass
+        return expired
+
+    def archive(self, id: str, to: Path) -> Optional[Path]:
+        """zip dependency of leased job for the remote worker"""
+        if id not in self._leases or self._depends is None:
+            return None
+        target = self._depends.path / id
+        if not target.is_dir():
+            return None
+        return Path(shutil.make_archive(str(to / id), "zip", root_dir=target))
+
+    async def entry_point(self) -> None:
+        try:
+            while not self.should_exit:
+                self.expire()
+                await asyncio.sleep(self.freq)
+        except asyncio.CancelledError:
+            return
+
+    def handle_exit(self, sig: Signals, frame: Optional[FrameType]) -> None:
+        if self.should_exit:
+            self.force_exit = True
+        else:
+            self.should_exit = True
+
+
+def unpack_archive(archive: bytes, to: Path) -> None:
+    """extract zipped dependency from LeaseManager.archive"""
+    to.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = Path(tempdir) / "dep.zip"
+        with path.open("wb") as f:
+            f.write(archive)
+        shutil.unpack_archive(str(path), str(to), "zip")
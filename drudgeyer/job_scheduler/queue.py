@@ -1,6 +1,6 @@
 import asyncio
 from abc import ABC, abstractmethod
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import Enum, auto
 from pathlib import Path
 from shutil import rmtree
@@ -9,6 +9,7 @@ from typing import TYPE_CHECKING, Dict, List, Optional, Type
 from pydantic import BaseModel
 
 from drudgeyer.job_scheduler.dependency import BaseDep
+from drudgeyer.metrics import QUEUE_DEQUEUED, QUEUE_ENQUEUED, QUEUE_JOBS, QUEUE_WAIT
 
 
 class Status(Enum):
@@ -24,6 +25,17 @@ class BaseQueueModel(BaseModel):
     command: str
     workdir: Path = Path("")
     status: Status = Status.todo
+    attempt: int = 0
+    retries: int = 0
+
+
+class RetryModel(BaseModel):
+    """retry state of a job, stored beside the job file"""
+
+    retries: int = 0
+    backoff: float = 0
+    attempt: int = 0
+    not_before: Optional[datetime] = None
 
 
 if TYPE_CHECKING:
@@ -38,15 +50,19 @@ class BaseQueue(ABC):
     @abstractmethod
     def dequeue(self) -> Optional[BaseQueueModel]: ...  # pragma: no cover
     @abstractmethod
-    def enqueue(self, cmd: str) -> BaseQueueModel: ...  # pragma: no cover
+    def enqueue(self, cmd: str, retries: int = 0, backoff: float = 0) -> BaseQueueModel: ...  # pragma: no cover
     @abstractmethod
     def list(self, detail: bool = False, status: Optional[Status] = None) -> List[BaseQueueModel]: ...  # pragma: no cover
     @abstractmethod
-    def worked(self, id: str, status: Status) -> None: ...  # pragma: no cover
+    def worked(self, id: str, status: Status, retry: bool = True) -> None: ...  # pragma: no cover
+    @abstractmethod
+    def requeue(self, id: str) -> None: ...  # pragma: no cover
     @abstractmethod
     def pop(self, id: str) -> None: ...  # pragma: no cover
     @abstractmethod
     def prune(self) -> None: ...  # pragma: no cover
+    @abstractmethod
+    def refresh(self) -> None: ...  # pragma: no cover
     # fmt: on
 
 
@@ -58,6 +74,7 @@ class FileQueue(BaseQueue):
         self.doing = path / "doing"
         self.done = path / "done"
         self.failed = path / "failed"
+        self.meta = path / "meta"
 
         if not path.is_dir():
             path.mkdir(parents=True, exist_ok=True)
@@ -67,15 +84,58 @@ class FileQueue(BaseQueue):
             self.done.mkdir(parents=True, exist_ok=True)
         if not self.failed.is_dir():
             self.failed.mkdir(parents=True, exist_ok=True)
+        if not self.meta.is_dir():
+            self.meta.mkdir(parents=True, exist_ok=True)
 
         self.depends = depends
 
-    def enqueue(self, cmd: str) -> BaseQueueModel:
+        # depth gauges are counted once, and then kept by each transition
+        for status, dir in [
+            (Status.todo, path),
+            (Status.doing, self.doing),
+            (Status.done, self.done),
+            (Status.failed, self.failed),
+        ]:
+            QUEUE_JOBS.set(len(list(dir.glob("*-*-*-*-*-*-*"))), status=status.name)
+
+    def refresh(self) -> None:
+        """count jobs added by other processes (drudgeyer add) into metrics"""
+        self._arrived(len(list(self.path.glob("*-*-*-*-*-*-*"))))
+
+    def _arrived(self, todo: int) -> None:
+        """jobs in todo more than counted are added by other processes"""
+        arrived = todo - QUEUE_JOBS.get(status=Status.todo.name)
+        if arrived > 0:
+            QUEUE_ENQUEUED.inc(arrived)
+        QUEUE_JOBS.set(todo, status=Status.todo.name)
+
+    def _moved(self, src: Optional[Status], dst: Optional[Status]) -> None:
+        if src:
+            QUEUE_JOBS.dec(status=src.name)
+        if dst:
+            QUEUE_JOBS.inc(status=dst.name)
+
+    def _read_retry(self, id: str) -> Optional[RetryModel]:
+        meta = self.meta / id
+        if not meta.is_file():
+            return None
+        return RetryModel.parse_file(meta)
+
+    def _write_retry(self, id: str, retry: RetryModel) -> None:
+        with (self.meta / id).open("w") as f:
+            f.write(retry.json())
+
+    def _clear_retry(self, id: str) -> None:
+        meta = self.meta / id
+        if meta.is_file():
+            meta.unlink()
+
+    def enqueue(self, cmd: str, retries: int = 0, backoff: float = 0) -> BaseQueueModel:
         now = datetime.now()
         id = now.strftime("%Y-%m-%d-%H-%M-%S-%f")
         file = self.path / id
         if file.is_file():
-            self.enqueue(cmd)
+            return self.enqueue(cmd, retries=retries, backoff=backoff)
 
         if self.depends:
             loop = asyncio.get_event_loop()
@@ -84,18 +144,40 @@ class FileQueue(BaseQueue):
         else:
             workdir = Path("")
 
+        if retries > 0:
+            self._write_retry(id, RetryModel(retries=retries, backoff=backoff))
+
         with file.open("w") as f:
             f.write(cmd)
+        QUEUE_ENQUEUED.inc()
+        self._moved(None, Status.todo)
 
         order = len(list(file.glob("*-*-*-*-*-*-*")))
 
-        return BaseQueueModel(id=id, command=cmd, order=order, workdir=workdir)
+        return BaseQueueModel(
+            id=id, command=cmd, order=order, workdir=workdir, retries=retries
+        )
 
     def dequeue(self) -> Optional[BaseQueueModel]:
         files = list(self.path.glob("*-*-*-*-*-*-*"))
+        self._arrived(len(files))
         if not files:
             return None
 
+        # skip retried jobs which are still backing off
+        waiting = set(f.name for f in self.meta.iterdir())
+        if waiting:
+            now = datetime.now()
+            ready = []
+            for file in files:
+                retry = self._read_retry(file.name) if file.name in waiting else None
+                if retry and retry.not_before and retry.not_before > now:
+                    continue
+                ready.append(file)
+            files = ready
+            if not files:
+                return None
+
         times = [datetime.strptime(f.name, "%Y-%m-%d-%H-%M-%S-%f") for f in files]
         minn: datetime = times[0]
         minn_idx = 0
@@ -113,19 +195,57 @@ class FileQueue(BaseQueue):
             workdir = self.depends.workdir(target.name)
         else:
             workdir = Path("")
-        return BaseQueueModel(id=target.name, command=cmd, order=0, workdir=workdir)
-
-    def worked(self, id: str, status: Status) -> None:
+        retry = self._read_retry(target.name)
+
+        QUEUE_DEQUEUED.inc()
+        self._moved(Status.todo, Status.doing)
+        # retried job waits from the end of its backoff
+        since = retry.not_before if retry and retry.not_before else minn
+        QUEUE_WAIT.observe(max((datetime.now() - since).total_seconds(), 0))
+        return BaseQueueModel(
+            id=target.name,
+            command=cmd,
+            order=0,
+            workdir=workdir,
+            attempt=retry.attempt if retry else 0,
+            retries=retry.retries if retry else 0,
+        )
+
+    def worked(self, id: str, status: Status, retry: bool = True) -> None:
+        """move finished job. todo status puts it back to the queue (preempted)"""
         target = self.doing / id
         if not target.is_file():
             return
 
         if status == Status.done:
             target.rename(self.done.resolve() / target.name)
+            self._moved(Status.doing, Status.done)
+        elif status == Status.todo:
+            target.rename(self.path.resolve() / target.name)
+            self._moved(Status.doing, Status.todo)
         elif status == Status.failed:
+            state = self._read_retry(id) if retry else None
+            if state and state.attempt < state.retries:
+                # re-queue with exponential backoff: backoff * 2 ** attempt [sec]
+                delay = state.backoff * 2 ** state.attempt
+                state.not_before = datetime.now() + timedelta(seconds=delay)
+                state.attempt += 1
+                self._write_retry(id, state)
+                target.rename(self.path.resolve() / target.name)
+                self._moved(Status.doing, Status.todo)
+                return
             target.rename(self.failed.resolve() / target.name)
+            self._moved(Status.doing, Status.failed)
         return
 
+    def requeue(self, id: str) -> None:
+        """put running job back to the queue"""
+        target = self.doing / id
+        if not target.is_file():
+            raise FileNotFoundError
+        target.rename(self.path.resolve() / target.name)
+        self._moved(Status.doing, Status.todo)
+
     def _list(
         self,
         files: List[Path],
@@ -154,6 +274,7 @@ class FileQueue(BaseQueue):
             else:
                 workdir = Path("")
                 cmd = ""
+            retry = self._read_retry(target.name)
             out_a(
                 BaseQueueModel(
                     id=target.name,
@@ -161,6 +282,8 @@ class FileQueue(BaseQueue):
                     command=cmd,
                     workdir=workdir,
                     status=status,
+                    attempt=retry.attempt if retry else 0,
+                    retries=retry.retries if retry else 0,
                 )
             )
 
@@ -195,6 +318,8 @@ class FileQueue(BaseQueue):
         if not target.is_file():
             raise FileNotFoundError
         target.unlink()
+        self._moved(Status.todo, None)
+        self._clear_retry(id)
         if self.depends:
             loop = asyncio.get_event_loop()
             loop.run_until_complete(self.depends.clear(id))
@@ -205,6 +330,10 @@ class FileQueue(BaseQueue):
         ids = [item.id for item in items if item.status in {Status.done, Status.failed}]
         rmtree(self.failed)
         rmtree(self.done)
+        QUEUE_JOBS.set(0, status=Status.done.name)
+        QUEUE_JOBS.set(0, status=Status.failed.name)
+        for id in ids:
+            self._clear_retry(id)
         if self.depends and ids:
             loop = asyncio.get_event_loop()
             loop.run_until_complete(
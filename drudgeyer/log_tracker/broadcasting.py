@@ -1,23 +1,63 @@
 import asyncio
+import json
 import logging
+import re
 import signal
+import tempfile
+import uuid
 from abc import ABC, abstractmethod
 from asyncio.events import AbstractEventLoop
 from asyncio.queues import Queue
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection
 from pathlib import Path
 from types import FrameType
-from typing import AsyncGenerator, Callable, Dict, List, Optional, Set
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 
-from fastapi import Depends, FastAPI, WebSocket, WebSocketDisconnect
-from pydantic import BaseModel
+from fastapi import (
+    Depends,
+    FastAPI,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, parse_obj_as
 from uvicorn import Config, Server  # type: ignore
+from uvicorn.protocols.websockets.websockets_impl import (  # type: ignore
+    WebSocketProtocol,
+)
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
 
+from drudgeyer.job_scheduler.lease import LeaseManager
+from drudgeyer.job_scheduler.queue import BaseQueue, BaseQueueModel, Status
 from drudgeyer.log_tracker.log_streamer import (
     BaseLogStreamer,
     QueueFileHandler,
     QueueHandler,
+    TrackerLogStreamer,
 )
+from drudgeyer.log_tracker.record import FRAME_OFFSET, LogRecord
+from drudgeyer.log_tracker.search import SearchHit, search
+from drudgeyer.metrics import LOG_DROPPED, REGISTRY, WEBSOCKET_CLIENTS, monitor_loop_lag
+from drudgeyer.worker.logger import LOG_WRITER, LogModel
+
+logger = logging.getLogger(__name__)
 
 
 class BaseReadStreamer(ABC):
@@ -28,31 +68,122 @@ class BaseReadStreamer(ABC):
         ...  # pragma: no cover
 
     @abstractmethod
-    async def add_client(self, id: str, key: str) -> None:
+    async def add_client(
+        self,
+        id: str,
+        key: str,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> None:
         ...  # pragma: no cover
 
     @abstractmethod
     async def delete(self, key: str) -> None:
         ...  # pragma: no cover
 
+    async def get_log(self, key: str) -> LogModel:
+        """log with its sequence number (0: unknown)"""
+        return LogModel(id="", log=await self.get(key))
+
+    async def get_batch(
+        self, key: str, max_size: int = 2 ** 16, latency: float = 0
+    ) -> LogModel:
+        """logs available now or within latency [sec] in a single log,
+        up to about max_size characters
+        """
+        return await self.get_log(key)
+
+
+class RingBuffer:
+    """Latest logs of a job shared by all clients.
+    Each client holds its own cursor (sequence number of log), so that
+    appending log costs O(1) regardless of the number of clients.
+    """
+
+    def __init__(self, size: int = 1000) -> None:
+        self.size = size
+        self._buffer: List[Optional[LogModel]] = [None] * size
+        # sequence number of the next log
+        self.head = 0
+        # lines appended so far, and before each log in buffer
+        self.lines = 0
+        self._lines = [0] * size
+        self.closed = False
+        self._appended = asyncio.Event()
+
+    @property
+    def tail(self) -> int:
+        """sequence number of the oldest log in buffer"""
+        return max(self.head - self.size, 0)
+
+    def append(self, log: LogModel) -> None:
+        self._buffer[self.head % self.size] = log
+        self._lines[self.head % self.size] = self.lines
+        self.lines += log.log.count("\n")
+        self.head += 1
+        self._wakeup()
+
+    def lines_before(self, cursor: int) -> int:
+        """lines appended before log at cursor (in buffer, or head)"""
+        if cursor >= self.head:
+            return self.lines
+        return self._lines[cursor % self.size]
+
+    def close(self) -> None:
+        self.closed = True
+        self._wakeup()
+
+    def _wakeup(self) -> None:
+        appended, self._appended = self._appended, asyncio.Event()
+        appended.set()
+
+    async def wait(self, cursor: int) -> None:
+        """wait until log at cursor is appended"""
+        while cursor >= self.head:
+            if self.closed:
+                raise ValueError("buffer is closed")
+            await self._appended.wait()
+
+    def read_nowait(self, cursor: int) -> Tuple[Optional[LogModel], int]:
+        """log at cursor appended already and the next cursor.
+        client falling behind gets None, and skips to the oldest log
+        """
+        if cursor < self.tail:
+            return None, self.tail
+        return self._buffer[cursor % self.size], cursor + 1
+
+    async def read(self, cursor: int) -> Tuple[Optional[LogModel], int]:
+        await self.wait(cursor)
+        return self.read_nowait(cursor)
+
 
 @dataclass
 class ReadQueue:
-    """Queue each client for broadcasting"""
+    """Cursor of each client on shared buffer for broadcasting"""
 
     key: str
     target: str
-    queue: "Queue[str]"
+    ring: RingBuffer
+    cursor: int
+    # lines before cursor
+    lines: int = 0
+    # saved log sent in chunks before streaming
+    history: Optional[AsyncGenerator[LogModel, None]] = None
+    backlog: Deque[LogModel] = field(default_factory=deque)
+    # sequence number of the last log sent
+    after: int = 0
     live: bool = True
 
 
 @dataclass
 class LogQueue:
-    """Queue streaming log data from LogStreamer"""
+    """Queue streaming log data from LogStreamer into shared buffer"""
 
     id: str
     targets: Set[str]
-    queue: "Queue[str]"
+    queue: "Queue[LogModel]"
+    ring: RingBuffer
     live: bool = True
     task: Optional["asyncio.Task[None]"] = None
 
@@ -61,7 +192,10 @@ class LocalReadStreamer(BaseReadStreamer):
     """streaming log data from queue handler in log_streamer"""
 
     def __init__(
-        self, log_streamer: BaseLogStreamer, loop: Optional[AbstractEventLoop] = None
+        self,
+        log_streamer: BaseLogStreamer,
+        loop: Optional[AbstractEventLoop] = None,
+        buffer_size: int = 1000,
     ):
         handler: Optional[QueueHandler] = None
         _file: Optional[QueueFileHandler] = None
@@ -75,6 +209,7 @@ class LocalReadStreamer(BaseReadStreamer):
             raise ValueError("QueueHandler is not found")
         self.handler = handler
         self._file = _file
+        self.buffer_size = buffer_size
 
         self._key_to_readqueue: Dict[str, ReadQueue] = {}
         self._id_to_logqueue: Dict[str, LogQueue] = {}
@@ -90,106 +225,247 @@ class LocalReadStreamer(BaseReadStreamer):
                     pass
 
     async def entry_point(self, log_queue: LogQueue) -> None:
-        # possibly bottle neck
         queue = log_queue.queue
         try:
             while log_queue.live:
-                log = await queue.get()
-                keys = log_queue.targets
-                for key in keys:
-                    _queue = self._key_to_readqueue.get(key)
-                    if _queue and _queue.live:
-                        await _queue.queue.put(log)
+                log_queue.ring.append(await queue.get())
         except (RuntimeError, asyncio.CancelledError):
             # queue is deleted
             log_queue.live = False
+            log_queue.ring.close()
             self._reflesh()
 
     async def get(self, key: str) -> str:
+        log = await self.get_log(key)
+        return log.log
+
+    async def get_log(self, key: str) -> LogModel:
         queue = self._key_to_readqueue.get(key)
         if not queue:
             raise KeyError("must add key at first")
         if not queue.live:
             raise ValueError("broken connection. try again")
         try:
-            log = await queue.queue.get()
-            return log
-        except (RuntimeError, asyncio.CancelledError):
+            while queue.history:
+                try:
+                    saved = await queue.history.__anext__()
+                    queue.after = max(queue.after, saved.seq)
+                    return saved
+                except StopAsyncIteration:
+                    queue.history = None
+            while True:
+                log = self._next(queue)
+                if log:
+                    return log
+                await queue.ring.wait(queue.cursor)
+        except (RuntimeError, asyncio.CancelledError, ValueError):
             queue.live = False
         raise ValueError("broken connection. try again")
 
-    async def add_client(self, id: str, key: str) -> None:
-        # create if none
-        read = self._key_to_readqueue.get(key)
-        if read and read.target == id and read.live:
-            pass
-        else:
-            _queue: Queue[str] = Queue()
-            if self._file:
-                _record = await self._file.get_record(id)
-                if _record:
-                    await _queue.put(_record)
-                    await _queue.put("-------------- loading -------------\n")
+    async def get_batch(
+        self, key: str, max_size: int = 2 ** 16, latency: float = 0
+    ) -> LogModel:
+        log = await self.get_log(key)
+        queue = self._key_to_readqueue.get(key)
+        logs, size, seq = [log.log], len(log.log), log.seq
 
-            read = ReadQueue(key=key, target=id, queue=_queue)
-            self._key_to_readqueue[key] = read
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + latency
+        while queue and queue.live and not queue.history and size < max_size:
+            _log = self._next(queue)
+            if _log is None:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(queue.ring.wait(queue.cursor), timeout)
+                except (asyncio.TimeoutError, ValueError):
+                    break
+                continue
+            logs.append(_log.log)
+            size += len(_log.log)
+            seq = max(seq, _log.seq)
+        return LogModel(id=log.id, log="".join(logs), seq=seq)
+
+    def _next(self, queue: ReadQueue) -> Optional[LogModel]:
+        """next log available without waiting"""
+        if queue.history:
+            return None
+        if queue.backlog:
+            return queue.backlog.popleft()
+        while queue.cursor < queue.ring.head:
+            cursor = queue.cursor
+            log, queue.cursor = queue.ring.read_nowait(cursor)
+            lines, queue.lines = queue.lines, queue.ring.lines_before(queue.cursor)
+            if log is None:
+                # overwritten before this client read them
+                LOG_DROPPED.inc(queue.cursor - cursor)
+                dropped = queue.lines - lines
+                msg = f"-------------- {dropped} lines dropped -------------\n"
+                return LogModel(id=queue.target, log=msg)
+            # skip log already sent from saved log
+            if log.seq > queue.after:
+                queue.after = log.seq
+                return log
+        return None
 
+    async def add_client(
+        self,
+        id: str,
+        key: str,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> None:
         # create if none
         log = self._id_to_logqueue.get(id)
         if log and log.live:
             log.targets.add(key)
         else:
             await self.handler.add(id)
-            handler_queues = self.handler._queues
-            queue = handler_queues.get(id)
-            if queue:
-                log = LogQueue(
-                    id=id,
-                    targets={key},
-                    queue=queue,
-                )
-                self._id_to_logqueue[id] = log
-                loop = asyncio.get_event_loop()
-                log.task = loop.create_task(self.entry_point(log))
+            log = LogQueue(
+                id=id,
+                targets={key},
+                queue=self.handler._queues[id],
+                ring=RingBuffer(self.buffer_size),
+            )
+            self._id_to_logqueue[id] = log
+            loop = asyncio.get_event_loop()
+            log.task = loop.create_task(self.entry_point(log))
+
+        # create if none
+        read = self._key_to_readqueue.get(key)
+        if not (read and read.target == id and read.live):
+            read = ReadQueue(
+                key=key,
+                target=id,
+                ring=log.ring,
+                cursor=log.ring.head,
+                lines=log.ring.lines,
+            )
+            if self._file:
+                await self._preload(read, start, tail, offset)
+            self._key_to_readqueue[key] = read
         self._reflesh()
 
+    async def _preload(
+        self,
+        read: ReadQueue,
+        start: Optional[int],
+        tail: Optional[int],
+        offset: Optional[int],
+    ) -> None:
+        """saved log sent before streaming"""
+        if not self._file:
+            return
+        id = read.target
+        # log streamed before cursor is saved
+        await self._file.flush()
+        if offset is None:
+            chunks = self._file.iter_records(id, start, tail)
+            read.history = self._history(id, chunks, legacy=True)
+            return
+
+        # resume exactly from offset
+        read.after = offset
+        if offset:
+            chunks = self._file.iter_records(id, after=offset)
+        else:
+            chunks = self._file.iter_records(id, start, tail)
+        read.history = self._history(id, chunks)
+
+    async def _history(
+        self,
+        id: str,
+        chunks: AsyncGenerator[List[LogRecord], None],
+        legacy: bool = False,
+    ) -> AsyncGenerator[LogModel, None]:
+        """saved log in chunks, so that memory per client is bounded.
+        legacy one ends with newline and loading marker
+        """
+        last: Optional[LogModel] = None
+        try:
+            async for records in chunks:
+                if last:
+                    yield last
+                seq = max(record.seq for record in records)
+                text = "".join(record.text for record in records)
+                last = LogModel(id=id, log=text, seq=seq)
+        finally:
+            await chunks.aclose()
+        if last is None:
+            return
+        if legacy:
+            last.log += "\n"
+        yield last
+        if legacy:
+            yield LogModel(id=id, log="-------------- loading -------------\n")
+
     async def delete(self, key: str) -> None:
         # delete ReadQueue
-        read = self._key_to_readqueue.get(key)
+        read = self._key_to_readqueue.pop(key, None)
         if read:
             read.live = False
-            try:
-                del self._key_to_readqueue[key]
-            except KeyError:
-                pass
-        # cancel sync task and delete LogQueue
-        new_id_to_logqueue = {}
-        for log in self._id_to_logqueue.values():
-            if {key} == log.targets:
-                await self.handler.delete(log.id)
-                log.targets = set([])
-                log.live = False
-                if log.task:
-                    log.task.cancel()
-            else:
-                new_id_to_logqueue[log.id] = log
+            if read.history:
+                try:
+                    await read.history.aclose()
+                except RuntimeError:
+                    # being read. closed by garbage collection
+                    pass
+        # cancel sync task and delete LogQueue without clients
+        for log in list(self._id_to_logqueue.values()):
+            log.targets.discard(key)
+            if log.targets:
+                continue
+            await self.handler.delete(log.id)
+            log.live = False
+            log.ring.close()
+            if log.task:
+                log.task.cancel()
+            del self._id_to_logqueue[log.id]
         self._reflesh()
 
 
 class GetReadStreamer:
     """Helper class for streaming log data for broadcasting with websocket"""
 
-    def __init__(self, key: str, streamer: BaseReadStreamer, ws: WebSocket):
+    def __init__(
+        self,
+        key: str,
+        streamer: BaseReadStreamer,
+        ws: WebSocket,
+        framed: bool = False,
+        max_size: int = 2 ** 16,
+        latency: float = 0.01,
+        binary: bool = False,
+    ):
         self._streamer = streamer
         self._key = key
         self._ws = ws
+        # send log with its offset (sequence number) to resume from it
+        self.framed = framed
+        # send log as utf-8 bytes. framed one is prefixed with its offset
+        self.binary = binary
+        # lines are coalesced into a frame up to max_size or latency [sec]
+        self.max_size = max_size
+        self.latency = latency
         self.exit = False
 
     async def streaming(self) -> None:
         try:
             while not self.exit:
-                log = await self._streamer.get(self._key)
-                await self._ws.send_text(log)
+                log = await self._streamer.get_batch(
+                    self._key, self.max_size, self.latency
+                )
+                if self.binary:
+                    data = log.log.encode("utf-8")
+                    if self.framed:
+                        data = FRAME_OFFSET.pack(log.seq) + data
+                    await self._ws.send_bytes(data)
+                elif self.framed:
+                    await self._ws.send_json({"offset": log.seq, "log": log.log})
+                else:
+                    await self._ws.send_text(log.log)
         except (Exception, WebSocketDisconnect, asyncio.CancelledError):
             pass
 
@@ -197,23 +473,168 @@ class GetReadStreamer:
         self.exit = True
 
 
+class Subscription(BaseModel):
+    """message of multiplexed log streaming.
+    subscribe (id, tail, from, offset as /log-trace) or unsubscribe a job
+    """
+
+    subscribe: Optional[str] = None
+    unsubscribe: Optional[str] = None
+    tail: Optional[int] = Field(None, ge=0)
+    start: Optional[int] = Field(None, alias="from", ge=0)
+    offset: int = Field(0, ge=0)
+
+
+class MultiplexReadStreamer:
+    """Helper class for streaming logs of many jobs over one websocket.
+    log is sent as {"id": str, "offset": int, "log": str} tagged with its job.
+    each subscription is a client of read streamer, sharing the job's pump
+    """
+
+    def __init__(
+        self,
+        key: str,
+        streamer: BaseReadStreamer,
+        ws: WebSocket,
+        max_size: int = 2 ** 16,
+        latency: float = 0.01,
+    ):
+        self._streamer = streamer
+        self._key = key
+        self._ws = ws
+        self.max_size = max_size
+        self.latency = latency
+        self._tasks: Dict[str, "asyncio.Task[None]"] = {}
+        # frames of jobs are sent one by one
+        self._lock = asyncio.Lock()
+
+    async def receive(self, message: Any) -> None:
+        try:
+            sub = Subscription.parse_obj(message)
+        except ValidationError as e:
+            await self._send({"error": str(e)})
+            return
+        if sub.unsubscribe:
+            await self.unsubscribe(sub.unsubscribe)
+        if sub.subscribe:
+            await self.subscribe(sub.subscribe, sub.start, sub.tail, sub.offset)
+
+    async def subscribe(
+        self,
+        id: str,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        offset: int = 0,
+    ) -> None:
+        if id in self._tasks:
+            return
+        key = f"{self._key}/{id}"
+        await self._streamer.add_client(id, key, start, tail, offset)
+        loop = asyncio.get_event_loop()
+        self._tasks[id] = loop.create_task(self.streaming(id, key))
+
+    async def unsubscribe(self, id: str) -> None:
+        task = self._tasks.pop(id, None)
+        if task:
+            task.cancel()
+            await self._streamer.delete(f"{self._key}/{id}")
+
+    async def streaming(self, id: str, key: str) -> None:
+        try:
+            while True:
+                log = await self._streamer.get_batch(key, self.max_size, self.latency)
+                await self._send({"id": id, "offset": log.seq, "log": log.log})
+        except (Exception, WebSocketDisconnect, asyncio.CancelledError):
+            pass
+
+    async def close(self) -> None:
+        for id in list(self._tasks):
+            await self.unsubscribe(id)
+
+    async def _send(self, data: Dict[str, Any]) -> None:
+        async with self._lock:
+            await self._ws.send_json(data)
+
+
+async def stream_log(
+    read_streamer: BaseReadStreamer,
+    id: str,
+    key: str,
+    start: Optional[int] = None,
+    tail: Optional[int] = None,
+    offset: Optional[int] = None,
+    sse: bool = False,
+) -> AsyncGenerator[str, None]:
+    """log streamed over plain HTTP, until the client disconnects.
+    with sse, log is sent as Server-Sent Events of {"offset": int, "log": str}
+    with the offset as event id
+    """
+    await read_streamer.add_client(id, key, start, tail, offset)
+    try:
+        while True:
+            log = await read_streamer.get_batch(key, latency=0.01)
+            if sse:
+                data = json.dumps({"offset": log.seq, "log": log.log})
+                yield f"id: {log.seq}\ndata: {data}\n\n"
+            else:
+                yield log.log
+    except (KeyError, ValueError):
+        return
+    finally:
+        await read_streamer.delete(key)
+
+
+def byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """first and last byte of single range "bytes=a-b", "bytes=a-" or "bytes=-n".
+    None if not supported (whole log is sent), ValueError if not satisfiable
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # the last n bytes
+        start, end = max(size - int(last), 0), size - 1
+        if not int(last):
+            start = size
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
 class Command(BaseModel):
     cmd: str
 
 
 def streamer(
     read_streamer: BaseReadStreamer,
-) -> Callable[[WebSocket, str], AsyncGenerator[GetReadStreamer, None]]:
+) -> Callable[..., AsyncGenerator[GetReadStreamer, None]]:
     async def _streamer(
-        ws: WebSocket, id: str
+        ws: WebSocket,
+        id: str,
+        tail: Optional[int] = Query(None, ge=0),
+        start: Optional[int] = Query(None, alias="from", ge=0),
+        offset: Optional[int] = Query(None, ge=0),
+        binary: bool = False,
     ) -> AsyncGenerator[GetReadStreamer, None]:
-        """Dependency function for ReadStreamer."""
+        """Dependency function for ReadStreamer.
+        saved log is sent from line `from`, or only the last `tail` lines.
+        with `offset`, log is sent as {"offset": int, "log": str}, and
+        reconnecting with the last offset resumes after it.
+        with `binary`, log is sent as utf-8 bytes, prefixed with the offset
+        (see FRAME_OFFSET) if `offset` is given
+        """
         # prepare streamer
         await ws.accept()
         key = ws.headers.get("sec-websocket-key")
-        await read_streamer.add_client(id, key)
+        await read_streamer.add_client(id, key, start, tail, offset)
 
-        get_read_streamer = GetReadStreamer(key, read_streamer, ws)
+        get_read_streamer = GetReadStreamer(
+            key, read_streamer, ws, framed=offset is not None, binary=binary
+        )
 
         try:
             # start broadcasting
@@ -229,15 +650,98 @@ class PruneIDs(BaseModel):
     ids: List[str]
 
 
-def create_app(read_streamer: BaseReadStreamer) -> FastAPI:
+class LeaseRequest(BaseModel):
+    worker: str
+
+
+class HeartbeatRequest(BaseModel):
+    id: str
+    worker: str
+
+
+class CompleteRequest(BaseModel):
+    id: str
+    worker: str
+    status: Status
+
+
+class CancelRequest(BaseModel):
+    id: str
+    preempt: bool = False
+
+
+if TYPE_CHECKING:
+    # typing.Protocol is not available in Python 3.7
+    from typing_extensions import Protocol
+else:
+    Protocol = object
+
+
+class JobCanceller(Protocol):
+    """worker stopping its running job (see drudgeyer.worker.shell)"""
+
+    def cancel(self, id: str, preempt: bool = False) -> bool:
+        ...  # pragma: no cover
+
+
+def create_app(
+    read_streamer: Optional[BaseReadStreamer],
+    leases: Optional[LeaseManager] = None,
+    worker: Optional[JobCanceller] = None,
+    queue: Optional[BaseQueue] = None,
+) -> FastAPI:
+    """API of runner. without read streamer, logs are tracked elsewhere
+    (see add_push_routes). queue is counted at each scrape of metrics
+    """
     app = FastAPI()
 
+    if leases is not None:
+        add_queue_routes(app, leases)
+    if read_streamer is not None:
+        add_log_routes(app, read_streamer)
+
+    @app.post("/queue/cancel")
+    async def queue_cancel(body: CancelRequest) -> None:
+        """stop running job, and fail it or re-queue it (preempt)"""
+        if worker and worker.cancel(body.id, body.preempt):
+            return
+        if leases and leases.cancel(body.id, body.preempt):
+            return
+        raise HTTPException(status_code=404, detail="running job not found")
+
     @app.post("/add-task")
     async def add_task(body: Command) -> None:
         path = Path("storage/queue")
         with path.open("a+") as f:
             f.write(body.cmd)
 
+    lag: List["asyncio.Task[None]"] = []
+
+    @app.on_event("startup")
+    async def start_monitor() -> None:
+        lag.append(asyncio.get_event_loop().create_task(monitor_loop_lag()))
+
+    @app.on_event("shutdown")
+    async def stop_monitor() -> None:
+        for task in lag:
+            task.cancel()
+
+    @app.get("/metrics")
+    async def metrics() -> Response:
+        """queue, worker and log pipeline metrics for Prometheus"""
+        if queue is not None:
+            # jobs added by other processes
+            queue.refresh()
+        return Response(
+            REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    return app
+
+
+def add_log_routes(app: FastAPI, read_streamer: BaseReadStreamer) -> None:
+    """log tracking API for viewers"""
+
     def get_filehandler() -> Optional[QueueFileHandler]:
         if isinstance(read_streamer, LocalReadStreamer):
             filehandler = read_streamer._file
@@ -252,6 +756,94 @@ def create_app(read_streamer: BaseReadStreamer) -> FastAPI:
         if file_handler and body.ids:
             await asyncio.gather(*[file_handler.delete(id) for id in body.ids])
 
+    @app.get("/log-trace/search", response_model=List[SearchHit])
+    async def log_tracker_search(
+        q: str = Query(..., min_length=1),
+        ignore_case: bool = False,
+        limit: int = Query(100, ge=1),
+        file_handler: Optional[QueueFileHandler] = Depends(get_filehandler),
+    ) -> List[SearchHit]:
+        """lines of saved logs containing q, the newest job first"""
+        if not file_handler:
+            raise HTTPException(status_code=404, detail="log not found")
+        await file_handler.flush()
+        loop = asyncio.get_event_loop()
+        logdir = Path(file_handler.logdir)
+        return await loop.run_in_executor(None, search, logdir, q, ignore_case, limit)
+
+    @app.get("/log-trace/{id}/stream")
+    async def log_tracker_stream(
+        id: str,
+        request: Request,
+        tail: Optional[int] = Query(None, ge=0),
+        start: Optional[int] = Query(None, alias="from", ge=0),
+        offset: int = Query(0, ge=0),
+    ) -> StreamingResponse:
+        """same log as /log-trace, over plain HTTP for proxies and curl.
+        with "Accept: text/event-stream", log is sent as Server-Sent Events,
+        resumed from Last-Event-ID. otherwise, as chunked plain text
+        """
+        sse = "text/event-stream" in request.headers.get("accept", "")
+        last_event_id = request.headers.get("last-event-id", "")
+        if sse and last_event_id.isdigit():
+            offset = int(last_event_id)
+        key = f"http-{uuid.uuid4().hex}"
+        events = stream_log(read_streamer, id, key, start, tail, offset, sse)
+        if sse:
+            headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            return StreamingResponse(
+                events, media_type="text/event-stream", headers=headers
+            )
+        return StreamingResponse(events, media_type="text/plain; charset=utf-8")
+
+    @app.get("/log-trace/{id}")
+    async def log_tracker_download(
+        id: str,
+        request: Request,
+        file_handler: Optional[QueueFileHandler] = Depends(get_filehandler),
+    ) -> Response:
+        """saved log as plain text. single byte range (Range header) is supported"""
+        if not file_handler or not file_handler.exists(id):
+            raise HTTPException(status_code=404, detail="log not found")
+        await file_handler.flush()
+        media_type = "text/plain; charset=utf-8"
+        headers = {"Accept-Ranges": "bytes"}
+
+        header = request.headers.get("range")
+        if header:
+            size = await file_handler.get_size(id) or 0
+            try:
+                _range = byte_range(header, size)
+            except ValueError:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+            if _range:
+                first, last = _range
+                headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+                headers["Content-Length"] = str(last - first + 1)
+                body = file_handler.iter_bytes(id, first, last)
+                return StreamingResponse(
+                    body, status_code=206, headers=headers, media_type=media_type
+                )
+        body = file_handler.iter_bytes(id)
+        return StreamingResponse(body, headers=headers, media_type=media_type)
+
+    @app.websocket("/log-trace/multiplex")
+    async def log_tracker_multiplex(ws: WebSocket) -> None:
+        """logs of many jobs over one websocket. see MultiplexReadStreamer"""
+        await ws.accept()
+        key = ws.headers.get("sec-websocket-key")
+        multiplex = MultiplexReadStreamer(key, read_streamer, ws)
+        WEBSOCKET_CLIENTS.inc(route="/log-trace/multiplex")
+        try:
+            while True:
+                await multiplex.receive(await ws.receive_json())
+        except (Exception, WebSocketDisconnect):
+            await multiplex.close()
+            await ws.close()
+        finally:
+            WEBSOCKET_CLIENTS.dec(route="/log-trace/multiplex")
+
     @app.websocket("/log-trace")
     async def log_tracker(
         ws: WebSocket,
@@ -259,22 +851,102 @@ def create_app(read_streamer: BaseReadStreamer) -> FastAPI:
     ) -> None:
         loop = asyncio.get_event_loop()
         task = loop.create_task(streamer.streaming())
+        WEBSOCKET_CLIENTS.inc(route="/log-trace")
 
         try:
             while True:
                 await ws.receive()
         except (Exception, WebSocketDisconnect):
+            await ws.close()
+        finally:
+            WEBSOCKET_CLIENTS.dec(route="/log-trace")
             streamer.manual_exit()
             task.cancel()
-            await ws.close()
 
-    return app
+
+def add_push_routes(app: FastAPI, log_streamer: TrackerLogStreamer) -> None:
+    """log tracker API for runners pushing logs (see PushHandler)"""
+
+    @app.websocket("/log-push")
+    async def log_push(ws: WebSocket) -> None:
+        """batches of [LogModel]"""
+        await ws.accept()
+        WEBSOCKET_CLIENTS.inc(route="/log-push")
+        try:
+            while True:
+                data = json.loads(await ws.receive_text())
+                await log_streamer.push(parse_obj_as(List[LogModel], data))
+        except WebSocketDisconnect:
+            pass
+        except json.JSONDecodeError:
+            await ws.close(code=status.WS_1007_INVALID_FRAME_PAYLOAD_DATA)
+        except ValidationError:
+            # runner of another version
+            await ws.close(code=status.WS_1003_UNSUPPORTED_DATA)
+        except asyncio.CancelledError:
+            # subclass of Exception in Python 3.7
+            raise
+        except Exception:
+            logger.exception("failed to receive logs pushed from runner")
+            await ws.close(code=status.WS_1011_INTERNAL_ERROR)
+        finally:
+            WEBSOCKET_CLIENTS.dec(route="/log-push")
+
+
+def add_queue_routes(app: FastAPI, leases: LeaseManager) -> None:
+    """HTTP API for pull-based remote workers"""
+
+    @app.post("/queue/lease")
+    async def queue_lease(body: LeaseRequest) -> Optional[BaseQueueModel]:
+        return leases.lease(body.worker)
+
+    @app.post("/queue/heartbeat")
+    async def queue_heartbeat(body: HeartbeatRequest) -> None:
+        if not leases.heartbeat(body.id, body.worker):
+            raise HTTPException(status_code=404, detail="lease not found")
+
+    @app.post("/queue/complete")
+    async def queue_complete(body: CompleteRequest) -> None:
+        if not leases.complete(body.id, body.worker, body.status):
+            raise HTTPException(status_code=404, detail="lease not found")
+
+    @app.get("/queue/dep/{id}")
+    async def queue_dependency(id: str) -> Response:
+        def read_archive() -> Optional[bytes]:
+            with tempfile.TemporaryDirectory() as tempdir:
+                archive = leases.archive(id, Path(tempdir))
+                return archive.read_bytes() if archive else None
+
+        loop = asyncio.get_event_loop()
+        content = await loop.run_in_executor(None, read_archive)
+        if content is None:
+            raise HTTPException(status_code=404, detail="dependency not found")
+        return Response(content, media_type="application/zip")
+
+
+class LogWebSocketProtocol(WebSocketProtocol):  # type: ignore
+    """websocket protocol of uvicorn, compressing log with permessage-deflate.
+    log is repetitive text, so compression context is kept across frames
+    with the largest window
+    """
+
+    compress_settings: Dict[str, Any] = {"memLevel": 9}
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.available_extensions = [
+            ServerPerMessageDeflateFactory(
+                server_max_window_bits=15, compress_settings=self.compress_settings
+            )
+        ]
 
 
 def run_receiver(
     app: FastAPI,
     event_loop: asyncio.AbstractEventLoop,
     handlers: List[Callable[[signal.Signals, Optional[FrameType]], None]],
+    host: str = "127.0.0.1",
+    port: int = 8000,
 ) -> Server:
     """
     NOTE: Uvicorn override signal handler for eventloop in the case of "ctrl-c" and "kill pid".
@@ -288,7 +960,67 @@ def run_receiver(
             for handler in handlers:
                 handler(sig, frame)
 
-    config = Config(app=app, loop=event_loop, log_level=logging.ERROR)
+    # server is served in event_loop of the caller (see Server.serve).
+    # Config.loop only sets up a new one in Server.run, and is not given
+    config = Config(
+        app=app,
+        host=host,
+        port=port,
+        ws=LogWebSocketProtocol,
+        log_level=logging.ERROR,
+    )
 
     server = SubServer(config)
     return server
+
+
+def run_tracker(
+    event_loop: asyncio.AbstractEventLoop,
+    logdir: str,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    conn: Optional[Connection] = None,
+) -> None:
+    """log tracker serving logs pushed from runners over websocket,
+    or from the parent runner process through pipe (conn)
+    """
+    log_streamer = TrackerLogStreamer([QueueFileHandler(logdir), QueueHandler()])
+    app = create_app(LocalReadStreamer(log_streamer))
+    add_push_routes(app, log_streamer)
+    server = run_receiver(
+        app, event_loop, [log_streamer.handle_exit], host=host, port=port
+    )
+
+    async def pull(conn: Connection) -> None:
+        await log_streamer.pull(conn)
+        # parent runner exited. save logs pulled before it
+        await log_streamer.drain()
+        server.should_exit = True
+
+    event_loop.create_task(log_streamer.entry_point())
+    if conn:
+        event_loop.create_task(pull(conn))
+    try:
+        event_loop.run_until_complete(server.serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # child process of runner exits without atexit
+        LOG_WRITER.shutdown()
+
+
+def tracker_process(
+    logdir: str,
+    host: str,
+    port: int,
+    conn: Connection,
+    limits: Optional[Dict[str, int]] = None,
+) -> None:
+    """entry point of log tracker in child process of runner.
+    limits are set to log writer (see LogWriter)
+    """
+    for name, value in (limits if limits else {}).items():
+        setattr(LOG_WRITER, name, value)
+    event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(event_loop)
+    run_tracker(event_loop, logdir, host, port, conn)
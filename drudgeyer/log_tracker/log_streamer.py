@@ -1,15 +1,52 @@
 import asyncio
-import logging
+import bisect
+import json
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
 from asyncio.queues import Queue
+from collections import deque
 from enum import Enum
+from multiprocessing.connection import Connection
 from pathlib import Path
-from queue import SimpleQueue
 from signal import Signals
 from types import FrameType
-from typing import Dict, List, Optional, Type
-
-from drudgeyer.worker.logger import LogModel, StreamingLogger
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+
+import websockets
+from pydantic import parse_raw_as
+
+from drudgeyer.log_tracker.record import (
+    HEADER,
+    LogRecord,
+    RecordReader,
+    count_records,
+    encode_lines,
+    truncation_marker,
+)
+from drudgeyer.log_tracker.search import TrigramIndex
+from drudgeyer.metrics import LOG_DROPPED
+from drudgeyer.worker.logger import (
+    LOG_WRITER,
+    PROGRESS,
+    LogModel,
+    LogWriter,
+    StreamingLogger,
+    log_segments,
+    read_log_from,
+)
 
 
 class BaseHandler(ABC):
@@ -29,6 +66,83 @@ class BaseHandler(ABC):
     async def delete(self, id: str) -> None:
         ...  # pragma: no cover
 
+    async def close(self, id: str) -> None:
+        """called when the job's stream ends"""
+
+    # "\r" progress updates are collapsed into the latest one per interval [sec]
+    # (None: all updates are sent)
+    progress_interval: Optional[float] = None
+
+
+class ProgressCollapser:
+    """Keep only the latest "\r"-terminated progress update per interval.
+    Progress overwritten by following output in the same interval is dropped,
+    and the pending one is emitted when the interval elapses.
+    """
+
+    def __init__(self, interval: float, emit: Callable[[LogModel], None]) -> None:
+        self.interval = interval
+        self._emit = emit
+        self._pending: Dict[str, LogModel] = {}
+        self._sent: Dict[str, float] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # number of dropped progress updates
+        self.collapsed = 0
+
+    def collapse(self, log: LogModel) -> Optional[LogModel]:
+        """log to send now, without progress held until the interval elapses"""
+        text = log.log
+        pending = self._pending.pop(log.id, None)
+        if pending is not None:
+            if text.startswith("\n"):
+                # "\r\n" is not progress
+                text = pending.log + text
+            else:
+                self.collapsed += 1
+
+        text, n = PROGRESS.subn("", text)
+        self.collapsed += n
+        if text.endswith("\r"):
+            start = max(text.rfind("\n", 0, -1), text.rfind("\r", 0, -1)) + 1
+            text, progress = text[:start], text[start:]
+            loop = asyncio.get_event_loop()
+            sent = self._sent.get(log.id)
+            if sent is None or loop.time() - sent >= self.interval:
+                text += progress
+                self._sent[log.id] = loop.time()
+            else:
+                self._pending[log.id] = LogModel(id=log.id, log=progress, seq=log.seq)
+                if log.id not in self._timers:
+                    self._timers[log.id] = loop.call_at(
+                        sent + self.interval, self.flush, log.id
+                    )
+
+        if not text:
+            return None
+        return LogModel(id=log.id, log=text, seq=log.seq)
+
+    def flush(self, id: str) -> None:
+        """emit pending progress"""
+        timer = self._timers.pop(id, None)
+        if timer:
+            timer.cancel()
+        pending = self._pending.pop(id, None)
+        if pending is not None:
+            self._sent[id] = asyncio.get_event_loop().time()
+            self._emit(pending)
+
+    def close(self, id: str) -> None:
+        """emit the last progress, and forget the job"""
+        self.flush(id)
+        self._sent.pop(id, None)
+
+    def discard(self, id: str) -> None:
+        timer = self._timers.pop(id, None)
+        if timer:
+            timer.cancel()
+        self._pending.pop(id, None)
+        self._sent.pop(id, None)
+
 
 class BaseLogStreamer(ABC):
     """streaming log data from worker into handlers"""
@@ -37,6 +151,26 @@ class BaseLogStreamer(ABC):
         self._handlers = handlers
         self.should_exit = False
         self.force_exit = False
+        # the last sequence number of streamed log, and of each job
+        self._seq = 0
+        self._seqs: Dict[str, int] = {}
+        # collapsing stage for each handler
+        self._collapsers: Dict[int, ProgressCollapser] = {}
+        for handler in handlers:
+            if handler.progress_interval is not None:
+                self._collapsers[id(handler)] = ProgressCollapser(
+                    handler.progress_interval, self._emitter(handler)
+                )
+
+    def _emitter(self, handler: BaseHandler) -> Callable[[LogModel], None]:
+        def emit(log: LogModel) -> None:
+            # held progress follows log already sent, so that it is not skipped
+            # as sent before by readers resuming after sequence number
+            log.seq = self._next_seq(self._seqs.get(log.id, 0))
+            self._seqs[log.id] = log.seq
+            asyncio.ensure_future(handler.send(log))
+
+        return emit
 
     @abstractmethod
     async def recv(self) -> LogModel:
@@ -53,10 +187,33 @@ class BaseLogStreamer(ABC):
         log = await self.recv()
         self.send(log)
 
+    def _next_seq(self, after: int = 0) -> int:
+        # based on clock, so that it increases across restarts without saving it
+        self._seq = max(self._seq + 1, after + 1, time.time_ns() // 1000)
+        return self._seq
+
     def send(self, log: LogModel) -> None:
-        asyncio.ensure_future(
-            asyncio.gather(*[handler.send(log) for handler in self._handlers])
-        )
+        last = self._seqs.get(log.id, 0)
+        if log.seq <= last:
+            # not numbered yet, or numbered before progress emitted (see _emitter)
+            log.seq = self._next_seq(last)
+        self._seqs[log.id] = log.seq
+        if log.end:
+            for collapser in self._collapsers.values():
+                collapser.close(log.id)
+            self._seqs.pop(log.id, None)
+            asyncio.ensure_future(
+                asyncio.gather(*[handler.close(log.id) for handler in self._handlers])
+            )
+            return
+
+        sends = []
+        for handler in self._handlers:
+            stage = self._collapsers.get(id(handler))
+            _log = stage.collapse(log) if stage else log
+            if _log:
+                sends.append(handler.send(_log))
+        asyncio.ensure_future(asyncio.gather(*sends))
 
     def add(self, id: str) -> None:
         asyncio.ensure_future(
@@ -64,6 +221,9 @@ class BaseLogStreamer(ABC):
         )
 
     def delete(self, id: str) -> None:
+        for collapser in self._collapsers.values():
+            collapser.discard(id)
+        self._seqs.pop(id, None)
         asyncio.ensure_future(
             asyncio.gather(*[handler.delete(id) for handler in self._handlers])
         )
@@ -79,10 +239,8 @@ class LocalLogStreamer(BaseLogStreamer):
     """streaming log data from worker into handlers"""
 
     def __init__(self, handlers: List[BaseHandler], logger: StreamingLogger) -> None:
-        self._handlers = handlers
+        super().__init__(handlers)
         self._logger = logger
-        self.should_exit = False
-        self.force_exit = False
 
     async def entry_point(self) -> None:
         # call add method directly if you want to add new handler
@@ -97,122 +255,597 @@ class LocalLogStreamer(BaseLogStreamer):
         return log
 
 
+class BasePushHandler(BaseHandler):
+    """push log streaming data to log tracker (see TrackerLogStreamer).
+    logs are batched up to max_batch chars for latency [sec], and held up to
+    maxsize logs while the tracker is unreachable, dropping the oldest
+    """
+
+    progress_interval: Optional[float] = 0.1
+
+    def __init__(
+        self, maxsize: int = 10000, max_batch: int = 2 ** 16, latency: float = 0.05
+    ) -> None:
+        self.maxsize = maxsize
+        self.max_batch = max_batch
+        self.latency = latency
+        self._buffer: Deque[LogModel] = deque()
+        self._readable: Optional[asyncio.Event] = None
+        # number of logs dropped while disconnected
+        self.dropped = 0
+
+    @abstractmethod
+    async def entry_point(self) -> None:
+        ...  # pragma: no cover
+
+    async def send(self, log: LogModel) -> None:
+        self._put(log)
+
+    async def add(self, id: str) -> None:
+        pass
+
+    async def delete(self, id: str) -> None:
+        pass
+
+    async def close(self, id: str) -> None:
+        # tracker closes the job's log too
+        self._put(LogModel(id=id, log="", end=True))
+
+    def _put(self, log: LogModel) -> None:
+        if len(self._buffer) >= self.maxsize:
+            self._drop()
+        self._buffer.append(log)
+        if self._readable:
+            self._readable.set()
+
+    def _drop(self) -> None:
+        """drop the oldest log. end of job is kept, so that tracker closes the log.
+        buffer of only ends exceeds maxsize
+        """
+        for idx, log in enumerate(self._buffer):
+            if not log.end:
+                del self._buffer[idx]
+                self.dropped += 1
+                LOG_DROPPED.inc()
+                return
+
+    async def push(self, ws: Any) -> None:
+        """send batches of log as JSON to ws (with async send method) until it fails"""
+        if self._readable is None:
+            # bound to the running event loop
+            self._readable = asyncio.Event()
+        while True:
+            while not self._buffer:
+                self._readable.clear()
+                await self._readable.wait()
+            await asyncio.sleep(self.latency)
+            batch = self._batch()
+            try:
+                await ws.send(json.dumps([log.dict() for log in batch]))
+            except BaseException:
+                # sent again after reconnecting
+                self._buffer.extendleft(reversed(batch))
+                raise
+
+    def _batch(self) -> List[LogModel]:
+        batch: List[LogModel] = []
+        size = 0
+        while self._buffer and size < self.max_batch:
+            log = self._buffer.popleft()
+            batch.append(log)
+            size += len(log.log)
+        return batch
+
+
+class PushHandler(BasePushHandler):
+    """push log streaming data to log tracker at url over websocket"""
+
+    def __init__(self, url: str, *args: Any, retry: float = 1, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.url = f"ws://{url}/log-push"
+        self.retry = retry
+
+    async def entry_point(self) -> None:
+        try:
+            while True:
+                try:
+                    async with websockets.connect(
+                        self.url, compression="deflate"
+                    ) as ws:
+                        await self.push(ws)
+                except (OSError, websockets.WebSocketException):
+                    await asyncio.sleep(self.retry)
+        except asyncio.CancelledError:
+            return
+
+
+class PipeWriter:
+    """async writer of pipe, written in thread pool not to block event loop"""
+
+    def __init__(self, conn: Connection, lock: Optional[threading.Lock] = None) -> None:
+        self._conn = conn
+        self._lock = lock if lock else threading.Lock()
+
+    async def send(self, data: str) -> None:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.send_sync, data)
+
+    def send_sync(self, data: str) -> None:
+        # a message is not interleaved with others
+        with self._lock:
+            self._conn.send_bytes(data.encode("utf-8"))
+
+
+class PipeHandler(BasePushHandler):
+    """push log streaming data to log tracker in child process through pipe"""
+
+    def __init__(self, conn: Connection, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._conn = conn
+        self._writer = PipeWriter(conn)
+
+    async def entry_point(self) -> None:
+        try:
+            await self.push(self._writer)
+        except (OSError, asyncio.CancelledError):
+            # tracker process exited
+            return
+
+    def shutdown(self) -> None:
+        """send logs left in buffer and close pipe, so that tracker exits.
+        called after event loop is stopped
+        """
+        try:
+            while self._buffer:
+                self._writer.send_sync(
+                    json.dumps([log.dict() for log in self._batch()])
+                )
+        except OSError:
+            # tracker process exited
+            pass
+        finally:
+            self._conn.close()
+
+
+class RemoteLogStreamer(LocalLogStreamer):
+    """streaming log data from worker to log tracker, and into handlers"""
+
+    def __init__(
+        self,
+        logger: StreamingLogger,
+        pusher: BasePushHandler,
+        handlers: Optional[List[BaseHandler]] = None,
+    ) -> None:
+        self.pusher = pusher
+        _handlers: List[BaseHandler] = [pusher]
+        super().__init__(_handlers + (handlers if handlers else []), logger)
+
+    async def entry_point(self) -> None:
+        loop = asyncio.get_event_loop()
+        task = loop.create_task(self.pusher.entry_point())
+        try:
+            await super().entry_point()
+        finally:
+            task.cancel()
+
+
+class TrackerLogStreamer(BaseLogStreamer):
+    """streaming log data pushed from runners (see PushHandler) into handlers.
+    log already received is skipped, when runner sends it again after reconnecting
+    """
+
+    def __init__(self, handlers: List[BaseHandler], maxsize: int = 10000) -> None:
+        super().__init__(handlers)
+        # bounded, so that runners pushing faster than handlers wait
+        self._queue: Queue[LogModel] = Queue(maxsize)
+        # sequence number of the last log received for each job
+        self._received: Dict[str, int] = {}
+
+    async def push(self, logs: List[LogModel]) -> None:
+        for log in logs:
+            await self._queue.put(log)
+
+    async def pull(self, conn: Connection) -> None:
+        """push logs from pipe (see PipeHandler) until it is closed"""
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, conn.recv_bytes)
+                await self.push(parse_raw_as(List[LogModel], data))
+        except (EOFError, OSError):
+            return
+
+    async def drain(self, interval: float = 0.01) -> None:
+        """wait until logs pushed are sent to handlers"""
+        while not self._queue.empty() and not self.should_exit:
+            await asyncio.sleep(interval)
+        # handlers are sent in tasks (see send)
+        await asyncio.sleep(interval)
+
+    async def entry_point(self) -> None:
+        try:
+            while not self.should_exit:
+                await self.streaming()
+        except (asyncio.CancelledError, RuntimeError):
+            return
+
+    async def recv(self) -> LogModel:
+        while True:
+            log = await self._queue.get()
+            if log.end:
+                self._received.pop(log.id, None)
+                return log
+            if log.seq and log.seq <= self._received.get(log.id, 0):
+                continue
+            self._received[log.id] = log.seq
+            return log
+
+
 class LogStreamers(Enum):
     local = "local"
+    remote = "remote"
 
 
 LOGSTREAMER_CLASSES: Dict[LogStreamers, Type[BaseLogStreamer]] = {
     LogStreamers.local: LocalLogStreamer,
+    LogStreamers.remote: RemoteLogStreamer,
 }
 
 
-class LocalQueueHandler(logging.handlers.QueueHandler):
-    def emit(self, record: logging.LogRecord) -> None:
-        try:
-            self.enqueue(record)
-        except asyncio.CancelledError:
-            raise
-        except Exception:
-            self.handleError(record)
+class LogIndex:
+    """sparse line/byte offset index of log saved by QueueFileHandler.
+    "<line> <offset> <seq> <text>" is appended to "<id>.idx" every `every` lines
+    at least, so that reading from line K, the last N lines, after sequence number
+    or from byte K of the log text does not scan the whole log.
+    NOTE: each line is saved as a record (see record.py)
+    """
+
+    def __init__(self, path: Path, writer: LogWriter, every: int = 1000) -> None:
+        self.path = path
+        self.index_path = path.with_name(f"{path.name}.idx")
+        self.every = every
+        self._writer = writer
+        # lines, bytes and bytes of text (without record headers) saved so far,
+        # and line of the last entry. text is None if the index has old entries
+        self.lines = 0
+        self.size = 0
+        self.text: Optional[int] = 0
+        self._indexed = 0
+
+    def append(self, data: bytes, lines: int, seq: int = 0) -> None:
+        if self.lines - self._indexed >= self.every:
+            row = f"{self.lines} {self.size} {seq}"
+            if self.text is not None:
+                row += f" {self.text}"
+            self._writer.write(self.index_path, row + "\n")
+            self._indexed = self.lines
+        self.lines += lines
+        self.size += len(data)
+        if self.text is not None:
+            self.text += len(data) - lines * HEADER.size
+
+    def load(self) -> None:
+        """restore counters from the index and the log already saved"""
+        row = self._rows()[-1]
+        self._indexed, offset = row[:2]
+        data = self._read(offset)
+        lines, size = count_records(data)
+        self.lines = self._indexed + lines
+        self.size = offset + size
+        # entries written before text was indexed
+        self.text = row[3] + size - lines * HEADER.size if len(row) == 4 else None
+
+    def entries(self) -> List[Tuple[int, int, int]]:
+        """line, byte offset and sequence number"""
+        return [(row[0], row[1], row[2]) for row in self._rows()]
+
+    def text_entries(self) -> List[Tuple[int, int]]:
+        """bytes of text before entry, and byte offset"""
+        return [(row[3], row[1]) for row in self._rows() if len(row) == 4]
+
+    def _rows(self) -> List[List[int]]:
+        rows = [[0, 0, 0, 0]]
+        if self.index_path.is_file():
+            with self.index_path.open() as f:
+                for row in f:
+                    cols = row.split()
+                    # the last row might be written partially
+                    if len(cols) in (3, 4) and row.endswith("\n"):
+                        rows.append(list(map(int, cols)))
+        return rows
+
+    def read(
+        self,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> List[LogRecord]:
+        """saved log from line `start`, the last `tail` lines,
+        or after sequence number `after`
+        """
+        return [
+            record
+            for records in self.iter_read(start, tail, after)
+            for record in records
+        ]
+
+    def iter_read(
+        self,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Generator[List[LogRecord], None, None]:
+        """same as read, but in chunks of records"""
+        entries = self.entries()
+        if after is not None:
+            seqs = [seq for _, _, seq in entries]
+            _, offset, _ = entries[bisect.bisect_right(seqs, after) - 1]
+            for records in self._iter(offset):
+                records = [record for record in records if record.seq > after]
+                if records:
+                    yield records
+            return
+
+        if tail is not None:
+            # count lines after the last entry only
+            last, offset, _ = entries[-1]
+            lines = last + sum(len(records) for records in self._iter(offset))
+            start = max(lines - tail, 0)
+        start = start if start else 0
+        i = bisect.bisect_right(entries, (start, sys.maxsize, sys.maxsize)) - 1
+        line, offset, _ = entries[i]
+        skip = start - line
+        for records in self._iter(offset):
+            if skip >= len(records):
+                skip -= len(records)
+                continue
+            yield records[skip:]
+            skip = 0
+
+    def iter_text(
+        self, first: int
+    ) -> Tuple[int, Generator[List[LogRecord], None, None]]:
+        """records from the last entry at byte `first` of the text or before,
+        and bytes of text before them
+        """
+        entries = self.text_entries()
+        text, offset = entries[bisect.bisect_right(entries, (first, sys.maxsize)) - 1]
+        return text, self._iter(offset)
+
+    def _read(self, offset: int) -> bytes:
+        return b"".join(read_log_from(self.path, offset, marker=truncation_marker))
+
+    def _iter(self, offset: int) -> Generator[List[LogRecord], None, None]:
+        reader = RecordReader()
+        for chunk in read_log_from(self.path, offset, marker=truncation_marker):
+            records = reader.feed(chunk)
+            if records:
+                yield records
 
 
 class QueueFileHandler(BaseHandler):
     """save log streaming data in file from sub class of BaseLogStreamer"""
 
-    def __init__(self, logdir: str = "log") -> None:
+    progress_interval: Optional[float] = 1
+
+    def __init__(self, logdir: str = "log", writer: Optional[LogWriter] = None) -> None:
         self.logdir = logdir
         _logdir = Path(logdir)
         if not _logdir.is_dir():
             _logdir.mkdir(parents=True, exist_ok=True)
 
-        self.loggers: Dict[str, logging.Logger] = {}
+        self._writer = writer if writer else LOG_WRITER
+        self.paths: Dict[str, Path] = {}
+        self.indexes: Dict[str, LogIndex] = {}
+        # adding logs, awaited by following sends and close of the same job
+        self._adding: Dict[str, "asyncio.Future[None]"] = {}
 
     async def send(self, log: LogModel) -> None:
-        logger = self.loggers.get(log.id)
-        if not logger:
+        path = self.paths.get(log.id)
+        if not path:
             await self.add(log.id)
-            logger = self.loggers.get(log.id)
+            path = self.paths.get(log.id)
 
-        if logger:
-            # TODO: automatically store raw escape characters
-            msg = log.log.replace("\n", "\\n").replace("\r", "\\r")
-            logger.info(msg)
+        if path:
+            # saved as is, without escaping
+            data, lines = encode_lines(log.log, seq=log.seq)
+            self.indexes[log.id].append(data, lines, log.seq)
+            self._writer.write(path, data)
 
     async def add(self, id: str) -> None:
-        if self.loggers.get(id):
+        if self.paths.get(id):
             return
-
-        self.set_handler(id, logdir=self.logdir)
-        self._setup_logging_queue(id)
-        self.loggers[id] = logging.getLogger(id)
+        adding = self._adding.get(id)
+        if adding is None:
+            adding = asyncio.ensure_future(self._add(id))
+            self._adding[id] = adding
+            adding.add_done_callback(lambda _: self._adding.pop(id, None))
+        # not cancelled by one of the callers
+        await asyncio.shield(adding)
+
+    async def _add(self, id: str) -> None:
+        path = Path(self.logdir)
+        path.mkdir(exist_ok=True)
+        path = path / id
+        index = LogIndex(path, self._writer)
+        if path.is_file() and path.stat().st_size or len(log_segments(path)) > 1:
+            # appended to the log of previous run
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, index.load)
+        path.touch(exist_ok=True)
+        # trigrams for search, caught up by indexer thread
+        self._writer.observe(path, TrigramIndex(path).update)
+        self.paths[id] = path
+        self.indexes[id] = index
+
+    async def close(self, id: str) -> None:
+        adding = self._adding.get(id)
+        if adding is not None:
+            # registered before closed
+            await asyncio.wait([adding])
+        path = self.paths.pop(id, None)
+        index = self.indexes.pop(id, None)
+        if path:
+            self._writer.close(path)
+        if index:
+            self._writer.close(index.index_path)
+
+    async def flush(self) -> None:
+        """wait until log sent so far is saved"""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._writer.flush)
 
     async def delete(self, id: str) -> None:
-        try:
-            del self.loggers[id]
-        except KeyError:
-            pass
-
         path = Path(self.logdir) / id
-        if path.is_file():
-            path.unlink()
-
-    async def get_record(self, id: str) -> Optional[str]:
+        if self.paths.get(id) or id in self._adding:
+            await self.close(id)
+        # segments being compressed are replaced
+        await self.flush()
+
+        for segment in log_segments(path):
+            segment.unlink()
+        for index_path in (
+            LogIndex(path, self._writer).index_path,
+            TrigramIndex(path).index_path,
+        ):
+            if index_path.is_file():
+                index_path.unlink()
+
+    def exists(self, id: str) -> bool:
+        return bool(log_segments(Path(self.logdir) / id))
+
+    async def get_record(
+        self, id: str, start: Optional[int] = None, tail: Optional[int] = None
+    ) -> Optional[str]:
+        """whole log, or log from line `start` or the last `tail` lines"""
+        records = await self.get_records(id, start, tail)
+        if records is None:
+            return None
+        return "".join(record.text for record in records) + "\n"
+
+    async def get_records(
+        self,
+        id: str,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> Optional[List[LogRecord]]:
+        """saved records. see LogIndex.read"""
+        if not self.exists(id):
+            return None
+        return [
+            record
+            async for records in self.iter_records(id, start, tail, after)
+            for record in records
+        ]
+
+    async def iter_records(
+        self,
+        id: str,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        after: Optional[int] = None,
+    ) -> AsyncGenerator[List[LogRecord], None]:
+        """saved records in chunks, read in thread pool one by one"""
+        if not self.exists(id):
+            return
         path = Path(self.logdir) / id
-        if path.is_file():
-            with path.open() as f:
-                record = f.read()
-            # TODO: automatically load raw escape characters
-            data = record.replace("\\n", "\n").replace("\\r", "\r") + "\n"
-            return data
-        return None
-
-    def set_handler(self, id: str, logdir: str = "log") -> None:
-        logger = logging.getLogger(id)
-        logger.setLevel(logging.INFO)
-
-        path = Path(logdir)
-        path.mkdir(exist_ok=True)
-        path = path / id
-        path.touch(exist_ok=False)
-        handler = logging.FileHandler(
-            path.resolve(),
-            encoding="utf-8",
-        )
-        handler.setLevel(logging.INFO)
-        handler.terminator = ""
-        formatter = logging.Formatter("%(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-
-    def _setup_logging_queue(self, id: str) -> None:
-        """Move log handlers to a separate thread"""
-        handlers: List[logging.Handler] = []
-        queue: SimpleQueue[logging.LogRecord] = SimpleQueue()
-        handler = LocalQueueHandler(queue)
-
-        logger = logging.getLogger(id)
-        logger.addHandler(handler)
-        for h in logger.handlers[:]:
-            if h is not handler:
-                logger.removeHandler(h)
-                handlers.append(h)
-
-        listener = logging.handlers.QueueListener(
-            queue, *handlers, respect_handler_level=True
-        )
-        listener.start()
+        chunks = LogIndex(path, self._writer).iter_read(start, tail, after)
+        async for records in self._iter_chunks(chunks):
+            yield records
+
+    async def _iter_chunks(
+        self, chunks: Generator[List[LogRecord], None, None]
+    ) -> AsyncGenerator[List[LogRecord], None]:
+        """read chunks in thread pool one by one"""
+        # generator is not closed while it is reading in thread pool
+        lock = threading.Lock()
+
+        def read() -> Optional[List[LogRecord]]:
+            with lock:
+                return next(chunks, None)
+
+        def close() -> None:
+            with lock:
+                chunks.close()
+
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                records = await loop.run_in_executor(None, read)
+                if records is None:
+                    return
+                yield records
+        finally:
+            # chunk may be still read after cancelled
+            loop.run_in_executor(None, close)
+
+    async def _text_index(self, id: str) -> Optional[LogIndex]:
+        """index with bytes of text of saved log (see flush for the log being sent).
+        None if the log is truncated, or the index has old entries
+        """
+        path = Path(self.logdir) / id
+        if any(segment.suffix == ".gap" for segment in log_segments(path)):
+            # truncated text is replaced with marker
+            return None
+        index = self.indexes.get(id)
+        if index is None:
+            index = LogIndex(path, self._writer)
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, index.load)
+        return index if index.text is not None else None
+
+    async def get_size(self, id: str) -> Optional[int]:
+        """bytes of saved log, without record headers"""
+        if not self.exists(id):
+            return None
+        index = await self._text_index(id)
+        if index is not None:
+            return index.text
+        size = 0
+        async for records in self.iter_records(id):
+            size += sum(len(record.payload) for record in records)
+        return size
+
+    async def iter_bytes(
+        self, id: str, first: int = 0, last: Optional[int] = None
+    ) -> AsyncGenerator[bytes, None]:
+        """saved log from byte `first` to `last` (inclusive) in chunks"""
+        if not self.exists(id):
+            return
+        index = await self._text_index(id)
+        if index is not None:
+            # from the entry before the range
+            pos, text = index.iter_text(first)
+            chunks = self._iter_chunks(text)
+        else:
+            pos, chunks = 0, self.iter_records(id)
+        try:
+            async for records in chunks:
+                data = b"".join(record.payload for record in records)
+                begin, pos = pos, pos + len(data)
+                if pos <= first:
+                    continue
+                end = None if last is None else last + 1 - begin
+                yield data[max(first - begin, 0) : end]
+                if last is not None and pos > last:
+                    return
+        finally:
+            await chunks.aclose()
 
 
 class QueueHandler(BaseHandler):
     """queue log streaming data from sub class of BaseLogStreamer"""
 
+    progress_interval: Optional[float] = 0.1
+
     def __init__(self) -> None:
-        self._queues: Dict[str, Queue[str]] = {}
+        self._queues: Dict[str, Queue[LogModel]] = {}
 
     async def send(self, log: LogModel) -> None:
         _queue = self._queues.get(log.id)
         if _queue:
-            await _queue.put(log.log)
+            await _queue.put(log)
 
     async def add(self, id: str) -> None:
         if not self._queues.get(id):
@@ -0,0 +1,120 @@
+import re
+import struct
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# framed binary record of saved log:
+# payload length (uint32), timestamp (float64, unix time), stream (uint8),
+# sequence number of streamed log (uint64), payload
+HEADER = struct.Struct("<IdBQ")
+
+# offset (sequence number) prefixed to log in binary websocket frame
+FRAME_OFFSET = struct.Struct("<Q")
+
+# line terminated by "\n", "\r\n" or "\r", or unterminated at the end.
+# unlike str.splitlines, other separators (ex. "\x0c", "\u2028") are in line
+LINE = re.compile(r"[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+")
+
+
+class Stream(IntEnum):
+    stdout = 1
+    stderr = 2
+
+
+@dataclass
+class LogRecord:
+    payload: bytes
+    timestamp: float = field(default_factory=time.time)
+    stream: Stream = Stream.stdout
+    seq: int = 0
+
+    @property
+    def text(self) -> str:
+        return self.payload.decode("utf-8", errors="replace")
+
+    def encode(self) -> bytes:
+        header = HEADER.pack(len(self.payload), self.timestamp, self.stream, self.seq)
+        return header + self.payload
+
+
+def encode_lines(
+    log: str,
+    timestamp: Optional[float] = None,
+    stream: Stream = Stream.stdout,
+    seq: int = 0,
+) -> Tuple[bytes, int]:
+    """frame each line of log ("\\n" or "\\r" terminated) into a record.
+    return framed bytes and the number of records
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    frames = []
+    for line in LINE.findall(log):
+        payload = line.encode("utf-8")
+        frames.append(HEADER.pack(len(payload), timestamp, stream, seq))
+        frames.append(payload)
+    return b"".join(frames), len(frames) // 2
+
+
+def truncation_marker(size: int) -> bytes:
+    """record in place of truncated log"""
+    return encode_lines(f"... {size} bytes truncated ...\n")[0]
+
+
+class RecordReader:
+    """streaming reader of records from chunks of bytes.
+    frame split into chunks is kept until the rest is fed
+    """
+
+    def __init__(self) -> None:
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> List[LogRecord]:
+        data = self._buffer + chunk if self._buffer else chunk
+        records = []
+        pos = 0
+        while pos + HEADER.size <= len(data):
+            length, timestamp, stream, seq = HEADER.unpack_from(data, pos)
+            end = pos + HEADER.size + length
+            if end > len(data):
+                break
+            payload = data[pos + HEADER.size : end]
+            records.append(LogRecord(payload, timestamp, Stream(stream), seq))
+            pos = end
+        self._buffer = data[pos:]
+        return records
+
+    @property
+    def pending(self) -> int:
+        """bytes of incomplete frame"""
+        return len(self._buffer)
+
+
+def read_records(chunks: Iterable[bytes]) -> Iterator[LogRecord]:
+    reader = RecordReader()
+    for chunk in chunks:
+        yield from reader.feed(chunk)
+
+
+def skip_records(data: bytes, count: int) -> int:
+    """byte offset after `count` records of data, or -1 if data has less records"""
+    pos = 0
+    for _ in range(count):
+        if pos + HEADER.size > len(data):
+            return -1
+        pos += HEADER.size + HEADER.unpack_from(data, pos)[0]
+    return pos if pos <= len(data) else -1
+
+
+def count_records(data: bytes) -> Tuple[int, int]:
+    """number of complete records in data, and bytes of them"""
+    count = pos = 0
+    while pos + HEADER.size <= len(data):
+        end = pos + HEADER.size + HEADER.unpack_from(data, pos)[0]
+        if end > len(data):
+            break
+        count += 1
+        pos = end
+    return count, pos
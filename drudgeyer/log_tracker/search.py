@@ -0,0 +1,290 @@
+import mmap
+import re
+import struct
+import threading
+import time
+from pathlib import Path
+from queue import Queue
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from drudgeyer.log_tracker.record import RecordReader, truncation_marker
+from drudgeyer.worker.logger import (
+    is_log,
+    log_segments,
+    log_size,
+    open_segment,
+    read_log_from,
+    segment_size,
+)
+
+# bits of trigram bitmap per job (32 KiB)
+BITS = 2 ** 18
+_SHIFT = 32 - 18
+# bytes of log indexed so far, followed by the bitmap
+INDEXED = struct.Struct("<Q")
+# trigrams are taken in words, so that repeated words are hashed once
+WORD = re.compile(rb"\w{3,}")
+# word (may be cut) at the end of chunk
+_TAIL = re.compile(rb"\w*\Z")
+
+
+class _Hashes(Dict[Tuple[int, int, int], int]):
+    """bit position of trigram, hashed at the first use.
+    trigrams are lowercase words (and separators), so that it is bounded
+    """
+
+    def __missing__(self, trigram: Tuple[int, int, int]) -> int:
+        a, b, c = trigram
+        bit = (((a << 16 | b << 8 | c) * 0x9E3779B1) & 0xFFFFFFFF) >> _SHIFT
+        self[trigram] = bit
+        return bit
+
+
+_HASHES = _Hashes()
+
+
+def trigrams(data: bytes) -> Set[int]:
+    """bit positions of hashed trigrams in words of lowercased data.
+    trigrams across words are included too (see pattern_trigrams)
+    """
+    words = b" ".join(set(WORD.findall(data.lower())))
+    return set(map(_HASHES.__getitem__, set(zip(words, words[1:], words[2:]))))
+
+
+def pattern_trigrams(pattern: bytes) -> Set[int]:
+    """bit positions of trigrams which log containing pattern must have"""
+    bits: Set[int] = set()
+    for word in WORD.findall(pattern.lower()):
+        bits.update(trigrams(word))
+    return bits
+
+
+class TrigramIndex:
+    """bitmap of trigrams in log saved by QueueFileHandler ("<id>.tri").
+    log without any trigram of a pattern cannot contain it, so that search reads
+    only the logs of candidates. the bitmap records how many bytes of log it
+    covers, and log not covered yet is always a candidate. it catches up with
+    the log in the indexer thread (see Indexer), off the log writer thread
+    """
+
+    def __init__(self, path: Path, every: int = 2 ** 20) -> None:
+        self.path = path
+        self.index_path = path.with_name(f"{path.name}.tri")
+        # bytes of log written before catching up
+        self.every = every
+        self._written = 0
+
+    @property
+    def size(self) -> int:
+        return INDEXED.size + BITS // 8
+
+    def indexed(self) -> Optional[int]:
+        """bytes of log covered by the bitmap. None if no valid bitmap"""
+        try:
+            with self.index_path.open("rb") as f:
+                if f.seek(0, 2) != self.size:
+                    return None
+                f.seek(0)
+                (indexed,) = INDEXED.unpack(f.read(INDEXED.size))
+        except OSError:
+            return None
+        return int(indexed)
+
+    def update(self, data: Optional[bytes]) -> None:
+        """observer of the log writer (see LogWriter.observe).
+        catch up every `every` bytes, and when log is closed (None)
+        """
+        if data is not None:
+            self._written += len(data)
+            if self._written < self.every:
+                return
+        self._written = 0
+        INDEXER.submit(self.path)
+
+    def catch_up(
+        self, chunksize: int = 2 ** 14, pause: Optional[Callable[[], None]] = None
+    ) -> None:
+        """index log saved after the bytes covered, in chunks"""
+        indexed = self.indexed()
+        if indexed is None:
+            if not log_segments(self.path):
+                return
+            indexed = 0
+            # readers see complete bitmap
+            temp = self.index_path.with_name(self.index_path.name + ".tmp")
+            temp.write_bytes(bytes(self.size))
+            temp.rename(self.index_path)
+
+        with self.index_path.open("r+b") as f:
+            bitmap = mmap.mmap(f.fileno(), self.size)
+        try:
+            for indexed, data in self._unindexed(indexed, chunksize):
+                for bit in trigrams(data):
+                    bitmap[INDEXED.size + (bit >> 3)] |= 1 << (bit & 7)
+                # bits are set before the log is counted as covered
+                INDEXED.pack_into(bitmap, 0, indexed)
+                if pause:
+                    pause()
+        finally:
+            bitmap.close()
+
+    def _unindexed(self, offset: int, chunksize: int) -> Iterator[Tuple[int, bytes]]:
+        """chunks of log after offset, and offset after each of them.
+        word cut at the end of chunk is left to the next one
+        """
+        start = 0
+        # not indexed yet, from offset
+        carry = b""
+        for segment in log_segments(self.path):
+            end = start + segment_size(segment)
+            if offset < end and segment.suffix == ".gap":
+                offset = end
+                yield offset, carry
+                carry = b""
+            elif offset < end:
+                with open_segment(segment) as f:
+                    f.seek(offset + len(carry) - start)
+                    for chunk in iter(lambda: f.read(chunksize), b""):
+                        data = carry + chunk
+                        tail = _TAIL.search(data).start()  # type: ignore
+                        if len(data) - tail > chunksize:
+                            # too long word
+                            tail = len(data)
+                        offset += tail
+                        carry = data[tail:]
+                        yield offset, data[:tail]
+            start = end
+
+    def contains(self, bits: Iterable[int]) -> bool:
+        """all bits are set, or bitmap is missing"""
+        if not self.index_path.is_file():
+            return True
+        with self.index_path.open("rb") as f:
+            for bit in bits:
+                f.seek(INDEXED.size + (bit >> 3))
+                byte = f.read(1)
+                if byte and not byte[0] & 1 << (bit & 7):
+                    return False
+        return True
+
+
+class Indexer:
+    """single thread catching up trigram indexes with logs.
+    it works at most `duty` of the time, so that logging and event loop
+    are not delayed. search scans logs not indexed yet
+    """
+
+    def __init__(self, duty: float = 0.25) -> None:
+        self.duty = duty
+        self._queue: "Queue[Path]" = Queue()
+        # paths in queue
+        self._queued: Set[Path] = set()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, path: Path) -> None:
+        self._start()
+        with self._lock:
+            if path in self._queued:
+                return
+            self._queued.add(path)
+        self._queue.put(path)
+
+    def flush(self) -> None:
+        """block until all logs submitted are indexed"""
+        self._queue.join()
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="drudgeyer-log-indexer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            path = self._queue.get()
+            with self._lock:
+                self._queued.discard(path)
+            started = time.monotonic()
+
+            def pause() -> None:
+                nonlocal started
+                busy = time.monotonic() - started
+                time.sleep(busy * (1 / self.duty - 1))
+                started = time.monotonic()
+
+            try:
+                TrigramIndex(path).catch_up(pause=pause)
+            except (OSError, ValueError):
+                # log is deleted or rolled. caught up next time
+                pass
+            finally:
+                self._queue.task_done()
+
+
+# shared by file handlers, so that only one indexer thread runs
+INDEXER = Indexer()
+
+
+class SearchHit(BaseModel):
+    id: str
+    # line number (0-origin)
+    line: int
+    log: str
+
+
+def log_ids(logdir: Path) -> List[str]:
+    """ids of jobs with log, the newest first"""
+    if not logdir.is_dir():
+        return []
+    ids = [path.name for path in logdir.iterdir() if is_log(path)]
+    return sorted(ids, reverse=True)
+
+
+def search(
+    logdir: Path, pattern: str, ignore_case: bool = False, limit: int = 100
+) -> List[SearchHit]:
+    """lines of job logs containing pattern (literal), up to limit"""
+    hits: List[SearchHit] = []
+    for hit in iter_search(logdir, pattern, ignore_case):
+        hits.append(hit)
+        if len(hits) >= limit:
+            break
+    return hits
+
+
+def iter_search(
+    logdir: Path, pattern: str, ignore_case: bool = False
+) -> Iterator[SearchHit]:
+    needle = pattern.encode("utf-8")
+    if ignore_case:
+        needle = needle.lower()
+    bits = pattern_trigrams(needle)
+    for id in log_ids(logdir):
+        path = logdir / id
+        index = TrigramIndex(path)
+        if index.indexed() is None:
+            # log saved before indexing
+            index.catch_up()
+        if index.indexed() == log_size(path) and not index.contains(bits):
+            continue
+        for line, payload in _grep(path, needle, ignore_case):
+            text = payload.decode("utf-8", errors="replace")
+            yield SearchHit(id=id, line=line, log=text)
+
+
+def _grep(path: Path, needle: bytes, ignore_case: bool) -> Iterator[Tuple[int, bytes]]:
+    reader = RecordReader()
+    line = 0
+    for chunk in read_log_from(path, 0, marker=truncation_marker):
+        for record in reader.feed(chunk):
+            payload = record.payload.lower() if ignore_case else record.payload
+            if needle in payload:
+                yield line, record.payload
+            line += 1
@@ -0,0 +1,140 @@
+import asyncio
+import bisect
+import math
+import time
+from typing import Dict, List, Sequence, Tuple
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(labels[label] for label in self.labels)
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        if not self._values and not self.labels:
+            return [(self.name, {}, 0)]
+        return [
+            (self.name, dict(zip(self.labels, key)), value)
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """cumulative buckets of observed values, without labels"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]) -> None:
+        super().__init__(name, help)
+        self.buckets = sorted(buckets) + [math.inf]
+        self._counts = [0] * len(self.buckets)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples: List[Tuple[str, Dict[str, str], float]] = []
+        total = 0
+        for bound, count in zip(self.buckets, self._counts):
+            total += count
+            le = "+Inf" if bound == math.inf else repr(float(bound))
+            samples.append((f"{self.name}_bucket", {"le": le}, total))
+        samples.append((f"{self.name}_sum", {}, self._sum))
+        samples.append((f"{self.name}_count", {}, total))
+        return samples
+
+
+class Registry:
+    """in-process metrics exposed in Prometheus text format (see create_app).
+    metrics are plain counters updated where jobs and logs flow, so that
+    scraping never scans the queue
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """text exposition format 0.0.4"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                if labels:
+                    pairs = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                    name = f"{name}{{{pairs}}}"
+                lines.append(f"{name} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# seconds from 0.1 sec to 1 hour
+SECONDS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600)
+
+QUEUE_JOBS = Gauge("drudgeyer_queue_jobs", "Jobs in queue by status", ["status"])
+QUEUE_ENQUEUED = Counter("drudgeyer_queue_enqueued_total", "Jobs added to queue")
+QUEUE_DEQUEUED = Counter("drudgeyer_queue_dequeued_total", "Jobs taken from queue")
+QUEUE_WAIT = Histogram(
+    "drudgeyer_queue_wait_seconds", "Time from enqueue to dequeue", SECONDS
+)
+JOB_RUN = Histogram("drudgeyer_job_run_seconds", "Run time of jobs", SECONDS)
+SUBPROCESSES = Gauge("drudgeyer_worker_subprocesses", "Running job subprocesses")
+LOG_LINES = Counter("drudgeyer_log_lines_total", "Lines of job output")
+LOG_BYTES = Counter("drudgeyer_log_bytes_total", "Bytes of job output")
+LOG_DROPPED = Counter(
+    "drudgeyer_log_dropped_total", "Log messages dropped by bounded buffers"
+)
+WEBSOCKET_CLIENTS = Gauge(
+    "drudgeyer_websocket_clients", "Connected websocket clients", ["route"]
+)
+LOOP_LAG = Gauge("drudgeyer_event_loop_lag_seconds", "Delay of event loop callbacks")
+
+
+async def monitor_loop_lag(interval: float = 1) -> None:
+    """measure how late the event loop wakes up from sleep"""
+    try:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(interval)
+            LOOP_LAG.set(max(time.monotonic() - start - interval, 0))
+    except asyncio.CancelledError:
+        return
@@ -1,21 +1,47 @@
 import asyncio
-import logging
-import logging.handlers
+import atexit
+import codecs
+import gzip
+import os
+import re
+import shutil
 import sys
+import threading
+import time
 from abc import ABC, abstractmethod
 from asyncio.events import AbstractEventLoop
-from asyncio.queues import Queue as aQueue
+from collections import OrderedDict, deque
 from enum import Enum
 from pathlib import Path
-from queue import SimpleQueue as Queue
-from typing import Any, Callable, Dict, List, Optional, Type
+from queue import Empty, Queue
+from typing import (
+    IO,
+    Any,
+    BinaryIO,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
 
 from pydantic.main import BaseModel
 
+from drudgeyer.metrics import LOG_BYTES, LOG_DROPPED, LOG_LINES
+
 
 class LogModel(BaseModel):
     id: str
     log: str
+    # end of the job's stream
+    end: bool = False
+    # position in the job's stream, increasing (0: not in stream)
+    seq: int = 0
 
 
 async def readuntil(self: asyncio.StreamReader, separator: bytes = b"\n") -> bytes:
@@ -95,6 +121,57 @@ async def readline(self: asyncio.StreamReader) -> bytes:
     return line
 
 
+class ChunkReader:
+    """Read subprocess output in large chunks and split all complete lines at once.
+    Lines are terminated by "\n" or "\r" (progress bar), as well as ``readline``.
+    "\r" at the end of chunk is kept until the next one, which may start with "\n".
+    """
+
+    def __init__(
+        self, pipe: asyncio.StreamReader, chunksize: int = 2 ** 16, limit: int = 2 ** 20
+    ) -> None:
+        self._pipe = pipe
+        self._chunksize = chunksize
+        self._limit = limit
+        self._partial = b""
+        # finds utf-8 character cut at the end of too long line
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def read(self) -> List[bytes]:
+        """Return a batch of complete lines. Empty list means EOF."""
+        while True:
+            chunk = await self._pipe.read(self._chunksize)
+            if not chunk:
+                # EOF: flush unterminated last line
+                partial, self._partial = self._partial, b""
+                return [partial] if partial else []
+
+            data = self._partial + chunk if self._partial else chunk
+            # "\r\n" may be split across chunks
+            end = len(data) - 1 if data.endswith(b"\r") else len(data)
+            last = max(data.rfind(b"\n", 0, end), data.rfind(b"\r", 0, end))
+            if last == -1:
+                if len(data) < self._limit:
+                    self._partial = data
+                    continue
+                # too long line without separator
+                return self._cut(data)
+
+            self._partial = data[last + 1 :]
+            return data[: last + 1].splitlines(keepends=True)
+
+    def _cut(self, data: bytes) -> List[bytes]:
+        """flush data, but the last utf-8 character left incomplete"""
+        self._decoder.decode(data)
+        incomplete, _ = self._decoder.getstate()
+        self._decoder.reset()
+        cut = len(data) - len(incomplete)
+        if not cut:
+            cut = len(data)
+        self._partial = data[cut:]
+        return [data[:cut]]
+
+
 class BaseLog(ABC):
     @property
     @abstractmethod
@@ -106,12 +183,25 @@ class BaseLog(ABC):
 
     def output(self, input: bytes) -> None:
         if input:
-            self.log(input.decode())
+            self.log(input.decode(errors="replace"))
+
+    def output_lines(self, lines: List[bytes]) -> None:
+        """handle a batch of lines at once"""
+        self.output(b"".join(lines))
+
+    async def drain(self) -> None:
+        """wait until logger is ready to accept more output"""
 
     async def _output(self, pipe: asyncio.StreamReader) -> None:
-        while not pipe.at_eof():
-            line = await readline(pipe)
-            self.output(line)
+        reader = ChunkReader(pipe)
+        while True:
+            lines = await reader.read()
+            if not lines:
+                return
+            LOG_LINES.inc(len(lines))
+            LOG_BYTES.inc(sum(map(len, lines)))
+            self.output_lines(lines)
+            await self.drain()
 
     def exception(self, exception: BaseException) -> None:
         self.log("Exception occured: %s\n" % exception)
@@ -120,6 +210,9 @@ class BaseLog(ABC):
     def finish(self) -> None:
         self.log("Task finished\n")
 
+    def close(self) -> None:
+        """release resources for the job after all output is logged"""
+
 
 class PrintLogger(BaseLog):
     def __init__(self) -> None:
@@ -130,81 +223,631 @@ class PrintLogger(BaseLog):
         return self._log
 
 
-class LocalQueueHandler(logging.handlers.QueueHandler):
-    def emit(self, record: logging.LogRecord) -> None:
+# called with batch written into log, or None when it is closed
+Observer = Callable[[Optional[bytes]], None]
+
+
+class LogWriter:
+    """Single thread writing logs of all jobs into files.
+    Logs are batched per job for a time window or up to max_batch bytes,
+    and each batch is written by a single call.
+    Open files are cached up to max_open, and closed on job completion.
+    Log larger than segment_size is rolled into gzip segments (see log_segments),
+    compressed in another thread not to delay writing. Files of the job other than
+    its log ("<id>.idx") are neither rolled nor counted in the budget.
+    Log over the budget keeps only the first max_head bytes and the last max_tail
+    bytes, and segments between them are truncated into a gap. Rolled logs over
+    max_total bytes on disk are truncated from the largest one.
+    """
+
+    def __init__(
+        self,
+        max_open: int = 64,
+        window: float = 0.05,
+        max_batch: int = 2 ** 16,
+        segment_size: Optional[int] = 2 ** 26,
+        max_head: Optional[int] = None,
+        max_tail: Optional[int] = None,
+        max_total: Optional[int] = None,
+    ) -> None:
+        self.max_open = max_open
+        self.window = window
+        self.max_batch = max_batch
+        # roll and compress log when it exceeds segment_size (None: never)
+        self.segment_size = segment_size
+        # budget per job and for all logs (None: unlimited)
+        self.max_head = max_head
+        self.max_tail = max_tail
+        self.max_total = max_total
+        # rolled logs, counted in max_total
+        self._rolled: Set[Path] = set()
+        # path and batch. None batch means close, and observer is registered
+        # in order with them (see observe)
+        self._queue: "Queue[Tuple[Path, Union[bytes, None, Observer]]]" = Queue()
+        self._files: "OrderedDict[Path, IO[bytes]]" = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # rolled segments to compress in compressor thread
+        self._compressing: "Queue[Path]" = Queue()
+        # segments are replaced by compressor or truncated by writer at once
+        self._segments_lock = threading.Lock()
+
+        # batches being collected in caller thread
+        self._pending: Dict[Path, List[bytes]] = {}
+        self._pending_size: Dict[Path, int] = {}
+        self._pending_lock = threading.Lock()
+
+        # called in writer thread with batches written into path
+        self._observers: Dict[Path, Observer] = {}
+
+    def write(self, path: Path, msg: Union[str, bytes]) -> None:
+        """append text (utf-8) or bytes as is"""
+        if isinstance(msg, str):
+            msg = msg.encode("utf-8")
+        self._start()
+        with self._pending_lock:
+            pending = self._pending.get(path)
+            if pending is None:
+                self._pending[path] = pending = []
+            pending.append(msg)
+            size = self._pending_size.get(path, 0) + len(msg)
+            self._pending_size[path] = size
+            if size >= self.max_batch:
+                self._submit(path)
+
+    def observe(self, path: Path, observer: Observer) -> None:
+        """call observer in writer thread with each batch written into path
+        from now on, and with None when path is closed.
+        close requested before is not sent to the observer
+        """
+        self._start()
+        with self._pending_lock:
+            self._submit(path)
+            self._queue.put((path, observer))
+
+    def close(self, path: Path) -> None:
+        """write the rest of logs and close the file"""
+        self._start()
+        with self._pending_lock:
+            self._submit(path)
+            self._queue.put((path, None))
+
+    def flush(self) -> None:
+        """block until all logs are written and compressed"""
+        self._submit_all()
+        self._queue.join()
+        self._compressing.join()
+
+    def shutdown(self) -> None:
+        """write the rest of logs and close all files.
+        writer thread is daemon, so that this is called at exit
+        """
+        self.flush()
+        for path in list(self._files):
+            self.close(path)
+        self.flush()
+
+    def _submit(self, path: Path) -> None:
+        """hand batch to writer thread. must be called with pending lock"""
+        pending = self._pending.pop(path, None)
+        self._pending_size.pop(path, None)
+        if pending:
+            self._queue.put((path, b"".join(pending)))
+
+    def _submit_all(self) -> None:
+        with self._pending_lock:
+            for path in list(self._pending):
+                self._submit(path)
+
+    def _start(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="drudgeyer-log-writer", daemon=True
+                )
+                self._thread.start()
+                threading.Thread(
+                    target=self._compress_run,
+                    name="drudgeyer-log-compressor",
+                    daemon=True,
+                ).start()
+                atexit.register(self.shutdown)
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.window
+        while True:
+            if time.monotonic() >= deadline:
+                # time window elapsed, even while queue is never empty
+                self._submit_all()
+                deadline = time.monotonic() + self.window
+            try:
+                path, msg = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except Empty:
+                continue
+
+            try:
+                observer = self._observers.get(path)
+                if msg is None:
+                    self._close(path)
+                    if observer:
+                        del self._observers[path]
+                        observer(None)
+                elif not isinstance(msg, bytes):
+                    self._observers[path] = msg
+                else:
+                    f = self._open(path)
+                    f.write(msg)
+                    if observer:
+                        observer(msg)
+                    roll_size = self.roll_size
+                    if roll_size and f.tell() >= roll_size and is_log(path):
+                        self._roll(path)
+                        with self._segments_lock:
+                            self._retain(path)
+                if self._queue.empty():
+                    # make logs visible to readers once writer is idle
+                    for f in self._files.values():
+                        f.flush()
+            except (OSError, ValueError):
+                # log directory is deleted
+                self._close(path)
+            finally:
+                self._queue.task_done()
+
+    @property
+    def roll_size(self) -> Optional[int]:
+        """segments must be small enough to retain the budget"""
+        sizes = [
+            size
+            for size in (self.segment_size, self.max_head, self.max_tail)
+            if size is not None
+        ]
+        return max(min(sizes), 1) if self.segment_size and sizes else None
+
+    def _open(self, path: Path) -> IO[bytes]:
+        f = self._files.get(path)
+        if f is not None:
+            self._files.move_to_end(path)
+            return f
+        while len(self._files) >= self.max_open:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        f = path.open("ab")
+        self._files[path] = f
+        return f
+
+    def _close(self, path: Path) -> None:
+        f = self._files.pop(path, None)
+        if f is not None:
+            try:
+                f.close()
+            except OSError:
+                pass
+
+    def _roll(self, path: Path) -> None:
+        """move active log into the next segment to compress, and start new one"""
+        self._close(path)
+        # after the last one. gaps merge segments, so the count is not the index
+        indexes = [segment_index(path, segment) for segment in log_segments(path)[:-1]]
+        index = max(indexes) + 1 if indexes else 0
+        segment = path.with_name(f"{path.name}.{index}")
+        path.rename(segment)
+        path.touch()
+        self._compressing.put(segment)
+
+    def _compress_run(self) -> None:
+        while True:
+            segment = self._compressing.get()
+            try:
+                self._compress(segment)
+            finally:
+                self._compressing.task_done()
+
+    def _compress(self, segment: Path) -> None:
+        """gzip segment, and replace it once done. readers see it uncompressed
+        until then (see log_segments)
+        """
+        compressed = segment.with_name(segment.name + ".gz")
+        temp = compressed.with_name(compressed.name + ".tmp")
         try:
-            self.enqueue(record)
-        except asyncio.CancelledError:
-            raise
-        except Exception:
-            self.handleError(record)
+            with segment.open("rb") as src, gzip.open(temp, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            with self._segments_lock:
+                if segment.is_file():
+                    # readers see either of complete segments
+                    temp.rename(compressed)
+                    segment.unlink()
+                    return
+        except OSError:
+            pass
+        # log is deleted, or segment is truncated meanwhile
+        if temp.is_file():
+            temp.unlink()
+
+    def _retain(self, path: Path) -> None:
+        """truncate segments of log between head and tail"""
+        if self.max_head is None and self.max_tail is None:
+            self._enforce_total(path)
+            return
+        segments = log_segments(path)[:-1]
+        sizes = [segment_size(segment) for segment in segments]
+
+        head = self._head(sizes)
+        tail, kept = len(segments), 0
+        max_tail = self.max_tail if self.max_tail else 0
+        while tail > head and kept + sizes[tail - 1] <= max_tail:
+            kept += sizes[tail - 1]
+            tail -= 1
+        self._truncate(path, segments[head:tail], sizes[head:tail])
+        self._enforce_total(path)
+
+    def _head(self, sizes: List[int]) -> int:
+        """number of segments in head"""
+        head, kept = 0, 0
+        max_head = self.max_head if self.max_head else 0
+        while head < len(sizes) and kept < max_head:
+            kept += sizes[head]
+            head += 1
+        return head
+
+    def _truncate(self, path: Path, segments: List[Path], sizes: List[int]) -> int:
+        """replace segments with a gap. return bytes freed on disk"""
+        if not segments or all(segment.suffix == ".gap" for segment in segments):
+            return 0
+        freed = sum(segment.stat().st_size for segment in segments)
+        index = segment_index(path, segments[0])
+        gap = path.with_name(f"{path.name}.{index}.gap")
+        lost = sum(sizes)
+        if gap.is_file() and gap not in segments:
+            # truncated again
+            lost += segment_size(gap)
+        temp = gap.with_name(gap.name + ".tmp")
+        temp.write_text(str(lost))
+        temp.rename(gap)
+        for segment in segments:
+            if segment != gap:
+                segment.unlink()
+        return freed - gap.stat().st_size
+
+    def _enforce_total(self, path: Path) -> None:
+        """truncate the oldest segments of the largest logs into max_total"""
+        self._rolled.add(path)
+        if self.max_total is None:
+            return
+        usage: Dict[Path, int] = {}
+        for rolled in list(self._rolled):
+            segments = log_segments(rolled)
+            if not segments:
+                # deleted
+                self._rolled.discard(rolled)
+                continue
+            usage[rolled] = sum(segment.stat().st_size for segment in segments)
+
+        total = sum(usage.values())
+        while usage and total > self.max_total:
+            largest = max(usage, key=usage.__getitem__)
+            segments = log_segments(largest)[:-1]
+            sizes = [segment_size(segment) for segment in segments]
+            head = self._head(sizes)
+            # the oldest segment after head, and gap next to it
+            while head < len(segments) and segments[head].suffix == ".gap":
+                head += 1
+            end = head + 1
+            if head > 0 and segments[head - 1].suffix == ".gap":
+                head -= 1
+            freed = self._truncate(largest, segments[head:end], sizes[head:end])
+            if freed <= 0:
+                del usage[largest]
+                continue
+            usage[largest] -= freed
+            total -= freed
+
+
+def is_log(path: Path) -> bool:
+    """log of job, not the index files of it ("<id>.idx", "<id>.tri")"""
+    return "." not in path.name
+
+
+def log_segments(path: Path) -> List[Path]:
+    """rolled segments of log ("<id>.<n>.gz") in order, followed by active log.
+    truncated segments are replaced with "<id>.<n>.gap" holding their size
+    """
+    indexes: Dict[int, Path] = {}
+    gaps: Dict[int, Path] = {}
+    for segment in path.parent.glob(f"{path.name}.*"):
+        suffix = segment.name[len(path.name) + 1 :].split(".")
+        if not suffix[0].isdigit():
+            continue
+        if suffix[1:] == ["gap"]:
+            gaps[int(suffix[0])] = segment
+        elif suffix[1:] == ["gz"]:
+            indexes[int(suffix[0])] = segment
+        elif len(suffix) == 1:
+            # being compressed
+            indexes.setdefault(int(suffix[0]), segment)
+
+    indexes.update(gaps)
+    segments = [indexes[index] for index in sorted(indexes)]
+    if path.is_file():
+        segments.append(path)
+    return segments
+
+
+def segment_index(path: Path, segment: Path) -> int:
+    """n of segment "<id>.<n>[.gz|.gap]" of log"""
+    return int(segment.name[len(path.name) + 1 :].split(".")[0])
+
+
+def segment_size(segment: Path) -> int:
+    """uncompressed size of segment"""
+    if segment.suffix == ".gap":
+        return int(segment.read_text())
+    if segment.suffix != ".gz":
+        return segment.stat().st_size
+    # gzip trailer holds the size modulo 2^32. segments are smaller than it
+    with segment.open("rb") as f:
+        f.seek(-4, os.SEEK_END)
+        return int.from_bytes(f.read(4), "little")
+
+
+def log_size(path: Path) -> int:
+    """uncompressed size of whole log, counting truncated segments"""
+    return sum(segment_size(segment) for segment in log_segments(path))
+
+
+def open_segment(segment: Path) -> Union[BinaryIO, gzip.GzipFile]:
+    if segment.suffix == ".gz":
+        return gzip.open(segment, "rb")
+    return segment.open("rb")
+
+
+def truncation_marker(size: int) -> bytes:
+    return f"\n... {size} bytes truncated ...\n".encode("utf-8")
+
+
+def read_log_from(
+    path: Path,
+    offset: int,
+    chunksize: int = 2 ** 16,
+    marker: Callable[[int], bytes] = truncation_marker,
+) -> Iterator[bytes]:
+    """read log from byte offset of whole log, skipping segments before it.
+    truncated segments are read as marker
+    """
+    for segment in log_segments(path):
+        size = segment_size(segment)
+        if offset >= size:
+            offset -= size
+            continue
+        if segment.suffix == ".gap":
+            offset = 0
+            yield marker(size)
+            continue
+        with open_segment(segment) as f:
+            f.seek(offset)
+            offset = 0
+            for chunk in iter(lambda: f.read(chunksize), b""):
+                yield chunk
+
+
+def read_log(path: Path) -> Optional[str]:
+    """read whole log, decompressing rolled segments"""
+    if not log_segments(path):
+        return None
+    return b"".join(read_log_from(path, 0)).decode("utf-8", errors="replace")
+
+
+# shared by loggers and log handlers, so that only one writer thread runs
+LOG_WRITER = LogWriter()
 
 
 class QueueFileLogger(BaseLog):
+    def __init__(self, writer: Optional[LogWriter] = None) -> None:
+        self._writer = writer if writer else LOG_WRITER
+
     @property
     def log(self) -> Callable[[str], Any]:
         return self._log
 
     def reset(self, id: str, command: str, logdir: str = "log") -> None:
-        self.set_handler(id, logdir=logdir)
-        self._setup_logging_queue(id)
-        self.logger = logging.getLogger(id)
-        self._log = self.logger.info
+        path = Path(logdir)
+        path.mkdir(exist_ok=True)
+        # retried job keeps appending into the same log
+        self._path = path / id
+        self._path.touch(exist_ok=True)
+        self._log = self._write
         super().reset(id, command)
 
-    def set_handler(self, id: str, logdir: str = "log") -> None:
-        logger = logging.getLogger(id)
-        logger.setLevel(logging.INFO)
+    def _write(self, msg: str) -> None:
+        # output keeps its own line endings
+        if not msg.endswith(("\n", "\r")):
+            msg += "\n"
+        self._writer.write(self._path, msg)
 
-        path = Path(logdir)
-        path.mkdir(exist_ok=True)
-        path = path / id
-        path.touch(exist_ok=False)
-        handler = logging.FileHandler(path.resolve())
-        handler.setLevel(logging.INFO)
-        formatter = logging.Formatter("%(message)s")
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-
-    def _setup_logging_queue(self, id: str) -> None:
-        """Move log handlers to a separate thread"""
-        handlers: List[logging.Handler] = []
-        queue: Queue[logging.LogRecord] = Queue()
-        handler = LocalQueueHandler(queue)
-
-        logger = logging.getLogger(id)
-        logger.addHandler(handler)
-        for h in logger.handlers[:]:
-            if h is not handler:
-                logger.removeHandler(h)
-                handlers.append(h)
-
-        listener = logging.handlers.QueueListener(
-            queue, *handlers, respect_handler_level=True
-        )
-        listener.start()
+    def close(self) -> None:
+        self._writer.close(self._path)
+
+
+class LogPolicy(Enum):
+    """behavior of LogBuffer when it is full"""
+
+    block = "block"  # pause reading the subprocess pipe until drained (or drop)
+    drop = "drop"  # drop the oldest logs
+    coalesce = "coalesce"  # drop superseded "\r" progress updates, then the oldest
+
+
+# "\r"-terminated segment overwritten by following output
+PROGRESS = re.compile(r"[^\r\n]*\r(?!\n)(?=.)", re.DOTALL)
+
+
+class LogBuffer:
+    """Bounded ring buffer of logs between worker and log streamer.
+    It holds up to maxsize logs and maxchars characters of them. coalesce policy
+    merges logs into fewer and longer ones, so that maxchars is the bound of memory.
+    Block policy drops the oldest logs as well, when nothing has read the buffer
+    for stall [sec], so that worker without log streamer is not blocked forever.
+    Once stalled, it drops without waiting until the buffer is read again.
+    End of job is never dropped.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        maxchars: int = 2 ** 24,
+        policy: LogPolicy = LogPolicy.block,
+        loop: Optional[AbstractEventLoop] = None,
+        stall: float = 5,
+    ) -> None:
+        self.maxsize = maxsize
+        self.maxchars = maxchars
+        self.policy = policy
+        self.stall = stall
+        self._buffer: Deque[LogModel] = deque()
+        self._chars = 0
+        # monotonic time of the last get (None: never read)
+        self._read: Optional[float] = None
+        # nothing has read since drain timed out
+        self._stalled = False
+        self._readable = asyncio.Event(loop=loop)
+        self._writable = asyncio.Event(loop=loop)
+        self._writable.set()
+
+        # counters of discarded logs
+        self.dropped = 0
+        self.dropped_chars = 0
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def full(self) -> bool:
+        return len(self._buffer) >= self.maxsize or self._chars >= self.maxchars
+
+    def _overflow(self, size: int) -> bool:
+        return len(self._buffer) >= self.maxsize or self._chars + size > self.maxchars
+
+    def put_nowait(self, log: LogModel) -> None:
+        """put log without blocking.
+        block policy exceeds the bound by one put, and the writer must wait drain.
+        """
+        size = len(log.log)
+        if self.policy != LogPolicy.block and self._overflow(size):
+            if self.policy == LogPolicy.coalesce:
+                self._coalesce()
+            while self._overflow(size) and self._drop():
+                pass
+
+        self._buffer.append(log)
+        self._chars += size
+        self._readable.set()
+        if self.full():
+            self._writable.clear()
+
+    async def get(self) -> LogModel:
+        self._read = time.monotonic()
+        while not self._buffer:
+            self._readable.clear()
+            await self._readable.wait()
+        self._read = time.monotonic()
+        self._stalled = False
+        log = self._buffer.popleft()
+        self._chars -= len(log.log)
+        if not self.full():
+            self._writable.set()
+        return log
+
+    async def drain(self) -> None:
+        while self.full():
+            if not self._stalled:
+                try:
+                    await asyncio.wait_for(self._writable.wait(), self.stall)
+                    continue
+                except asyncio.TimeoutError:
+                    read = self._read
+                    if read is not None and time.monotonic() - read < self.stall:
+                        continue
+                    self._stalled = True
+            # nothing is reading
+            while self.full() and self._drop():
+                pass
+            return
+
+    def _drop(self) -> bool:
+        """drop the oldest log but end of job. False if nothing to drop"""
+        for idx, log in enumerate(self._buffer):
+            if not log.end:
+                break
+        else:
+            return False
+        del self._buffer[idx]
+        self._chars -= len(log.log)
+        self.dropped += 1
+        self.dropped_chars += len(log.log)
+        LOG_DROPPED.inc()
+        if not self.full():
+            self._writable.set()
+        return True
+
+    def _coalesce(self) -> None:
+        """merge consecutive logs of the same job and drop overwritten progress"""
+        merged: Deque[LogModel] = deque()
+        for log in self._buffer:
+            last = merged[-1] if merged else None
+            if last and last.id == log.id and not last.end and not log.end:
+                merged[-1] = LogModel(id=log.id, log=last.log + log.log)
+            else:
+                merged.append(log)
+
+        chars = 0
+        for log in merged:
+            log.log, n = PROGRESS.subn("", log.log)
+            chars += len(log.log)
+            # overwritten progress updates
+            LOG_DROPPED.inc(n)
+        self.dropped_chars += self._chars - chars
+        self._buffer = merged
+        self._chars = chars
 
 
 class StreamingLogger(BaseLog):
     def __init__(
-        self, maxsize: int = 1000, loop: Optional[AbstractEventLoop] = None
+        self,
+        maxsize: int = 1000,
+        loop: Optional[AbstractEventLoop] = None,
+        maxchars: int = 2 ** 24,
+        policy: LogPolicy = LogPolicy.block,
     ) -> None:
-        self._log: aQueue[LogModel] = aQueue(maxsize, loop=loop)
+        self._log = LogBuffer(maxsize, maxchars=maxchars, policy=policy, loop=loop)
 
     def reset(self, id: str, command: str) -> None:
         def log(command: str) -> None:
             self._log.put_nowait(LogModel(id=id, log=command))
 
+        self._id = id
         self._logfunc = log
 
+    def close(self) -> None:
+        self._log.put_nowait(LogModel(id=self._id, log="", end=True))
+
     @property
     def log(self) -> Callable[[str], Any]:
         return self._logfunc
 
+    @property
+    def dropped(self) -> int:
+        return self._log.dropped
+
+    @property
+    def dropped_chars(self) -> int:
+        return self._log.dropped_chars
+
+    async def drain(self) -> None:
+        await self._log.drain()
+
     async def dequeue(self) -> LogModel:
-        log = await self._log.get()
-        self._log.task_done()
-        return log
+        return await self._log.get()
 
 
 class Loggers(Enum):
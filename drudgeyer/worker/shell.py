@@ -1,11 +1,24 @@
 import asyncio
+import os
+import shutil
+import socket
+import time
 from abc import ABC, abstractmethod
-from asyncio.subprocess import PIPE, STDOUT, create_subprocess_shell
-from signal import Signals
+from asyncio.subprocess import PIPE, STDOUT, Process, create_subprocess_shell
+from functools import partial
+from pathlib import Path
+from signal import SIGKILL, SIGTERM, Signals
 from types import FrameType
 from typing import Any, Optional
 
+import requests
+from requests import Response
+
+from drudgeyer.job_scheduler.cache import ResultCache
+from drudgeyer.job_scheduler.dependency import BaseDep
+from drudgeyer.job_scheduler.lease import unpack_archive
 from drudgeyer.job_scheduler.queue import BaseQueue, BaseQueueModel, Status
+from drudgeyer.metrics import JOB_RUN, SUBPROCESSES
 from drudgeyer.worker.logger import BaseLog
 
 
@@ -31,7 +44,9 @@ class BaseWorker(ABC):
                 if self.should_exit:
                     return
                 if task:
+                    start = time.monotonic()
                     status = await self.run(task, loop)
+                    JOB_RUN.observe(time.monotonic() - start)
                     await self.worked(task, status)
                 else:
                     await asyncio.sleep(self.freq)
@@ -44,50 +59,235 @@ class BaseWorker(ABC):
         else:
             self.should_exit = True
 
+    def cancel(self, id: str, preempt: bool = False) -> bool:
+        """stop running job. return False if the job is not running"""
+        return False
+
 
 class Worker(BaseWorker):
+    # running job and its subprocess
+    _running: Optional[BaseQueueModel] = None
+    _process: Optional[Process] = None
+    # status of the job stopped by cancel
+    _cancelled: Optional[Status] = None
+    # seconds between SIGTERM and SIGKILL for cancelled job
+    grace: float = 10
+
     def __init__(
-        self, logger: BaseLog, queue: BaseQueue, *args: Any, **kwargs: Any
+        self,
+        logger: BaseLog,
+        queue: BaseQueue,
+        *args: Any,
+        cache: Optional[ResultCache] = None,
+        **kwargs: Any,
     ) -> None:
         self._logger = logger
         self._queue = queue
+        self._cache = cache
         super().__init__(*args, **kwargs)
 
     async def dequeue(self) -> Optional[BaseQueueModel]:
         return self._queue.dequeue()
 
     async def worked(self, task: BaseQueueModel, status: Status) -> None:
-        self._queue.worked(task.id, status)
+        # cancelled job is not retried
+        self._queue.worked(task.id, status, retry=self._cancelled is None)
+        self._cancelled = None
+
+    def handle_exit(self, sig: Signals, frame: Optional[FrameType]) -> None:
+        super().handle_exit(sig, frame)
+        # job runs in its own process group. forward the signal
+        if self._process:
+            self._signal(self._process, sig)
+
+    def cancel(self, id: str, preempt: bool = False) -> bool:
+        process = self._process
+        if (
+            self._running is None
+            or self._running.id != id
+            or process is None
+            or process.returncode is not None
+        ):
+            return False
+        self._cancelled = Status.todo if preempt else Status.failed
+        self._signal(process, SIGTERM)
+        asyncio.get_event_loop().call_later(self.grace, self._signal, process, SIGKILL)
+        return True
+
+    def _signal(self, process: Process, sig: Signals) -> None:
+        if process.returncode is not None:
+            return
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
 
     async def run(
         self, task: BaseQueueModel, loop: asyncio.AbstractEventLoop
     ) -> Status:
         # TODO: add safe terminate process for subprocess shell
         self._logger.reset(task.id, task.command)
+        if task.attempt:
+            self._logger.log(f"Retry: attempt {task.attempt}/{task.retries}\n")
 
         if self.should_exit:
+            self._logger.close()
             return Status.failed
 
+        key: Optional[str] = None
+        if self._cache:
+            # hashing dependency might take a while
+            key = await loop.run_in_executor(None, self._cache.key, task)
+            cached = self._cache.get(key) if key else None
+            if cached:
+                # log of the previous run is not copied
+                self._logger.log(
+                    f"Cached: not run, as {cached.id} succeeded with the same inputs. "
+                    f"See its log (outputs in {cached.workdir})\n"
+                )
+                self._logger.finish()
+                self._logger.close()
+                return Status.done
+
         command = task.command
         cwd = task.workdir
         try:
+            # own process group to signal the whole job at cancel
             process = await create_subprocess_shell(
-                command, stdout=PIPE, stderr=STDOUT, loop=loop, cwd=cwd
+                command,
+                stdout=PIPE,
+                stderr=STDOUT,
+                loop=loop,
+                cwd=cwd,
+                start_new_session=True,
             )
+            self._running = task
+            self._process = process
+            SUBPROCESSES.inc()
+            reader: Optional["asyncio.Task[None]"] = None
             if process.stdout:
-                asyncio.create_task(self._logger._output(process.stdout))
+                reader = asyncio.create_task(self._logger._output(process.stdout))
 
             exitcode = await process.wait()  # 0 means success
+            if reader:
+                # background process of the job might keep the pipe open
+                await asyncio.wait([reader], timeout=self.grace)
 
         except (OSError, FileNotFoundError, PermissionError) as exception:
             self._logger.exception(exception)
             exitcode = 1
         else:
             # no exception was raised
-            self._logger.finish()
+            if self._cancelled == Status.todo:
+                self._logger.log("Task preempted\n")
+            elif self._cancelled:
+                self._logger.log("Task cancelled\n")
+            else:
+                self._logger.finish()
+        finally:
+            if self._process:
+                SUBPROCESSES.dec()
+            self._running = None
+            self._process = None
+            self._logger.close()
+
+        if self._cancelled:
+            return self._cancelled
 
         if exitcode == 0:
             # success
+            if self._cache and key:
+                self._cache.put(key, task)
             return Status.done
 
         return Status.failed
+
+
+class RemoteWorker(Worker):
+    """Worker pulling jobs from the queue API of another runner over HTTP"""
+
+    def __init__(
+        self,
+        logger: BaseLog,
+        url: str,
+        depends: BaseDep,
+        name: Optional[str] = None,
+        ttl: float = 60,
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        self._logger = logger
+        self._url = f"http://{url}"
+        self._depends = depends
+        self._name = name if name else f"{socket.gethostname()}-{os.getpid()}"
+        self._ttl = ttl
+        # dependency of remote job is cleared after the run
+        self._cache = None
+        BaseWorker.__init__(self, *args, **kwargs)
+
+    async def _request(self, method: str, path: str, **kwargs: Any) -> Response:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None,
+            partial(requests.request, method, self._url + path, timeout=10, **kwargs),
+        )
+
+    async def dequeue(self) -> Optional[BaseQueueModel]:
+        try:
+            resp = await self._request(
+                "POST", "/queue/lease", json={"worker": self._name}
+            )
+            if resp.status_code != 200 or not resp.json():
+                return None
+            task = BaseQueueModel.parse_obj(resp.json())
+        except (requests.RequestException, ValueError):
+            # runner is unreachable, or not the queue API
+            return None
+
+        if task.workdir != Path(""):
+            # fetch dependency of the job
+            try:
+                resp = await self._request("GET", f"/queue/dep/{task.id}")
+                if resp.status_code == 200:
+                    unpack_archive(resp.content, self._depends.path / task.id)
+            except (requests.RequestException, shutil.ReadError):
+                # put the job back as lease expiry does, and keep polling
+                await self.worked(task, Status.todo)
+                return None
+            task.workdir = self._depends.path / task.id / task.workdir
+        return task
+
+    async def worked(self, task: BaseQueueModel, status: Status) -> None:
+        self._cancelled = None
+        body = {"id": task.id, "worker": self._name, "status": status.value}
+        try:
+            await self._request("POST", "/queue/complete", json=body)
+        except requests.RequestException:
+            # lease will expire, and the job is re-queued
+            pass
+        await self._depends.clear(task.id)
+
+    async def heartbeat(self, task: BaseQueueModel) -> None:
+        body = {"id": task.id, "worker": self._name}
+        try:
+            while True:
+                await asyncio.sleep(self._ttl / 3)
+                try:
+                    resp = await self._request("POST", "/queue/heartbeat", json=body)
+                except requests.RequestException:
+                    continue
+                if resp.status_code == 404:
+                    # lease is cancelled or expired, and the job is not ours anymore
+                    self.cancel(task.id, preempt=True)
+                    return
+        except asyncio.CancelledError:
+            return
+
+    async def run(
+        self, task: BaseQueueModel, loop: asyncio.AbstractEventLoop
+    ) -> Status:
+        heartbeat = loop.create_task(self.heartbeat(task))
+        try:
+            return await super().run(task, loop)
+        finally:
+            heartbeat.cancel()
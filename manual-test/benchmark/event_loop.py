@@ -0,0 +1,116 @@
+"""Compare asyncio and uvloop event loops for log-heavy runner workloads.
+
+- pipe-read: capture output of a chatty subprocess with BaseLog._output
+- fan-out: broadcast logs to websocket viewers through create_app
+
+usage: python manual-test/benchmark/event_loop.py [--lines N] [--viewers N]
+"""
+import argparse
+import asyncio
+import importlib
+import time
+from typing import Any, Callable, List
+
+import uvicorn
+import websockets
+
+from drudgeyer.log_tracker import log_streamer
+from drudgeyer.log_tracker.broadcasting import LocalReadStreamer, create_app
+from drudgeyer.worker.logger import BaseLog, LogModel
+
+
+class CountLogger(BaseLog):
+    def __init__(self) -> None:
+        self.count = 0
+
+    @property
+    def log(self) -> Callable[[str], Any]:
+        return self._log
+
+    def _log(self, msg: str) -> None:
+        self.count += msg.count("\n")
+
+
+async def pipe_read(lines: int) -> float:
+    logger = CountLogger()
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_shell(
+        f"seq 1 {lines}", stdout=asyncio.subprocess.PIPE
+    )
+    assert process.stdout
+    await logger._output(process.stdout)
+    await process.wait()
+    assert logger.count == lines
+    return time.perf_counter() - start
+
+
+class PushLogStreamer(log_streamer.BaseLogStreamer):
+    async def recv(self) -> LogModel:
+        ...  # pragma: no cover
+
+    async def entry_point(self) -> None:
+        ...  # pragma: no cover
+
+
+async def fan_out(lines: int, viewers: int, port: int) -> float:
+    streamer = PushLogStreamer([log_streamer.QueueHandler()])
+    app = create_app(LocalReadStreamer(streamer))
+    config = uvicorn.Config(app, port=port, log_level="error", lifespan="off")
+    server = uvicorn.Server(config)
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    uri = f"ws://127.0.0.1:{port}/log-trace?id=bench"
+    clients = [await websockets.connect(uri) for _ in range(viewers)]
+    await asyncio.sleep(0.1)
+
+    async def receive(ws: Any) -> None:
+        count = 0
+        while count < lines:
+            msg = await ws.recv()
+            count += msg.count("\n")
+
+    start = time.perf_counter()
+    receivers = [asyncio.ensure_future(receive(ws)) for ws in clients]
+    for idx in range(lines):
+        streamer.send(LogModel(id="bench", log=f"{idx}\n"))
+        if idx % 100 == 0:
+            await asyncio.sleep(0)
+    await asyncio.gather(*receivers)
+    elapsed = time.perf_counter() - start
+
+    for ws in clients:
+        await ws.close()
+    server.should_exit = True
+    await serving
+    return elapsed
+
+
+def bench(name: str, loop: asyncio.AbstractEventLoop, args: Any) -> List[str]:
+    asyncio.set_event_loop(loop)
+    read = loop.run_until_complete(pipe_read(args.lines))
+    fan = loop.run_until_complete(fan_out(args.fanout_lines, args.viewers, args.port))
+    for task in asyncio.all_tasks(loop):
+        task.cancel()
+    loop.run_until_complete(asyncio.sleep(0.1))
+    loop.close()
+    return [
+        f"{name:8s} pipe-read: {args.lines / read:12,.0f} lines/s",
+        f"{name:8s} fan-out:   {args.fanout_lines * args.viewers / fan:12,.0f} lines/s"
+        f" ({args.viewers} viewers)",
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=1_000_000)
+    parser.add_argument("--fanout-lines", type=int, default=10_000)
+    parser.add_argument("--viewers", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    results = bench("asyncio", asyncio.new_event_loop(), args)
+    uvloop: Any = importlib.import_module("uvloop")
+    results += bench("uvloop", uvloop.new_event_loop(), args)
+    print("\n".join(results))
@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict
+from typing import Dict, Optional
 
 import uvicorn
 
@@ -22,7 +22,14 @@ class ToyReadStreamer(BaseReadStreamer):
             pass
         raise ValueError("broken connection. try again")
 
-    async def add_client(self, id: str, key: str) -> None:
+    async def add_client(
+        self,
+        id: str,
+        key: str,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> None:
         await asyncio.sleep(0.01)
         self.key_to_id[key] = id
         if id not in self.id_cnt:
@@ -18,6 +18,11 @@ def test_add(mocker):
         result = runner.invoke(app, ["echo 111"])
         assert result.exit_code == 0, result.stdout
 
+        # with retries
+        result = runner.invoke(app, ["echo 111", "--retries", "2", "--backoff", "1"])
+        assert result.exit_code == 0, result.stdout
+        assert "Retries: 2" in result.stdout
+
         # with dependencies
         with tempfile.TemporaryDirectory() as tempsrcdir:
             srcdir = Path(tempsrcdir)
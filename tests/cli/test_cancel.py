@@ -0,0 +1,38 @@
+from unittest import mock
+
+import requests
+import typer
+from typer.testing import CliRunner
+
+from drudgeyer.cli.cancel import main
+
+app = typer.Typer()
+app.command()(main)
+
+runner = CliRunner()
+
+
+class DummyResponse:
+    def __init__(self, status_code: int) -> None:
+        self.status_code = status_code
+
+
+def test_cancel(mocker: mock):
+    post = mocker.patch("requests.post", return_value=DummyResponse(200))
+    result = runner.invoke(app, ["xxx"])
+    assert result.exit_code == 0, result.stdout
+    assert post.call_args[1]["json"] == {"id": "xxx", "preempt": False}
+
+    result = runner.invoke(app, ["xxx", "--preempt"])
+    assert result.exit_code == 0, result.stdout
+    assert post.call_args[1]["json"] == {"id": "xxx", "preempt": True}
+
+
+def test_cancel_failed(mocker: mock):
+    mocker.patch("requests.post", return_value=DummyResponse(404))
+    result = runner.invoke(app, ["xxx"])
+    assert result.exit_code == 1, result.stdout
+
+    mocker.patch("requests.post", side_effect=requests.ConnectionError)
+    result = runner.invoke(app, ["xxx"])
+    assert result.exit_code == 1, result.stdout
@@ -1,3 +1,4 @@
+import json
 from typing import AsyncIterator
 
 import pytest
@@ -7,6 +8,7 @@ from typer.testing import CliRunner
 from websockets.typing import Data
 
 from drudgeyer.cli.log import entry_point, main
+from drudgeyer.log_tracker.record import FRAME_OFFSET
 
 app = typer.Typer()
 app.command()(main)
@@ -14,6 +16,10 @@ app.command()(main)
 runner = CliRunner()
 
 
+async def no_sleep(delay: float) -> None:
+    """asyncio.sleep without waiting"""
+
+
 @pytest.mark.timeout(0.1)
 def test_not_found():
     id = "xxx"
@@ -91,3 +97,57 @@ async def test_websockets_exception(mocker):
     exception = Exception
     websocket.return_value = DummyWebSocketClientProtcol(dummy_resp, repeat, exception)
     await entry_point("")
+
+
+def test_tail_from(mocker):
+    mocker.patch("asyncio.get_event_loop")
+    entry = mocker.patch("drudgeyer.cli.log.entry_point", mocker.MagicMock())
+    runner.invoke(app, ["xxx", "--tail", "10", "--from", "3"])
+    entry.assert_called_once_with(
+        "ws://127.0.0.1:8000/log-trace?id=xxx&binary=true&tail=10&from=3",
+        resume=True,
+        retries=3,
+    )
+
+
+@pytest.mark.asyncio
+async def test_websockets_resume(mocker, capsys):
+    mocker.patch("asyncio.sleep", no_sleep)
+    websocket = mocker.patch("websockets.connect")
+    closed = websockets.ConnectionClosedError(1006, "")
+    frames = [json.dumps({"offset": i, "log": f"{i}\n"}) for i in [1, 2]]
+    websocket.side_effect = [
+        DummyWebSocketClientProtcol(frames[0], 1, closed),
+        OSError(),
+        DummyWebSocketClientProtcol(frames[1], 1),
+    ]
+    await entry_point("ws://xxx/log-trace?id=xxx", resume=True, retries=2)
+
+    # reconnect resuming after the last offset
+    assert [call[0][0] for call in websocket.call_args_list] == [
+        "ws://xxx/log-trace?id=xxx&offset=0",
+        "ws://xxx/log-trace?id=xxx&offset=1",
+        "ws://xxx/log-trace?id=xxx&offset=1",
+    ]
+    captured = capsys.readouterr()
+    assert captured.out == (
+        "1\nConnection closed\nReconnecting\nnot found\nReconnecting\n2\n"
+    )
+
+
+@pytest.mark.asyncio
+async def test_websockets_binary(mocker, capsys):
+    mocker.patch("asyncio.sleep", no_sleep)
+    websocket = mocker.patch("websockets.connect")
+    closed = websockets.ConnectionClosedError(1006, "")
+    frame = FRAME_OFFSET.pack(5) + "ログ\n".encode("utf-8")
+    websocket.side_effect = [
+        DummyWebSocketClientProtcol(frame, 1, closed),
+        DummyWebSocketClientProtcol(b"", 0),
+    ]
+    await entry_point("ws://xxx/log-trace?id=xxx", resume=True, retries=1)
+
+    assert websocket.call_args_list[1][0][0] == "ws://xxx/log-trace?id=xxx&offset=5"
+    assert websocket.call_args_list[0][1]["compression"] == "deflate"
+    captured = capsys.readouterr()
+    assert captured.out == "ログ\nConnection closed\nReconnecting\n"
@@ -1,5 +1,7 @@
 import asyncio
+import json
 import os
+import socket
 import tempfile
 import threading
 import time
@@ -8,10 +10,13 @@ from pathlib import Path
 from signal import SIGINT
 
 import pytest
+import requests
 import typer
 from typer.testing import CliRunner
 
-from drudgeyer.cli.run import main
+from drudgeyer.cli.run import Loops, main, new_event_loop, start_tracker, stop_tracker
+from drudgeyer.log_tracker.log_streamer import PipeHandler
+from drudgeyer.worker.logger import LogModel
 
 app = typer.Typer()
 app.command()(main)
@@ -85,3 +90,70 @@ def test_run(mocker):
         # running main process (inspect queue, handle worker and ...)
         result = runner.invoke(app, [])
         assert result.exit_code == 0, result.stdout
+
+
+def test_new_event_loop(mocker) -> None:
+    default = asyncio.get_event_loop()
+    try:
+        loop = new_event_loop(Loops.asyncio)
+        assert isinstance(loop, asyncio.AbstractEventLoop)
+
+        uvloop = pytest.importorskip("uvloop")
+        loop = new_event_loop(Loops.auto)
+        assert isinstance(loop, uvloop.Loop)
+        assert asyncio.get_event_loop() is loop
+        loop.close()
+        asyncio.set_event_loop(default)
+
+        # fallback to current asyncio event loop
+        mocker.patch("importlib.import_module", side_effect=ImportError)
+        loop = new_event_loop(Loops.uvloop)
+        assert loop is default
+    finally:
+        asyncio.set_event_loop(default)
+
+
+def test_run_remote_streamer_without_tracker() -> None:
+    result = runner.invoke(app, ["-s", "remote"])
+    assert result.exit_code != 0
+    assert "--tracker" in result.stdout
+
+    result = runner.invoke(app, ["--tracker", "xxx", "--tracker-port", "8001"])
+    assert result.exit_code != 0
+    assert "exclusive" in result.stdout
+
+
+@pytest.mark.timeout(20)
+def test_start_tracker(mocker) -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        mocker.patch("drudgeyer.cli.run.BASEDIR", Path(tempdir))
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+
+        # push log to tracker in child process
+        process, pipe = start_tracker(port)
+        logs = [
+            LogModel(id="xxx", log="a\n", seq=1),
+            LogModel(id="xxx", log="", end=True),
+        ]
+        pipe.send_bytes(json.dumps([log.dict() for log in logs]).encode())
+
+        text = None
+        while text != "a\n":
+            time.sleep(0.1)
+            try:
+                resp = requests.get(f"http://127.0.0.1:{port}/log-trace/xxx")
+            except requests.ConnectionError:
+                continue
+            text = resp.text if resp.status_code == 200 else None
+        assert (Path(tempdir) / "log" / "xxx").is_file()
+
+        # logs left in buffer are saved before tracker exits
+        pusher = PipeHandler(pipe)
+        pusher._put(LogModel(id="yyy", log="b\n", seq=1))
+        pusher._put(LogModel(id="yyy", log="", end=True))
+        stop_tracker(process, pusher)
+        assert process.exitcode == 0
+        assert b"b\n" in (Path(tempdir) / "log" / "yyy").read_bytes()
@@ -0,0 +1,64 @@
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import requests
+import typer
+from typer.testing import CliRunner
+
+from drudgeyer.cli.search import main
+from drudgeyer.log_tracker.record import encode_lines
+
+app = typer.Typer()
+app.command()(main)
+
+runner = CliRunner()
+
+
+class DummyResponse:
+    def __init__(self, status_code: int, body=None) -> None:
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+def test_search(mocker: mock):
+    with tempfile.TemporaryDirectory() as tempdir:
+        mocker.patch("drudgeyer.cli.search.BASEDIR", Path(tempdir))
+        logdir = Path(tempdir) / "log"
+        logdir.mkdir()
+        (logdir / "xxx").write_bytes(encode_lines("Hello\nworld\n")[0])
+
+        result = runner.invoke(app, ["world"])
+        assert result.exit_code == 0, result.stdout
+        assert result.stdout == "xxx:1: world\n"
+
+        result = runner.invoke(app, ["hello", "-i"])
+        assert result.stdout == "xxx:0: Hello\n"
+
+        result = runner.invoke(app, ["hello"])
+        assert result.exit_code == 1, result.stdout
+
+
+def test_search_url(mocker: mock):
+    body = [{"id": "xxx", "line": 2, "log": "found\n"}]
+    get = mocker.patch("requests.get", return_value=DummyResponse(200, body))
+    result = runner.invoke(app, ["found", "--url", "127.0.0.1:8000", "--limit", "5"])
+    assert result.exit_code == 0, result.stdout
+    assert result.stdout == "xxx:2: found\n"
+    assert get.call_args[0][0] == "http://127.0.0.1:8000/log-trace/search"
+    assert get.call_args[1]["params"] == {
+        "q": "found",
+        "ignore_case": "False",
+        "limit": "5",
+    }
+
+    mocker.patch("requests.get", return_value=DummyResponse(404))
+    result = runner.invoke(app, ["found", "--url", "127.0.0.1:8000"])
+    assert result.exit_code == 1, result.stdout
+
+    mocker.patch("requests.get", side_effect=requests.ConnectionError)
+    result = runner.invoke(app, ["found", "--url", "127.0.0.1:8000"])
+    assert result.exit_code == 1, result.stdout
@@ -0,0 +1,37 @@
+import tempfile
+from pathlib import Path
+
+import typer
+from typer.testing import CliRunner
+
+from drudgeyer.cli.tracker import main
+
+app = typer.Typer()
+app.command()(main)
+
+runner = CliRunner()
+
+
+def test_tracker(mocker):
+    with tempfile.TemporaryDirectory() as tempdir:
+        mocker.patch("drudgeyer.cli.tracker.BASEDIR", Path(tempdir))
+        served = []
+
+        async def serve() -> None:
+            served.append(True)
+
+        server = mocker.MagicMock()
+        server.serve = serve
+        run_receiver = mocker.patch(
+            "drudgeyer.log_tracker.broadcasting.run_receiver", return_value=server
+        )
+
+        result = runner.invoke(app, ["--host", "0.0.0.0", "--port", "8001"])
+        assert result.exit_code == 0, result.stdout
+        assert served == [True]
+
+        # serve logs pushed from runners
+        fastapi_app = run_receiver.call_args[0][0]
+        paths = {route.path for route in fastapi_app.routes}
+        assert {"/log-push", "/log-trace", "/log-trace/{id}"} <= paths
+        assert run_receiver.call_args[1] == {"host": "0.0.0.0", "port": 8001}
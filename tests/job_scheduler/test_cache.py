@@ -0,0 +1,76 @@
+import os
+import tempfile
+from pathlib import Path
+from time import sleep
+
+from drudgeyer.job_scheduler.cache import ResultCache
+from drudgeyer.job_scheduler.queue import BaseQueueModel
+
+
+def test_cache_key():
+    with tempfile.TemporaryDirectory() as f:
+        root = Path(f)
+        cache = ResultCache(root / "cache", env={"A": "1"})
+        dep1 = root / "dep1"
+        dep1.mkdir()
+        (dep1 / "a.txt").write_text("a")
+        dep2 = root / "dep2"
+        dep2.mkdir()
+        (dep2 / "a.txt").write_text("a")
+
+        task1 = BaseQueueModel(id="xxx1", order=0, command="echo 1", workdir=dep1)
+        task2 = BaseQueueModel(id="xxx2", order=0, command="echo 1", workdir=dep2)
+        # same command and dependency contents
+        assert cache.key(task1) == cache.key(task2)
+
+        # different command
+        task3 = BaseQueueModel(id="xxx3", order=0, command="echo 2", workdir=dep2)
+        assert cache.key(task1) != cache.key(task3)
+
+        # different dependency
+        (dep2 / "a.txt").write_text("b")
+        assert cache.key(task1) != cache.key(task2)
+
+        # different environment
+        other = ResultCache(root / "cache", env={"A": "2"})
+        assert cache.key(task1) != other.key(task1)
+
+        # inputs are unknown without dependency
+        task4 = BaseQueueModel(id="xxx4", order=0, command="echo 1")
+        assert cache.key(task4) is None
+
+
+def test_cache_get_put():
+    with tempfile.TemporaryDirectory() as f:
+        root = Path(f)
+        cache = ResultCache(root / "cache", max_entries=2)
+        task = BaseQueueModel(id="xxx", order=0, command="echo 1")
+        assert not cache.get("key1")
+
+        cache.put("key1", task)
+        assert cache.get("key1").id == "xxx"
+
+        # evict by size
+        sleep(0.01)
+        cache.put("key2", task)
+        sleep(0.01)
+        cache.put("key3", task)
+        assert not cache.get("key1")
+        assert cache.get("key2") and cache.get("key3")
+
+        # evict by age
+        cache = ResultCache(root / "cache", max_age=0.01)
+        sleep(0.02)
+        assert not cache.get("key2")
+        cache.put("key4", task)
+        assert os.listdir(root / "cache") == ["key4"]
+
+        # outputs of previous run are removed
+        dep = root / "dep"
+        dep.mkdir()
+        task = BaseQueueModel(id="yyy", order=0, command="echo 1", workdir=dep)
+        cache = ResultCache(root / "cache")
+        cache.put("key5", task)
+        assert cache.get("key5")
+        dep.rmdir()
+        assert not cache.get("key5")
@@ -0,0 +1,86 @@
+import tempfile
+from pathlib import Path
+from time import sleep
+
+from drudgeyer.job_scheduler.dependency import CopyDep
+from drudgeyer.job_scheduler.lease import LeaseManager, unpack_archive
+from drudgeyer.job_scheduler.queue import FileQueue, Status
+
+
+def test_lease():
+    with tempfile.TemporaryDirectory() as f:
+        queue = FileQueue(path=Path(f) / "queue")
+        leases = LeaseManager(queue, ttl=0.1)
+        queue.enqueue("cmd1")
+        queue.enqueue("cmd2")
+
+        # lease job
+        task = leases.lease("worker-a")
+        assert task.command == "cmd1"
+        assert queue.list(status=Status.doing)[0].id == task.id
+
+        # heartbeat by owner only
+        assert leases.heartbeat(task.id, "worker-a")
+        assert not leases.heartbeat(task.id, "worker-b")
+        assert not leases.heartbeat("xxx", "worker-a")
+
+        # complete by owner only
+        assert not leases.complete(task.id, "worker-b", Status.done)
+        assert leases.complete(task.id, "worker-a", Status.done)
+        assert queue.list(status=Status.done)[0].id == task.id
+        assert not leases.complete(task.id, "worker-a", Status.done)
+
+        # expired lease is re-queued
+        task = leases.lease("worker-a")
+        assert task.command == "cmd2"
+        sleep(0.15)
+        assert leases.expire() == [task.id]
+        assert queue.list(status=Status.todo)[0].id == task.id
+        assert not leases.heartbeat(task.id, "worker-a")
+
+        # re-leased to another worker
+        task = leases.lease("worker-b")
+        assert task.command == "cmd2"
+        assert not leases.lease("worker-a")
+
+        # revoke lease. preempted job is re-queued after the worker stops it
+        assert leases.cancel(task.id, preempt=True)
+        assert not leases.cancel(task.id, preempt=True)
+        assert not leases.heartbeat(task.id, "worker-b")
+        assert queue.list(status=Status.doing)[0].id == task.id
+        assert leases.complete(task.id, "worker-b", Status.todo)
+        assert queue.list(status=Status.todo)[0].id == task.id
+
+        # or when the lease expires
+        task = leases.lease("worker-b")
+        assert leases.cancel(task.id, preempt=True)
+        sleep(0.15)
+        assert leases.expire() == [task.id]
+        assert queue.list(status=Status.todo)[0].id == task.id
+        task = leases.lease("worker-b")
+        assert leases.cancel(task.id)
+        assert queue.list(status=Status.failed)[0].id == task.id
+        assert not leases.cancel(task.id)
+
+
+def test_lease_archive():
+    with tempfile.TemporaryDirectory() as f:
+        root = Path(f)
+        src = root / "src"
+        src.mkdir()
+        (src / "a.txt").write_text("a")
+
+        queue = FileQueue(path=root / "queue", depends=CopyDep(src, root / "dep"))
+        leases = LeaseManager(queue, depends=queue.depends)
+        queue.enqueue("cmd1")
+
+        # not leased yet
+        assert not leases.archive("xxx", root)
+
+        task = leases.lease("worker-a")
+        assert task.workdir == Path("src"), "relative to dependency"
+
+        archive = leases.archive(task.id, root)
+        assert archive.is_file()
+        unpack_archive(archive.read_bytes(), root / "remote")
+        assert (root / "remote" / "src" / "a.txt").read_text() == "a"
@@ -7,6 +7,7 @@ import pytest
 
 from drudgeyer.job_scheduler.dependency import BaseDep
 from drudgeyer.job_scheduler.queue import BaseQueueModel, FileQueue, Status
+from drudgeyer.metrics import QUEUE_DEQUEUED, QUEUE_ENQUEUED, QUEUE_JOBS, QUEUE_WAIT
 
 
 def assert_items(expected: List[str], items: List[BaseQueueModel]) -> bool:
@@ -126,3 +127,90 @@ def test_filequeue_status(_depends):
         assert len(queue.list()) == 2
         assert not queue.list(status=Status.done)
         assert not queue.list(status=Status.failed)
+
+
+def test_filequeue_retry():
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        queue = FileQueue(path=path.resolve())
+
+        queue.enqueue("cmd1", retries=2, backoff=0.1)
+
+        # first attempt failed. re-queued with delay
+        out = queue.dequeue()
+        assert out.attempt == 0 and out.retries == 2
+        queue.worked(out.id, Status.failed)
+        assert queue.list(status=Status.todo)[0].attempt == 1
+        assert not queue.dequeue(), "still backing off"
+        sleep(0.1)
+
+        # second attempt failed. delay is doubled
+        out = queue.dequeue()
+        assert out.attempt == 1
+        queue.worked(out.id, Status.failed)
+        sleep(0.1)
+        assert not queue.dequeue(), "still backing off"
+        sleep(0.1)
+
+        # retries exhausted
+        out = queue.dequeue()
+        assert out.attempt == 2
+        queue.worked(out.id, Status.failed)
+        assert queue.list(status=Status.failed)[0].id == out.id
+        assert not queue.list(status=Status.todo)
+
+        # no retry by default
+        queue.enqueue("cmd2")
+        out = queue.dequeue()
+        queue.worked(out.id, Status.failed)
+        assert len(queue.list(status=Status.failed)) == 2
+
+        # preempted job goes back to queue
+        queue.enqueue("cmd3", retries=1)
+        out = queue.dequeue()
+        queue.worked(out.id, Status.todo)
+        assert queue.list(status=Status.todo)[0].id == out.id
+
+        # cancelled job is not retried
+        out = queue.dequeue()
+        queue.worked(out.id, Status.failed, retry=False)
+        assert len(queue.list(status=Status.failed)) == 3
+
+        queue.prune()
+        assert not list(queue.meta.iterdir())
+
+
+def test_filequeue_metrics():
+    def depth():
+        return {status.name: QUEUE_JOBS.get(status=status.name) for status in Status}
+
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        FileQueue(path=path.resolve()).enqueue("cmd0")
+
+        # counted once at start
+        queue = FileQueue(path=path.resolve())
+        assert depth() == {"todo": 1, "doing": 0, "done": 0, "failed": 0}
+
+        enqueued, dequeued = QUEUE_ENQUEUED.get(), QUEUE_DEQUEUED.get()
+        waits = QUEUE_WAIT.count
+        queue.enqueue("cmd1")
+        out = queue.dequeue()
+        queue.worked(out.id, Status.done)
+        out = queue.dequeue()
+        queue.worked(out.id, Status.failed)
+        assert depth() == {"todo": 0, "doing": 0, "done": 1, "failed": 1}
+        assert QUEUE_ENQUEUED.get() - enqueued == 1
+        assert QUEUE_DEQUEUED.get() - dequeued == 2
+        assert QUEUE_WAIT.count - waits == 2
+
+        # job added by another process is found at dequeue
+        (path / "2000-01-01-00-00-00-000000").write_text("cmd2")
+        out = queue.dequeue()
+        assert QUEUE_ENQUEUED.get() - enqueued == 2
+        queue.requeue(out.id)
+        assert depth() == {"todo": 1, "doing": 0, "done": 1, "failed": 1}
+
+        queue.prune()
+        queue.pop(out.id)
+        assert depth() == {"todo": 0, "doing": 0, "done": 0, "failed": 0}
@@ -1,12 +1,33 @@
 import asyncio
+import json
+import socket
 import tempfile
+import time
 from asyncio import AbstractEventLoop
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator
 
 import pytest
+import websockets
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
+from uvicorn import Config, Server
 
+from drudgeyer.job_scheduler.lease import LeaseManager
+from drudgeyer.job_scheduler.queue import FileQueue, Status
 from drudgeyer.log_tracker import log_streamer
-from drudgeyer.log_tracker.broadcasting import LocalReadStreamer, create_app
+from drudgeyer.log_tracker.broadcasting import (
+    LocalReadStreamer,
+    LogWebSocketProtocol,
+    RingBuffer,
+    add_push_routes,
+    byte_range,
+    create_app,
+    stream_log,
+)
+from drudgeyer.log_tracker.record import FRAME_OFFSET
+from drudgeyer.metrics import LOG_DROPPED, QUEUE_ENQUEUED, WEBSOCKET_CLIENTS
 from drudgeyer.worker.logger import LogModel
 
 
@@ -140,6 +161,64 @@ def test_delete_internal_task(event_loop: AbstractEventLoop) -> None:
     event_loop.close()
 
 
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_ring_buffer():
+    ring = RingBuffer(size=3)
+    logs = [LogModel(id="xxx", log=f"{i}\n", seq=i + 1) for i in range(6)]
+    for log in logs[:2]:
+        ring.append(log)
+    assert await ring.read(0) == (logs[0], 1)
+    assert await ring.read(1) == (logs[1], 2)
+
+    # reader waits for next log
+    reader = asyncio.ensure_future(ring.read(2))
+    await asyncio.sleep(0.01)
+    assert not reader.done()
+    ring.append(logs[2])
+    assert await reader == (logs[2], 3)
+
+    # overwritten logs are skipped
+    for log in logs[3:]:
+        ring.append(log)
+    assert ring.tail == 3
+    assert await ring.read(1) == (None, 3)
+    assert await ring.read(3) == (logs[3], 4)
+
+    ring.close()
+    with pytest.raises(ValueError):
+        await ring.read(6)
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_shared_clients():
+    logstreamer = ToyLogStreamer([log_streamer.QueueHandler()])
+    read_streamer = LocalReadStreamer(logstreamer, buffer_size=2)
+    await read_streamer.add_client("xxx", "fast")
+    await read_streamer.add_client("xxx", "slow")
+    log = read_streamer._id_to_logqueue["xxx"]
+    assert log.targets == {"fast", "slow"}
+
+    for i in range(3):
+        logstreamer.msg = f"{i}\n"
+        await logstreamer.streaming()
+        await asyncio.sleep(0.01)
+        assert await read_streamer.get("fast") == f"{i}\n"
+
+    # slow client skips ahead, without delaying the others
+    assert await read_streamer.get("slow") == (
+        "-------------- 1 lines dropped -------------\n"
+    )
+    assert await read_streamer.get("slow") == "1\n"
+
+    # the job is streamed until the last client leaves
+    await read_streamer.delete("fast")
+    assert log.live and log.targets == {"slow"}
+    await read_streamer.delete("slow")
+    assert not log.live and not read_streamer._id_to_logqueue
+
+
 @pytest.mark.timeout(10)
 def test_log_trace() -> None:
     logstreamer = ToyLogStreamer([log_streamer.QueueHandler()])
@@ -163,9 +242,9 @@ def test_log_trace() -> None:
         future.result()
         future.cancel()
 
-        # successfully log tracked
+        # successfully log tracked, coalesced into a frame
         data = websocket.receive_text()
-        assert data == "test\n"
+        assert data == "test\ntest\n"
         websocket.close()
         # wait closing background process
 
@@ -174,6 +253,52 @@ def test_log_trace() -> None:
     assert not read_streamer._key_to_readqueue
 
 
+@pytest.mark.timeout(10)
+def test_log_trace_multiplex() -> None:
+    logstreamer = ToyLogStreamer([log_streamer.QueueHandler()])
+    read_streamer = LocalReadStreamer(logstreamer)
+    app = create_app(read_streamer)
+
+    async def flow(logstreamer: ToyLogStreamer) -> None:
+        for id in ["xxx", "yyy"]:
+            logstreamer.id = id
+            logstreamer.msg = f"{id}\n"
+            await logstreamer.streaming()
+
+    client = TestClient(app)
+    with client.websocket_connect("/log-trace/multiplex") as websocket:
+        subloop: AbstractEventLoop = websocket._loop
+        websocket.send_json({"subscribe": "xxx"})
+        websocket.send_json({"subscribe": "yyy", "tail": 10})
+        websocket.send_json({"subscribe": "zzz", "tail": -1})
+        assert "error" in websocket.receive_json()
+        while len(read_streamer._key_to_readqueue) < 2:
+            time.sleep(0.01)
+        # one pump per job
+        assert set(read_streamer._id_to_logqueue) == {"xxx", "yyy"}
+
+        future = asyncio.run_coroutine_threadsafe(flow(logstreamer), subloop)
+        future.result()
+
+        # frames are tagged with job
+        frames = sorted(
+            [websocket.receive_json(), websocket.receive_json()],
+            key=lambda frame: frame["id"],
+        )
+        assert [(frame["id"], frame["log"]) for frame in frames] == [
+            ("xxx", "xxx\n"),
+            ("yyy", "yyy\n"),
+        ]
+        assert all(frame["offset"] > 0 for frame in frames)
+
+        websocket.send_json({"unsubscribe": "xxx"})
+        while len(read_streamer._key_to_readqueue) > 1:
+            time.sleep(0.01)
+        websocket.close()
+
+    assert not read_streamer._key_to_readqueue
+
+
 @pytest.mark.timeout(1)
 @pytest.mark.asyncio
 async def test_preload():
@@ -216,6 +341,445 @@ async def test_preload():
         await asyncio.sleep(0.05)
         await read_streamer.add_client(id, key)
         data = await read_streamer.get(key)
-        assert data == "test\rtest\r\n", "\\r is not eliminated"
+        # progress updates in the interval are collapsed
+        assert data == "test\r\n", "\\r is not eliminated"
         data = await read_streamer.get(key)
         assert data == "-------------- loading -------------\n"
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_ring_buffer_dropped():
+    logstreamer = ToyLogStreamer([log_streamer.QueueHandler()])
+    read_streamer = LocalReadStreamer(logstreamer, buffer_size=2)
+    await read_streamer.add_client("xxx", "key")
+    dropped = LOG_DROPPED.get()
+
+    # overwritten before the client reads them
+    for i in range(5):
+        logstreamer.msg = f"{i}\n" * (i + 1)
+        await logstreamer.streaming()
+    await asyncio.sleep(0.01)
+    log = await read_streamer.get_batch("key")
+    assert log.log == (
+        "-------------- 6 lines dropped -------------\n" + "3\n" * 4 + "4\n" * 5
+    )
+    assert LOG_DROPPED.get() == dropped + 3
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_progress_after_text():
+    logstreamer = ToyLogStreamer([log_streamer.QueueHandler()])
+    read_streamer = LocalReadStreamer(logstreamer)
+    await read_streamer.add_client("xxx", "key")
+
+    # progress is held after the text in the same message, and sent later
+    for msg in ["a\n10%\r", "b\n20%\r"]:
+        logstreamer.msg = msg
+        await logstreamer.streaming()
+    await asyncio.sleep(0.15)
+    log = await read_streamer.get_batch("key")
+    assert log.log == "a\n10%\rb\n20%\r"
+
+
+def test_queue_api() -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        queue = FileQueue(path=Path(tempdir) / "queue")
+        leases = LeaseManager(queue)
+        logstreamer = ToyLogStreamer([log_streamer.QueueHandler()])
+        app = create_app(LocalReadStreamer(logstreamer), leases)
+        client = TestClient(app)
+
+        queue.enqueue("cmd1")
+        resp = client.post("/queue/lease", json={"worker": "a"})
+        assert resp.status_code == 200, resp.text
+        task = resp.json()
+        assert task["command"] == "cmd1"
+
+        # empty queue
+        resp = client.post("/queue/lease", json={"worker": "a"})
+        assert resp.json() is None
+
+        resp = client.post("/queue/heartbeat", json={"id": task["id"], "worker": "a"})
+        assert resp.status_code == 200, resp.text
+        resp = client.post("/queue/heartbeat", json={"id": task["id"], "worker": "b"})
+        assert resp.status_code == 404, resp.text
+
+        # no dependency
+        resp = client.get(f"/queue/dep/{task['id']}")
+        assert resp.status_code == 404, resp.text
+
+        body = {"id": task["id"], "worker": "a", "status": Status.failed.value}
+        resp = client.post("/queue/complete", json=body)
+        assert resp.status_code == 200, resp.text
+        assert queue.list(status=Status.failed)[0].id == task["id"]
+        resp = client.post("/queue/complete", json=body)
+        assert resp.status_code == 404, resp.text
+
+        # cancel leased job
+        queue.enqueue("cmd2")
+        task = client.post("/queue/lease", json={"worker": "a"}).json()
+        resp = client.post("/queue/cancel", json={"id": task["id"]})
+        assert resp.status_code == 200, resp.text
+        assert len(queue.list(status=Status.failed)) == 2
+        resp = client.post("/queue/cancel", json={"id": task["id"]})
+        assert resp.status_code == 404, resp.text
+
+    # queue API is disabled without lease manager
+    client = TestClient(create_app(LocalReadStreamer(logstreamer)))
+    resp = client.post("/queue/lease", json={"worker": "a"})
+    assert resp.status_code == 404, resp.text
+
+
+@pytest.mark.timeout(2)
+@pytest.mark.asyncio
+async def test_resume():
+    with tempfile.TemporaryDirectory() as tempdir:
+        file_handler = log_streamer.QueueFileHandler(tempdir)
+        logstreamer = ToyLogStreamer([log_streamer.QueueHandler(), file_handler])
+        read_streamer = LocalReadStreamer(logstreamer)
+        for i in range(3):
+            logstreamer.msg = f"{i}\n"
+            await logstreamer.streaming()
+        await asyncio.sleep(0.05)
+
+        # saved log with the last offset
+        await read_streamer.add_client("xxx", "a", offset=0)
+        log = await read_streamer.get_log("a")
+        assert log.log == "0\n1\n2\n"
+        last = log.seq
+        await read_streamer.delete("a")
+
+        # reconnect after the second log
+        records = await file_handler.get_records("xxx")
+        await read_streamer.add_client("xxx", "b", offset=records[1].seq)
+        log = await read_streamer.get_log("b")
+        assert (log.log, log.seq) == ("2\n", last)
+
+        # live log follows
+        logstreamer.msg = "3\n"
+        await logstreamer.streaming()
+        await asyncio.sleep(0.01)
+        log = await read_streamer.get_log("b")
+        assert log.log == "3\n" and log.seq > last
+
+
+@pytest.mark.timeout(2)
+@pytest.mark.asyncio
+async def test_get_batch():
+    logstreamer = ToyLogStreamer([log_streamer.QueueHandler()])
+    read_streamer = LocalReadStreamer(logstreamer)
+    await read_streamer.add_client("xxx", "key")
+
+    async def stream(n: int) -> None:
+        for i in range(n):
+            logstreamer.msg = f"{i}\n"
+            await logstreamer.streaming()
+        await asyncio.sleep(0.01)
+
+    # all lines available
+    await stream(3)
+    log = await read_streamer.get_batch("key")
+    assert log.log == "0\n1\n2\n"
+    assert log.seq == read_streamer._id_to_logqueue["xxx"].ring._buffer[2].seq
+
+    # up to max_size
+    await stream(3)
+    assert (await read_streamer.get_batch("key", max_size=4)).log == "0\n1\n"
+    assert (await read_streamer.get_batch("key", max_size=4)).log == "2\n"
+
+    # lines arriving within latency
+    await stream(1)
+    batch = asyncio.ensure_future(read_streamer.get_batch("key", latency=0.1))
+    await asyncio.sleep(0.01)
+    await stream(1)
+    assert (await batch).log == "0\n0\n"
+
+
+@pytest.mark.timeout(5)
+@pytest.mark.asyncio
+async def test_history_chunks():
+    with tempfile.TemporaryDirectory() as tempdir:
+        file_handler = log_streamer.QueueFileHandler(tempdir)
+        logstreamer = ToyLogStreamer([log_streamer.QueueHandler(), file_handler])
+        read_streamer = LocalReadStreamer(logstreamer)
+        line = "x" * 99 + "\n"
+        logstreamer.msg = line * 2000
+        await logstreamer.streaming()
+        await asyncio.sleep(0.05)
+
+        # saved log larger than a chunk arrives in pieces
+        await read_streamer.add_client("xxx", "a", offset=0)
+        logs = [await read_streamer.get_log("a")]
+        while len("".join(log.log for log in logs)) < len(line) * 2000:
+            logs.append(await read_streamer.get_log("a"))
+        assert len(logs) > 1
+        assert all(len(log.log) <= 2 ** 16 for log in logs)
+        assert "".join(log.log for log in logs) == line * 2000
+
+        # live log follows
+        logstreamer.msg = "end\n"
+        await logstreamer.streaming()
+        await asyncio.sleep(0.01)
+        assert (await read_streamer.get_batch("a")).log == "end\n"
+        await read_streamer.delete("a")
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-3", (0, 3)),
+        ("bytes=4-", (4, 9)),
+        ("bytes=5-100", (5, 9)),
+        ("bytes=-3", (7, 9)),
+        ("bytes=-100", (0, 9)),
+        ("bytes=0-1,4-5", None),
+        ("lines=0-1", None),
+        ("bytes=-", None),
+    ],
+)
+def test_byte_range(header, expected):
+    assert byte_range(header, 10) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=10-", "bytes=3-2", "bytes=-0"])
+def test_byte_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        byte_range(header, 10)
+
+
+def test_log_download(event_loop: AbstractEventLoop):
+    with tempfile.TemporaryDirectory() as tempdir:
+        logstreamer = ToyLogStreamer(
+            [log_streamer.QueueHandler(), log_streamer.QueueFileHandler(tempdir)]
+        )
+        logstreamer.msg = "0123\n4567\n"
+
+        async def stream() -> None:
+            await logstreamer.streaming()
+            await asyncio.sleep(0.05)
+
+        event_loop.run_until_complete(stream())
+        client = TestClient(create_app(LocalReadStreamer(logstreamer)))
+
+        resp = client.get("/log-trace/xxx")
+        assert resp.status_code == 200
+        assert resp.text == "0123\n4567\n"
+        assert resp.headers["accept-ranges"] == "bytes"
+
+        resp = client.get("/log-trace/xxx", headers={"Range": "bytes=3-6"})
+        assert resp.status_code == 206
+        assert resp.text == "3\n45"
+        assert resp.headers["content-range"] == "bytes 3-6/10"
+
+        resp = client.get("/log-trace/xxx", headers={"Range": "bytes=-2"})
+        assert (resp.status_code, resp.text) == (206, "7\n")
+
+        resp = client.get("/log-trace/xxx", headers={"Range": "bytes=10-"})
+        assert resp.status_code == 416
+        assert resp.headers["content-range"] == "bytes */10"
+
+        assert client.get("/log-trace/yyy").status_code == 404
+
+
+def test_log_search(event_loop: AbstractEventLoop):
+    with tempfile.TemporaryDirectory() as tempdir:
+        logstreamer = ToyLogStreamer(
+            [log_streamer.QueueHandler(), log_streamer.QueueFileHandler(tempdir)]
+        )
+        logstreamer.msg = "Hello\nWorld\n"
+        event_loop.run_until_complete(logstreamer.streaming())
+        client = TestClient(create_app(LocalReadStreamer(logstreamer)))
+
+        resp = client.get("/log-trace/search", params={"q": "orld"})
+        assert resp.status_code == 200
+        assert resp.json() == [{"id": "xxx", "line": 1, "log": "World\n"}]
+
+        params = {"q": "HELLO", "ignore_case": True}
+        resp = client.get("/log-trace/search", params=params)
+        assert [hit["line"] for hit in resp.json()] == [0]
+        assert client.get("/log-trace/search", params={"q": "HELLO"}).json() == []
+        assert client.get("/log-trace/search").status_code == 422
+
+
+@pytest.mark.timeout(2)
+@pytest.mark.asyncio
+async def test_stream_log():
+    with tempfile.TemporaryDirectory() as tempdir:
+        logstreamer = ToyLogStreamer(
+            [log_streamer.QueueHandler(), log_streamer.QueueFileHandler(tempdir)]
+        )
+        read_streamer = LocalReadStreamer(logstreamer)
+        logstreamer.msg = "0\n"
+        await logstreamer.streaming()
+        await asyncio.sleep(0.05)
+
+        # chunked plain text
+        events = stream_log(read_streamer, "xxx", "a", offset=0)
+        assert await events.__anext__() == "0\n"
+        logstreamer.msg = "1\n"
+        await logstreamer.streaming()
+        await asyncio.sleep(0.01)
+        assert await events.__anext__() == "1\n"
+        await events.aclose()
+        assert "a" not in read_streamer._key_to_readqueue
+
+        # server-sent events, resumed after the first log
+        await read_streamer._file.flush()
+        records = await read_streamer._file.get_records("xxx")
+        events = stream_log(read_streamer, "xxx", "b", offset=records[0].seq, sse=True)
+        event = await events.__anext__()
+        id, data = event.rstrip("\n").split("\n")
+        assert id == f"id: {records[1].seq}"
+        assert json.loads(data[len("data: ") :]) == {
+            "offset": records[1].seq,
+            "log": "1\n",
+        }
+        await events.aclose()
+
+
+@asynccontextmanager
+async def serve(app: FastAPI) -> AsyncIterator[int]:
+    """serve app with uvicorn on a free port"""
+    server = Server(Config(app=app, ws=LogWebSocketProtocol, log_level="error"))
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    task = asyncio.ensure_future(server.serve(sockets=[sock]))
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        server.should_exit = True
+        await task
+
+
+@pytest.mark.timeout(5)
+@pytest.mark.asyncio
+async def test_websocket_deflate_binary():
+    with tempfile.TemporaryDirectory() as tempdir:
+        logstreamer = ToyLogStreamer(
+            [log_streamer.QueueHandler(), log_streamer.QueueFileHandler(tempdir)]
+        )
+        logstreamer.msg = "epoch 1: loss 0.1\n" * 100
+        await logstreamer.streaming()
+        await asyncio.sleep(0.05)
+
+        app = create_app(LocalReadStreamer(logstreamer))
+        async with serve(app) as port:
+            url = f"ws://127.0.0.1:{port}/log-trace?id=xxx&offset=0&binary=true"
+            async with websockets.connect(url, compression="deflate") as ws:
+                assert [type(ext).__name__ for ext in ws.extensions] == [
+                    "PerMessageDeflate"
+                ]
+                frame = await ws.recv()
+
+        assert isinstance(frame, bytes)
+        (seq,) = FRAME_OFFSET.unpack_from(frame)
+        assert seq > 0
+        assert frame[FRAME_OFFSET.size :] == logstreamer.msg.encode()
+
+
+@pytest.mark.timeout(5)
+@pytest.mark.asyncio
+async def test_log_push():
+    with tempfile.TemporaryDirectory() as tempdir:
+        file_handler = log_streamer.QueueFileHandler(tempdir)
+        tracker = log_streamer.TrackerLogStreamer(
+            [file_handler, log_streamer.QueueHandler()]
+        )
+        app = create_app(LocalReadStreamer(tracker))
+        add_push_routes(app, tracker)
+        streaming = asyncio.ensure_future(tracker.entry_point())
+
+        async with serve(app) as port:
+            # runner side
+            pusher = log_streamer.PushHandler(f"127.0.0.1:{port}", latency=0)
+            pushing = asyncio.ensure_future(pusher.entry_point())
+            for i in range(3):
+                await pusher.send(LogModel(id="xxx", log=f"{i}\n", seq=i + 1))
+            await pusher.close("xxx")
+            while not file_handler.exists("xxx") or "xxx" in file_handler.paths:
+                await asyncio.sleep(0.01)
+            pushing.cancel()
+        streaming.cancel()
+
+        # tracker saved log of the job, and closed it at the end
+        await file_handler.flush()
+        assert await file_handler.get_record("xxx") == "0\n1\n2\n\n"
+
+
+@pytest.mark.timeout(5)
+@pytest.mark.asyncio
+async def test_log_push_invalid(caplog):
+    tracker = log_streamer.TrackerLogStreamer([log_streamer.QueueHandler()])
+    app = FastAPI()
+    add_push_routes(app, tracker)
+
+    async def push(data: str) -> int:
+        async with websockets.connect(f"ws://127.0.0.1:{port}/log-push") as ws:
+            await ws.send(data)
+            await ws.wait_closed()
+            return ws.close_code
+
+    async with serve(app) as port:
+        assert await push("[") == 1007
+        assert await push('[{"log": "no id"}]') == 1003
+
+        # unexpected error is logged
+        tracker._queue = None
+        assert await push('[{"id": "xxx", "log": ""}]') == 1011
+        assert "failed to receive logs" in caplog.text
+
+
+def test_app_without_log_routes():
+    # logs of the runner are served by log tracker
+    client = TestClient(create_app(None))
+    assert client.get("/log-trace/xxx").status_code == 404
+
+
+def test_metrics():
+    with TestClient(create_app(None)) as client:
+        resp = client.get("/metrics")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+        for name in [
+            "drudgeyer_queue_jobs",
+            "drudgeyer_job_run_seconds_bucket",
+            "drudgeyer_log_dropped_total",
+            "drudgeyer_websocket_clients",
+            "drudgeyer_event_loop_lag_seconds",
+        ]:
+            assert f"# TYPE {name.replace('_bucket', '')} " in resp.text
+
+
+def test_metrics_queue():
+    with tempfile.TemporaryDirectory() as tempdir:
+        queue = FileQueue(Path(tempdir))
+        enqueued = QUEUE_ENQUEUED.get()
+        with TestClient(create_app(None, queue=queue)) as client:
+            # job added by another process is counted at scrape
+            (Path(tempdir) / "2000-01-01-00-00-00-000000").write_text("cmd")
+            resp = client.get("/metrics")
+            assert 'drudgeyer_queue_jobs{status="todo"} 1' in resp.text
+            assert QUEUE_ENQUEUED.get() - enqueued == 1
+
+
+def test_metrics_websocket_cancelled(event_loop: AbstractEventLoop):
+    class CancelledWebSocket:
+        async def accept(self) -> None:
+            pass
+
+        async def receive_text(self) -> str:
+            raise asyncio.CancelledError
+
+    app = FastAPI()
+    add_push_routes(app, log_streamer.TrackerLogStreamer([log_streamer.QueueHandler()]))
+    (endpoint,) = [r.endpoint for r in app.routes if r.path == "/log-push"]
+
+    # connection is cancelled on shutdown
+    clients = WEBSOCKET_CLIENTS.get(route="/log-push")
+    with pytest.raises(asyncio.CancelledError):
+        event_loop.run_until_complete(endpoint(CancelledWebSocket()))
+    assert WEBSOCKET_CLIENTS.get(route="/log-push") == clients
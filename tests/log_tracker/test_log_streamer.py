@@ -1,13 +1,20 @@
 import asyncio
+import json
+import multiprocessing
 import tempfile
+import threading
+import time
 from asyncio.events import AbstractEventLoop
 from pathlib import Path
 from signal import SIGINT
+from typing import Any, Iterator, List
 
 import pytest
+from pydantic import parse_raw_as
 
 from drudgeyer.log_tracker import log_streamer
-from drudgeyer.worker.logger import LogModel, StreamingLogger
+from drudgeyer.log_tracker.record import LogRecord, read_records
+from drudgeyer.worker.logger import LogModel, LogWriter, StreamingLogger
 
 
 class ToyHandler(log_streamer.BaseHandler):
@@ -55,6 +62,12 @@ def test_baselogstreamer(capsys, event_loop: AbstractEventLoop) -> None:
     captured = capsys.readouterr()
     assert captured.out == "toy-test\n"
 
+    # end of stream is not sent as log
+    _streamer.send(LogModel(id="xxx", log="", end=True))
+    event_loop.run_until_complete(asyncio.sleep(0.01))
+    captured = capsys.readouterr()
+    assert captured.out == ""
+
     _streamer = ToyLogStreamer([ToyHandler()])
     # exit mode
     _streamer.handle_exit(SIGINT, None)
@@ -111,18 +124,28 @@ def test_queuefilehandler(event_loop: AbstractEventLoop) -> None:
         handler = log_streamer.QueueFileHandler(str(logdir.resolve()))
         event_loop.run_until_complete(workflow(handler))
 
-        with (logdir / "xxx").open() as fx:
-            assert fx.read() == "test-x\\n"
-        with (logdir / "yyy").open() as fy:
-            assert fy.read() == "test-y\\n"
-        with (logdir / "zzz").open() as fz:
-            assert fz.read() == "test-z\\n"
+        def read(id: str) -> List[str]:
+            data = (logdir / id).read_bytes()
+            return [record.text for record in read_records([data])]
+
+        assert read("xxx") == ["test-x\n"]
+        assert read("yyy") == ["test-y\n"]
+        assert read("zzz") == ["test-z\n"]
+
+        async def close(handler):
+            # end of stream closes the file
+            await handler.close("yyy")
+            await handler.send(LogModel(id="yyy", log="test-y\n"))
+            await asyncio.sleep(0.3)
+
+        event_loop.run_until_complete(close(handler))
+        assert read("yyy") == ["test-y\n", "test-y\n"]
 
         async def delete(handler):
-            # do nohing
             await handler.delete("xxx")
 
         event_loop.run_until_complete(delete(handler))
+        assert not (logdir / "xxx").is_file()
 
 
 def test_queue_handler(event_loop: AbstractEventLoop) -> None:
@@ -130,8 +153,8 @@ def test_queue_handler(event_loop: AbstractEventLoop) -> None:
     event_loop.run_until_complete(workflow(handler))
 
     queues = handler._queues
-    assert queues.get("xxx").get_nowait() == "test-x\n"
-    assert queues.get("yyy").get_nowait() == "test-y\n"
+    assert queues.get("xxx").get_nowait().log == "test-x\n"
+    assert queues.get("yyy").get_nowait().log == "test-y\n"
     assert not queues.get("zzz")
 
     async def delete(handler):
@@ -142,3 +165,336 @@ def test_queue_handler(event_loop: AbstractEventLoop) -> None:
 
     event_loop.run_until_complete(delete(handler))
     assert not queues.get("xxx")
+
+
+def test_queuefilehandler_segments(event_loop: AbstractEventLoop) -> None:
+    with tempfile.TemporaryDirectory() as f:
+        logdir = Path(f) / "log"
+        writer = LogWriter(segment_size=8)
+        handler = log_streamer.QueueFileHandler(str(logdir.resolve()), writer)
+
+        async def flow() -> None:
+            for _ in range(3):
+                await handler.send(LogModel(id="xxx", log="test\n"))
+                writer.flush()
+            # decompressed transparently
+            assert await handler.get_record("xxx") == "test\n" * 3 + "\n"
+
+            await handler.delete("xxx")
+            assert not list(logdir.iterdir())
+
+        event_loop.run_until_complete(flow())
+
+
+@pytest.mark.timeout(2)
+@pytest.mark.asyncio
+async def test_queuefilehandler_concurrent_add() -> None:
+    with tempfile.TemporaryDirectory() as f:
+        handler = log_streamer.QueueFileHandler(f, LogWriter())
+        await handler.send(LogModel(id="xxx", log="0\n", seq=1))
+        await handler.close("xxx")
+        await handler.flush()
+
+        # the first sends of retried job wait for the same log to be added
+        logs = [LogModel(id="xxx", log=f"{i}\n", seq=i + 1) for i in range(1, 4)]
+        await asyncio.gather(*[handler.send(log) for log in logs])
+        assert handler.indexes["xxx"].lines == 4
+        await handler.flush()
+        assert await handler.get_record("xxx") == "0\n1\n2\n3\n\n"
+
+        # closed while it is added
+        await handler.close("xxx")
+        sending = asyncio.ensure_future(
+            handler.send(LogModel(id="xxx", log="4\n", seq=5))
+        )
+        await asyncio.sleep(0)
+        await handler.close("xxx")
+        await sending
+        assert not handler.paths and not handler.indexes and not handler._adding
+        await handler.flush()
+        assert (await handler.get_record("xxx")).endswith("3\n4\n\n")
+
+
+@pytest.mark.timeout(2)
+@pytest.mark.asyncio
+async def test_iter_records_cancelled(mocker) -> None:
+    closed = threading.Event()
+
+    def iter_read(*args: Any) -> Iterator[List[LogRecord]]:
+        try:
+            while True:
+                time.sleep(0.05)
+                yield [LogRecord(b"test\n")]
+        finally:
+            closed.set()
+
+    mocker.patch.object(log_streamer.LogIndex, "iter_read", iter_read)
+    with tempfile.TemporaryDirectory() as f:
+        handler = log_streamer.QueueFileHandler(f, LogWriter())
+        (Path(f) / "xxx").touch()
+
+        async def read() -> None:
+            async for _ in handler.iter_records("xxx"):
+                pass
+
+        # cancelled while the chunk is read in thread pool
+        task = asyncio.ensure_future(read())
+        await asyncio.sleep(0.07)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # and closed after the chunk is read
+        while not closed.is_set():
+            await asyncio.sleep(0.01)
+
+
+def test_logindex(event_loop: AbstractEventLoop) -> None:
+    with tempfile.TemporaryDirectory() as f:
+        logdir = Path(f) / "log"
+        writer = LogWriter(segment_size=64)
+        handler = log_streamer.QueueFileHandler(str(logdir.resolve()), writer)
+
+        async def flow() -> None:
+            await handler.add("xxx")
+            handler.indexes["xxx"].every = 3
+            for i in range(10):
+                await handler.send(LogModel(id="xxx", log=f"line-{i}\n", seq=i + 1))
+            # saved without escaping
+            await handler.send(LogModel(id="xxx", log="a\\nb\r", seq=11))
+            writer.flush()
+            assert handler.indexes["xxx"].lines == 11
+
+            # sparse index across rolled segments
+            index = log_streamer.LogIndex(logdir / "xxx", writer)
+            assert index.entries() == [(0, 0, 0), (3, 84, 4), (6, 168, 7), (9, 252, 10)]
+
+            record = await handler.get_record("xxx", start=8)
+            assert record == "line-8\nline-9\na\\nb\r\n"
+            record = await handler.get_record("xxx", tail=2)
+            assert record == "line-9\na\\nb\r\n"
+            record = await handler.get_record("xxx", tail=5)
+            assert record == "line-6\nline-7\nline-8\nline-9\na\\nb\r\n"
+            assert await handler.get_record("xxx", start=20) == "\n"
+            assert await handler.get_record("yyy", tail=1) is None
+
+            # resume after sequence number
+            records = await handler.get_records("xxx", after=8)
+            assert [record.seq for record in records] == [9, 10, 11]
+            assert records[0].text == "line-8\n"
+            assert await handler.get_records("xxx", after=11) == []
+
+            # counters are restored for the log of previous run
+            await handler.close("xxx")
+            writer.flush()
+            await handler.add("xxx")
+            assert handler.indexes["xxx"].lines == 11
+            assert handler.indexes["xxx"].size == 306
+
+            await handler.delete("xxx")
+            assert not list(logdir.iterdir())
+
+        event_loop.run_until_complete(flow())
+
+
+@pytest.mark.asyncio
+async def test_logindex_bytes(mocker) -> None:
+    with tempfile.TemporaryDirectory() as f:
+        writer = LogWriter()
+        handler = log_streamer.QueueFileHandler(f, writer)
+        await handler.add("xxx")
+        handler.indexes["xxx"].every = 3
+        for i in range(10):
+            await handler.send(LogModel(id="xxx", log=f"line-{i}\n", seq=i + 1))
+        await handler.close("xxx")
+        await handler.flush()
+
+        index = log_streamer.LogIndex(Path(f) / "xxx", writer)
+        assert index.text_entries() == [(0, 0), (21, 84), (42, 168), (63, 252)]
+        iter_log = mocker.spy(log_streamer.LogIndex, "_iter")
+
+        # size is taken from the index, and range is read from the entry before it
+        assert await handler.get_size("xxx") == 70
+        chunks = [chunk async for chunk in handler.iter_bytes("xxx", 45, 50)]
+        assert b"".join(chunks) == b"e-6\nli"
+        assert [call[0][1] for call in iter_log.call_args_list] == [168]
+
+        # index of old format is not used
+        index.index_path.write_text("3 84 4\n")
+        assert await handler.get_size("xxx") == 70
+        chunks = [chunk async for chunk in handler.iter_bytes("xxx", 45, 50)]
+        assert b"".join(chunks) == b"e-6\nli"
+        assert iter_log.call_args_list[-1][0][1] == 0
+
+
+class CollectHandler(log_streamer.BaseHandler):
+    progress_interval = 0.5
+
+    def __init__(self) -> None:
+        self.logs: List[str] = []
+
+    async def send(self, log: LogModel) -> None:
+        self.logs.append(log.log)
+
+    async def add(self, id: str) -> None:
+        ...  # pragma: no cover
+
+    async def delete(self, id: str) -> None:
+        ...  # pragma: no cover
+
+
+def test_progress_collapser(event_loop: AbstractEventLoop) -> None:
+    handler = CollectHandler()
+    streamer = ToyLogStreamer([handler, ToyHandler()])
+
+    async def flow() -> None:
+        def send(log: str, end: bool = False) -> None:
+            streamer.send(LogModel(id="xxx", log=log, end=end))
+
+        # the first progress is sent, and following ones are collapsed
+        send("start\n10%\r")
+        send("20%\r")
+        send("30%\r40%\r")
+        await asyncio.sleep(0.01)
+        assert handler.logs == ["start\n10%\r"]
+
+        # the latest progress is sent after the interval
+        await asyncio.sleep(0.6)
+        assert handler.logs == ["start\n10%\r", "40%\r"]
+
+        # "\r\n" is not progress
+        send("50%\r")
+        send("\ndone\n")
+        await asyncio.sleep(0.01)
+        assert handler.logs[2:] == ["50%\r\ndone\n"]
+
+        # the last progress is sent at the end of stream
+        send("60%\r")
+        send("70%\r")
+        send("", end=True)
+        await asyncio.sleep(0.01)
+        assert handler.logs[3:] == ["70%\r"]
+        assert streamer._collapsers[id(handler)].collapsed == 3
+
+    event_loop.run_until_complete(flow())
+
+
+class FailingWebSocket:
+    def __init__(self, fails: int = 0) -> None:
+        self.fails = fails
+        self.sent: List[List[dict]] = []
+
+    async def send(self, data: str) -> None:
+        if self.fails:
+            self.fails -= 1
+            raise OSError()
+        self.sent.append(json.loads(data))
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_push_handler() -> None:
+    handler = log_streamer.PushHandler("xxx", maxsize=3, max_batch=2, latency=0)
+    for i in range(4):
+        await handler.send(LogModel(id="xxx", log=f"{i}\n", seq=i + 1))
+    await handler.close("xxx")
+    # the oldest is dropped while disconnected
+    assert handler.dropped == 2
+
+    # batch is kept until sent
+    ws = FailingWebSocket(fails=1)
+    with pytest.raises(OSError):
+        await handler.push(ws)
+    task = asyncio.ensure_future(handler.push(ws))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    assert [[log["log"] for log in batch] for batch in ws.sent] == [
+        ["2\n"],
+        ["3\n"],
+        [""],
+    ]
+    # end of job is pushed
+    assert ws.sent[-1][0]["end"]
+
+
+@pytest.mark.asyncio
+async def test_push_handler_keeps_end() -> None:
+    handler = log_streamer.PushHandler("xxx", maxsize=2)
+    await handler.send(LogModel(id="xxx", log="0\n", seq=1))
+    await handler.close("xxx")
+    for i in range(3):
+        await handler.send(LogModel(id="yyy", log=f"{i}\n", seq=i + 1))
+    # end of job is not dropped, even if it is the oldest
+    assert [(log.id, log.end) for log in handler._buffer] == [
+        ("xxx", True),
+        ("yyy", False),
+    ]
+    assert handler.dropped == 3
+
+    await handler.close("yyy")
+    await handler.close("zzz")
+    assert [log.end for log in handler._buffer] == [True, True, True]
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_tracker_log_streamer(capsys) -> None:
+    streamer = log_streamer.TrackerLogStreamer([ToyHandler()])
+    logs = [LogModel(id="xxx", log=f"{i}\n", seq=i + 1) for i in range(3)]
+    await streamer.push(logs[:2])
+    # pushed again after reconnecting
+    await streamer.push(logs[1:])
+    await streamer.push([LogModel(id="xxx", log="", end=True)])
+    for _ in range(3):
+        await streamer.streaming()
+    await asyncio.sleep(0.01)
+    assert capsys.readouterr().out == "toy-0\ntoy-1\ntoy-2\n"
+    assert (await streamer.recv()).end
+    assert not streamer._received
+
+
+class TrackerWebSocket:
+    def __init__(self, tracker: log_streamer.TrackerLogStreamer) -> None:
+        self.tracker = tracker
+
+    async def send(self, data: str) -> None:
+        await self.tracker.push(parse_raw_as(List[LogModel], data))
+
+
+@pytest.mark.timeout(2)
+@pytest.mark.asyncio
+async def test_tracker_progress() -> None:
+    handler = CollectHandler()
+    handler.progress_interval = None
+    tracker = log_streamer.TrackerLogStreamer([handler])
+    pusher = log_streamer.PushHandler("xxx", latency=0)
+    runner = ToyLogStreamer([pusher])
+    streaming = asyncio.ensure_future(tracker.entry_point())
+    pushing = asyncio.ensure_future(pusher.push(TrackerWebSocket(tracker)))
+
+    # progress held in the runner follows the text in the same batch
+    runner.send(LogModel(id="xxx", log="a\n10%\r"))
+    runner.send(LogModel(id="xxx", log="b\n20%\r"))
+    await asyncio.sleep(0.2)
+    pushing.cancel()
+    streaming.cancel()
+    assert handler.logs == ["a\n10%\r", "b\n", "20%\r"]
+
+
+@pytest.mark.timeout(2)
+@pytest.mark.asyncio
+async def test_pipe_handler(capsys) -> None:
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    handler = log_streamer.PipeHandler(writer, latency=0)
+    streamer = log_streamer.TrackerLogStreamer([ToyHandler()])
+    pushing = asyncio.ensure_future(handler.entry_point())
+    pulling = asyncio.ensure_future(streamer.pull(reader))
+
+    await handler.send(LogModel(id="xxx", log="test\n", seq=1))
+    await streamer.streaming()
+    await asyncio.sleep(0.01)
+    assert capsys.readouterr().out == "toy-test\n"
+
+    # tracker stops pulling when runner exits
+    pushing.cancel()
+    writer.close()
+    await asyncio.wait_for(pulling, 1)
@@ -0,0 +1,56 @@
+from drudgeyer.log_tracker.record import (
+    HEADER,
+    LogRecord,
+    RecordReader,
+    Stream,
+    count_records,
+    encode_lines,
+    read_records,
+    skip_records,
+)
+
+
+def test_encode_lines() -> None:
+    data, lines = encode_lines("a\\nb\nprogress\rdone", timestamp=1.5)
+    assert lines == 3
+    records = list(read_records([data]))
+    assert [record.text for record in records] == ["a\\nb\n", "progress\r", "done"]
+    assert all(record.timestamp == 1.5 for record in records)
+    assert all(record.stream == Stream.stdout for record in records)
+
+    assert encode_lines("") == (b"", 0)
+
+    # only "\n", "\r\n" and "\r" end lines
+    data, lines = encode_lines("form\x0cfeed\u2028\r\n\n\x1c")
+    records = list(read_records([data]))
+    assert [record.text for record in records] == [
+        "form\x0cfeed\u2028\r\n",
+        "\n",
+        "\x1c",
+    ]
+
+
+def test_record_reader() -> None:
+    record = LogRecord("é\n".encode(), 2.0, Stream.stderr)
+    data = record.encode() * 2
+    assert len(data) == 2 * (HEADER.size + 3)
+
+    # frame split into chunks
+    reader = RecordReader()
+    assert reader.feed(data[:5]) == []
+    assert reader.pending == 5
+    assert reader.feed(data[5 : HEADER.size + 4]) == [record]
+    assert reader.feed(data[HEADER.size + 4 :]) == [record]
+    assert reader.pending == 0
+
+
+def test_skip_count() -> None:
+    data, _ = encode_lines("a\nbb\nccc\n")
+    assert skip_records(data, 0) == 0
+    assert skip_records(data, 1) == HEADER.size + 2
+    assert skip_records(data, 3) == len(data)
+    assert skip_records(data, 4) == -1
+
+    # incomplete frame at the end is not counted
+    assert count_records(data) == (3, len(data))
+    assert count_records(data[:-1]) == (2, len(data) - HEADER.size - 4)
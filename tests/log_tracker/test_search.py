@@ -0,0 +1,156 @@
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from drudgeyer.log_tracker import log_streamer
+from drudgeyer.log_tracker.record import encode_lines
+from drudgeyer.log_tracker.search import (
+    BITS,
+    INDEXER,
+    TrigramIndex,
+    pattern_trigrams,
+    search,
+    trigrams,
+)
+from drudgeyer.worker.logger import LogModel, LogWriter, log_size
+
+
+def test_trigrams():
+    assert trigrams(b"ab") == set()
+    assert trigrams(b"abcd") == trigrams(b"ABCD")
+    assert len(trigrams(b"abcd")) == 2
+    assert all(0 <= bit < BITS for bit in trigrams(b"drudgeyer"))
+    # taken in words of pattern
+    bits = pattern_trigrams(b"out of memory")
+    assert bits == trigrams(b"out") | trigrams(b"memory")
+    assert bits <= trigrams(b"CUDA out of memory")
+
+
+def test_trigram_index():
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = Path(tempdir) / "xxx"
+        path.write_bytes(encode_lines("hello\n")[0])
+        index = TrigramIndex(path, every=2 ** 10)
+        index.catch_up()
+        assert index.index_path.stat().st_size == index.size
+        assert index.indexed() == path.stat().st_size
+        assert index.contains(pattern_trigrams(b"hello"))
+        assert not index.contains(pattern_trigrams(b"world"))
+
+        # caught up in the indexer thread every 1 KiB written
+        data = encode_lines("world\n" * 100)[0]
+        with path.open("ab") as f:
+            f.write(data)
+        index.update(data[:100])
+        INDEXER.flush()
+        assert index.indexed() < path.stat().st_size
+        index.update(data[100:])
+        INDEXER.flush()
+        assert index.contains(pattern_trigrams(b"world"))
+        assert index.indexed() == path.stat().st_size
+
+        # and on close
+        with path.open("ab") as f:
+            f.write(encode_lines("again\n")[0])
+        index.update(None)
+        INDEXER.flush()
+        assert index.contains(pattern_trigrams(b"again"))
+
+
+def test_trigram_index_chunks():
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = Path(tempdir) / "xxx"
+        writer = LogWriter(segment_size=100, max_head=100, max_tail=100)
+        for i in range(40):
+            writer.write(path, encode_lines(f"line{i} abcdefghij\n")[0])
+            writer.flush()
+        path.write_bytes(path.read_bytes() + b"unterminated")
+
+        # words across chunks are kept, and gaps are skipped
+        index = TrigramIndex(path)
+        index.catch_up(chunksize=16)
+        assert index.contains(pattern_trigrams(b"abcdefghij line0"))
+        assert index.contains(pattern_trigrams(b"line39"))
+        assert not index.contains(pattern_trigrams(b"line20"))
+        # the last word may be written in part
+        assert index.indexed() == log_size(path) - len(b"unterminated")
+
+
+def test_search_not_indexed():
+    with tempfile.TemporaryDirectory() as tempdir:
+        path = Path(tempdir) / "xxx"
+        path.write_bytes(encode_lines("hello\n")[0])
+        index = TrigramIndex(path)
+        index.catch_up()
+
+        # saved, but not indexed yet
+        with path.open("ab") as f:
+            f.write(encode_lines("world\n")[0])
+        assert not index.contains(pattern_trigrams(b"world"))
+        assert [hit.line for hit in search(Path(tempdir), "world")] == [1]
+
+        # bitmap of old format is rebuilt
+        index.index_path.write_bytes(bytes(BITS // 8))
+        assert index.indexed() is None
+        assert [hit.line for hit in search(Path(tempdir), "hello")] == [0]
+        assert index.indexed() == path.stat().st_size
+
+
+def test_search():
+    with tempfile.TemporaryDirectory() as tempdir:
+        logdir = Path(tempdir)
+        for id, log in [("a", "foo bar\nbaz\n"), ("b", "Foo\nfoofoo\n")]:
+            (logdir / id).write_bytes(encode_lines(log)[0])
+
+        # index is built for logs saved before indexing
+        hits = search(logdir, "foo")
+        assert [(hit.id, hit.line) for hit in hits] == [("b", 1), ("a", 0)]
+        assert (logdir / "a.tri").is_file()
+        assert hits[0].log == "foofoo\n"
+
+        hits = search(logdir, "FOO", ignore_case=True)
+        assert [(hit.id, hit.line) for hit in hits] == [("b", 0), ("b", 1), ("a", 0)]
+        assert len(search(logdir, "foo", limit=1)) == 1
+        # shorter than trigram
+        assert [hit.line for hit in search(logdir, "z")] == [1]
+        assert search(logdir, "qux") == []
+        assert search(logdir / "none", "foo") == []
+
+
+@pytest.mark.asyncio
+async def test_queue_file_handler_index():
+    with tempfile.TemporaryDirectory() as tempdir:
+        writer = LogWriter()
+        handler = log_streamer.QueueFileHandler(tempdir, writer)
+        await handler.send(LogModel(id="xxx", log="first line\n"))
+        await handler.close("xxx")
+        await handler.flush()
+        INDEXER.flush()
+
+        # caught up when log is closed
+        index = TrigramIndex(Path(tempdir) / "xxx")
+        assert index.indexed() == log_size(index.path)
+        assert index.contains(pattern_trigrams(b"first"))
+        assert [hit.line for hit in search(Path(tempdir), "first")] == [0]
+
+        await handler.delete("xxx")
+        assert not index.index_path.is_file()
+
+
+@pytest.mark.asyncio
+async def test_queue_file_handler_reopen():
+    with tempfile.TemporaryDirectory() as tempdir:
+        handler = log_streamer.QueueFileHandler(tempdir, LogWriter())
+        # retried right after the first attempt is closed
+        await handler.send(LogModel(id="xxx", log="first attempt\n"))
+        await handler.close("xxx")
+        await handler.send(LogModel(id="xxx", log="CUDA out of memory\n"))
+        await handler.close("xxx")
+        await handler.flush()
+        INDEXER.flush()
+
+        index = TrigramIndex(Path(tempdir) / "xxx")
+        assert index.indexed() == log_size(index.path)
+        hits = search(Path(tempdir), "out of memory")
+        assert [(hit.line, hit.log) for hit in hits] == [(1, "CUDA out of memory\n")]
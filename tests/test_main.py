@@ -23,3 +23,12 @@ def test_app():
 
     result = runner.invoke(app, ["log", "--help"])
     assert result.exit_code == 0, result.stdout
+
+    result = runner.invoke(app, ["cancel", "--help"])
+    assert result.exit_code == 0, result.stdout
+
+    result = runner.invoke(app, ["tracker", "--help"])
+    assert result.exit_code == 0, result.stdout
+
+    result = runner.invoke(app, ["search", "--help"])
+    assert result.exit_code == 0, result.stdout
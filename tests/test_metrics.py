@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from drudgeyer import metrics
+
+
+def test_render():
+    registry = metrics.Registry()
+    metrics.REGISTRY, default = registry, metrics.REGISTRY
+    try:
+        counter = metrics.Counter("xxx_total", "counter")
+        gauge = metrics.Gauge("yyy", "gauge", ["status"])
+        histogram = metrics.Histogram("zzz_seconds", "histogram", [1, 10])
+    finally:
+        metrics.REGISTRY = default
+
+    counter.inc()
+    counter.inc(2)
+    gauge.set(3, status="todo")
+    gauge.dec(status="todo")
+    gauge.inc(status="done")
+    for value in [0.5, 1, 5, 20]:
+        histogram.observe(value)
+    assert gauge.get(status="todo") == 2
+    assert histogram.count == 4
+
+    assert registry.render().splitlines() == [
+        "# HELP xxx_total counter",
+        "# TYPE xxx_total counter",
+        "xxx_total 3",
+        "# HELP yyy gauge",
+        "# TYPE yyy gauge",
+        'yyy{status="done"} 1',
+        'yyy{status="todo"} 2',
+        "# HELP zzz_seconds histogram",
+        "# TYPE zzz_seconds histogram",
+        'zzz_seconds_bucket{le="1.0"} 2',
+        'zzz_seconds_bucket{le="10.0"} 3',
+        'zzz_seconds_bucket{le="+Inf"} 4',
+        "zzz_seconds_sum 26.5",
+        "zzz_seconds_count 4",
+    ]
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_monitor_loop_lag():
+    metrics.LOOP_LAG.set(-1)
+    task = asyncio.get_event_loop().create_task(metrics.monitor_loop_lag(0.01))
+    await asyncio.sleep(0.05)
+    task.cancel()
+    await task
+    assert metrics.LOOP_LAG.get() >= 0
@@ -1,12 +1,18 @@
 import asyncio
+import subprocess
+import sys
 import tempfile
+import threading
+import time
 from asyncio.events import AbstractEventLoop
 from asyncio.subprocess import PIPE, STDOUT
 from pathlib import Path
 from time import sleep
+from typing import Any, Callable, List, Optional
 
 import pytest
 
+from drudgeyer.metrics import LOG_DROPPED
 from drudgeyer.worker import logger
 
 
@@ -29,6 +35,14 @@ def test_filelogger():
         with log.open() as f:
             assert "test\n" == f.readlines()[-1]
 
+        # batches of output are not separated by blank lines
+        logger_.output_lines([b"a\n", b"b\n"])
+        logger_.output_lines([b"10%\r"])
+        logger_.output_lines([b"20%\r", b"c\n"])
+        logger_.close()
+        logger.LOG_WRITER.flush()
+        assert log.read_bytes().endswith(b"test\na\nb\n10%\r20%\rc\n")
+
 
 def test_streaminglogger(event_loop: AbstractEventLoop) -> None:
     logger_ = logger.StreamingLogger()
@@ -72,3 +86,499 @@ async def test_readuntil(mocker) -> None:
         await logger.readline(process.stdout)
     await logger.readline(process.stdout)
     await process.wait()  # 0 means success
+
+
+@pytest.mark.asyncio
+async def test_chunkreader() -> None:
+    loop = asyncio.get_event_loop()
+    process = await asyncio.create_subprocess_shell(
+        "printf 'a\\nb\\rc\\r\\nd'", stdout=PIPE, stderr=STDOUT, loop=loop
+    )
+    reader = logger.ChunkReader(process.stdout)
+    lines = []
+    while True:
+        batch = await reader.read()
+        if not batch:
+            break
+        lines += batch
+    await process.wait()
+    assert lines == [b"a\n", b"b\r", b"c\r\n", b"d"]
+
+    # line without separator is flushed when exceeding limit
+    process = await asyncio.create_subprocess_shell(
+        "printf 'aaaaaaaa\\n'", stdout=PIPE, stderr=STDOUT, loop=loop
+    )
+    reader = logger.ChunkReader(process.stdout, chunksize=2, limit=4)
+    assert await reader.read() == [b"aaaa"]
+    assert await reader.read() == [b"aaaa"]
+    assert await reader.read() == [b"\n"]
+    assert await reader.read() == []
+    await process.wait()
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_chunkreader_split() -> None:
+    # "\r\n" split across chunks is a line separator
+    pipe = asyncio.StreamReader()
+    reader = logger.ChunkReader(pipe)
+    pipe.feed_data(b"a\r")
+    task = asyncio.ensure_future(reader.read())
+    await asyncio.sleep(0.01)
+    pipe.feed_data(b"\nb\r")
+    assert await task == [b"a\r\n"]
+    pipe.feed_eof()
+    assert await reader.read() == [b"b\r"]
+    assert await reader.read() == []
+
+    # utf-8 character is not cut at the limit
+    pipe = asyncio.StreamReader()
+    reader = logger.ChunkReader(pipe, chunksize=4, limit=4)
+    pipe.feed_data("aaaé\n".encode())
+    pipe.feed_eof()
+    assert await reader.read() == [b"aaa"]
+    assert await reader.read() == ["é\n".encode()]
+    assert await reader.read() == []
+
+
+@pytest.mark.asyncio
+async def test_output() -> None:
+    loop = asyncio.get_event_loop()
+    logs: List[str] = []
+
+    class ListLogger(logger.BaseLog):
+        @property
+        def log(self) -> Callable[[str], Any]:
+            return logs.append
+
+    process = await asyncio.create_subprocess_shell(
+        "seq 1 1000", stdout=PIPE, stderr=STDOUT, loop=loop
+    )
+    await ListLogger()._output(process.stdout)
+    await process.wait()
+    assert "".join(logs) == "".join(f"{i}\n" for i in range(1, 1001))
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_logbuffer_block() -> None:
+    buffer = logger.LogBuffer(maxsize=2, policy=logger.LogPolicy.block)
+    buffer.put_nowait(logger.LogModel(id="xxx", log="a\n"))
+    buffer.put_nowait(logger.LogModel(id="xxx", log="b\n"))
+    # nothing is lost even if full
+    buffer.put_nowait(logger.LogModel(id="xxx", log="c\n"))
+    assert buffer.full()
+
+    async def consume() -> None:
+        await asyncio.sleep(0.05)
+        await buffer.get()
+        await buffer.get()
+
+    task = asyncio.ensure_future(consume())
+    # writer waits until consumer drains
+    await buffer.drain()
+    assert not buffer.full()
+    await task
+    assert (await buffer.get()).log == "c\n"
+    assert buffer.dropped == 0
+
+
+@pytest.mark.timeout(1)
+@pytest.mark.asyncio
+async def test_logbuffer_block_without_reader() -> None:
+    buffer = logger.LogBuffer(maxsize=2, policy=logger.LogPolicy.block, stall=0.05)
+    for log in ["a\n", "b\n", "c\n"]:
+        buffer.put_nowait(logger.LogModel(id="xxx", log=log))
+    # nothing is reading, and the oldest is dropped instead of blocking
+    await buffer.drain()
+    assert not buffer.full()
+    assert buffer.dropped == 2
+
+    # dropped without waiting again, until the buffer is read
+    buffer.put_nowait(logger.LogModel(id="xxx", log="d\n"))
+    start = time.monotonic()
+    await buffer.drain()
+    assert time.monotonic() - start < 0.05
+    assert buffer.dropped == 3
+    assert (await buffer.get()).log == "d\n"
+    for log in ["e\n", "f\n"]:
+        buffer.put_nowait(logger.LogModel(id="xxx", log=log))
+    start = time.monotonic()
+    await buffer.drain()
+    assert time.monotonic() - start >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_logbuffer_keeps_end() -> None:
+    buffer = logger.LogBuffer(maxsize=2, policy=logger.LogPolicy.drop)
+    buffer.put_nowait(logger.LogModel(id="xxx", log="", end=True))
+    for log in ["a\n", "b\n"]:
+        buffer.put_nowait(logger.LogModel(id="yyy", log=log))
+    assert [log.end for log in buffer._buffer] == [True, False]
+    assert (await buffer.get()).end
+
+    # end is not merged into progress
+    buffer = logger.LogBuffer(maxsize=2, policy=logger.LogPolicy.coalesce)
+    for log in ["10%\r", "20%\r"]:
+        buffer.put_nowait(logger.LogModel(id="xxx", log=log))
+    buffer.put_nowait(logger.LogModel(id="xxx", log="", end=True))
+    assert [log.end for log in buffer._buffer] == [False, True]
+
+
+@pytest.mark.asyncio
+async def test_logbuffer_drop() -> None:
+    buffer = logger.LogBuffer(maxsize=2, policy=logger.LogPolicy.drop)
+    for log in ["a\n", "b\n", "c\n"]:
+        buffer.put_nowait(logger.LogModel(id="xxx", log=log))
+    assert len(buffer) == 2
+    assert buffer.dropped == 1
+    assert buffer.dropped_chars == 2
+    assert (await buffer.get()).log == "b\n"
+    assert (await buffer.get()).log == "c\n"
+
+    buffer = logger.LogBuffer(maxchars=4, policy=logger.LogPolicy.drop)
+    for log in ["aa\n", "bb\n"]:
+        buffer.put_nowait(logger.LogModel(id="xxx", log=log))
+    assert len(buffer) == 1
+    assert buffer.dropped_chars == 3
+
+
+@pytest.mark.asyncio
+async def test_logbuffer_coalesce() -> None:
+    buffer = logger.LogBuffer(maxsize=3, policy=logger.LogPolicy.coalesce)
+    dropped = LOG_DROPPED.get()
+    for log in ["start\n", "10%\r", "20%\r", "30%\r"]:
+        buffer.put_nowait(logger.LogModel(id="xxx", log=log))
+    # progress updates are collapsed into the latest one
+    assert len(buffer) == 2
+    assert buffer.dropped == 0
+    assert buffer.dropped_chars == 4
+    assert LOG_DROPPED.get() == dropped + 1
+    assert (await buffer.get()).log == "start\n20%\r"
+    assert (await buffer.get()).log == "30%\r"
+
+
+def test_streaminglogger_drop(event_loop: AbstractEventLoop) -> None:
+    logger_ = logger.StreamingLogger(maxsize=1, policy=logger.LogPolicy.drop)
+    logger_.reset("xxx", "yyy")
+    logger_.log("test1")
+    logger_.log("test2")
+    assert logger_.dropped == 1
+    assert logger_.dropped_chars == 5
+
+    async def assert_logger(logger_: logger.StreamingLogger) -> None:
+        log = await logger_.dequeue()
+        assert log.log == "test2"
+
+    event_loop.run_until_complete(assert_logger(logger_))
+
+
+def test_logwriter():
+    writer = logger.LogWriter(max_open=2)
+    with tempfile.TemporaryDirectory() as f:
+        paths = [Path(f) / f"xxx{idx}" for idx in range(4)]
+        for _ in range(3):
+            for path in paths:
+                writer.write(path, f"{path.name}\n")
+        writer.flush()
+
+        # open files are bounded
+        assert len(writer._files) == 2
+        for path in paths:
+            assert path.read_text() == f"{path.name}\n" * 3
+
+        # close on job completion
+        for path in paths:
+            writer.close(path)
+        writer.flush()
+        assert not writer._files
+
+        # reopen in append mode
+        writer.write(paths[0], "yyy\n")
+        writer.flush()
+        assert paths[0].read_text().endswith("xxx0\nyyy\n")
+
+
+def test_logwriter_shutdown():
+    writer = logger.LogWriter(window=60)
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        writer.write(path, "aaa\n")
+        writer.shutdown()
+        assert path.read_text() == "aaa\n"
+        assert not writer._files
+
+        # at exit, batches in the time window are not lost
+        script = (
+            "import sys; from pathlib import Path; from drudgeyer.worker import logger;"
+            "logger.LOG_WRITER.write(Path(sys.argv[1]), 'bbb\\n')"
+        )
+        subprocess.run([sys.executable, "-c", script, str(path)], check=True)
+        assert path.read_text() == "aaa\nbbb\n"
+
+
+def test_logwriter_observe():
+    writer = logger.LogWriter()
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        batches: List[Any] = []
+        writer.observe(path, batches.append)
+        writer.write(path, "aaa\n")
+        writer.write(path, "bbb\n")
+        writer.write(Path(f) / "yyy", "ccc\n")
+        writer.close(path)
+        writer.flush()
+
+        # called with batches of path, and None on close
+        assert batches == [b"aaa\nbbb\n", None]
+        assert not writer._observers
+
+
+def test_logwriter_observe_reopen():
+    writer = logger.LogWriter()
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        first: List[Any] = []
+        second: List[Any] = []
+        writer.observe(path, first.append)
+        writer.write(path, "aaa\n")
+        writer.close(path)
+        # reopened before the writer closes it
+        writer.observe(path, second.append)
+        writer.write(path, "bbb\n")
+        writer.close(path)
+        writer.flush()
+
+        # close only affects the observer registered before it
+        assert first == [b"aaa\n", None]
+        assert second == [b"bbb\n", None]
+
+
+def test_filelogger_single_thread():
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f)
+        logger_ = logger.QueueFileLogger()
+        logger_.reset("xxx-single-thread-0", "xxx", logdir=path.resolve())
+        logger_.log("test")
+        threads = threading.active_count()
+
+        # no more threads for other jobs
+        for idx in range(1, 5):
+            logger_.reset(f"xxx-single-thread-{idx}", "xxx", logdir=path.resolve())
+            logger_.log("test")
+            logger_.close()
+        assert threading.active_count() == threads
+
+        logger.LOG_WRITER.flush()
+        assert not logger.LOG_WRITER._files.get(path / "xxx-single-thread-4")
+        with (path / "xxx-single-thread-4").open() as log:
+            assert "test\n" == log.readlines()[-1]
+
+
+@pytest.mark.timeout(2)
+def test_logwriter_batch(mocker):
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+
+        # batched until the size limit
+        writer = logger.LogWriter(window=10, max_batch=8)
+        writer.write(path, "aaa\n")
+        writer.write(path, "bbb\n")
+        writer.write(path, "ccc\n")
+        writer._queue.join()
+        assert path.read_text() == "aaa\nbbb\n"
+
+        # rest of batch is written at close
+        writer.close(path)
+        writer._queue.join()
+        assert path.read_text() == "aaa\nbbb\nccc\n"
+
+        # batched within the time window, with a single write
+        writer = logger.LogWriter(window=0.05)
+        opened = []
+        _open = writer._open
+
+        def spy(path: Path):
+            f = _open(path)
+            opened.append(mocker.spy(f, "write"))
+            return f
+
+        writer._open = spy
+        for _ in range(100):
+            writer.write(path, "ddd\n")
+        sleep(0.2)
+        assert path.read_text().endswith("ccc\n" + "ddd\n" * 100)
+        assert len(opened) == 1
+        assert opened[0].call_count == 1
+
+
+@pytest.mark.timeout(2)
+def test_logwriter_window_under_load():
+    with tempfile.TemporaryDirectory() as f:
+        path, other = Path(f) / "xxx", Path(f) / "yyy"
+        writer = logger.LogWriter(window=0.05, max_batch=8)
+        written: List[Optional[bytes]] = []
+        writer.observe(path, written.append)
+        loads = 0
+
+        def load(data: Optional[bytes]) -> None:
+            nonlocal loads
+            # other job keeps the writer busy
+            sleep(0.005)
+            if data is not None and loads < 100:
+                loads += 1
+                writer.write(other, "y" * 8)
+
+        writer.observe(other, load)
+        writer.write(other, "y" * 8)
+        writer.write(path, "aaa\n")
+
+        # batch is written within the time window, not after the load
+        sleep(0.2)
+        assert written == [b"aaa\n"]
+        assert loads < 100
+        writer.flush()
+
+
+def test_logwriter_segments():
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        writer = logger.LogWriter(segment_size=10)
+        assert logger.read_log(path) is None
+
+        for msg in ["aaaa\n", "bbbb\n", "cccc\n", "dddd\n", "ee"]:
+            writer.write(path, msg)
+            writer.flush()
+
+        # rolled segments are compressed, and active log is plain
+        assert [p.name for p in logger.log_segments(path)] == [
+            "xxx.0.gz",
+            "xxx.1.gz",
+            "xxx",
+        ]
+        assert path.read_text() == "ee"
+        assert logger.read_log(path) == "aaaa\nbbbb\ncccc\ndddd\nee"
+
+        # segment being compressed
+        (Path(f) / "xxx.2").write_text("ffff\n")
+        (Path(f) / "xxx.2.gz.tmp").write_text("broken")
+        assert logger.read_log(path) == "aaaa\nbbbb\ncccc\ndddd\nffff\nee"
+
+
+@pytest.mark.timeout(5)
+def test_logwriter_compress_in_background(mocker):
+    released = threading.Event()
+    copyfileobj = logger.shutil.copyfileobj
+
+    def slow_copy(src, dst):
+        released.wait()
+        copyfileobj(src, dst)
+
+    mocker.patch("drudgeyer.worker.logger.shutil.copyfileobj", slow_copy)
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        writer = logger.LogWriter(segment_size=5, max_head=5, max_tail=5)
+        for msg in ["aaaa\n", "bbbb\n", "cccc\n", "dd"]:
+            writer.write(path, msg)
+            writer._submit_all()
+            # writing is not blocked by compression
+            writer._queue.join()
+
+        # read as is until compressed, and truncated meanwhile
+        assert [p.name for p in logger.log_segments(path)] == [
+            "xxx.0",
+            "xxx.1.gap",
+            "xxx.2",
+            "xxx",
+        ]
+        assert logger.read_log(path) == "aaaa\n\n... 5 bytes truncated ...\ncccc\ndd"
+
+        # replaced once compressed. truncated one is discarded
+        released.set()
+        writer.flush()
+        assert sorted(p.name for p in Path(f).iterdir()) == [
+            "xxx",
+            "xxx.0.gz",
+            "xxx.1.gap",
+            "xxx.2.gz",
+        ]
+        assert logger.read_log(path) == "aaaa\n\n... 5 bytes truncated ...\ncccc\ndd"
+
+
+def test_logwriter_retention():
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        writer = logger.LogWriter(segment_size=2 ** 10, max_head=10, max_tail=10)
+        assert writer.roll_size == 10
+
+        for c in "abcdefgh":
+            writer.write(path, c * 4 + "\n")
+            writer.flush()
+        writer.write(path, "ii")
+        writer.flush()
+
+        # head and tail are kept, and segments between them are truncated
+        assert [p.name for p in logger.log_segments(path)] == [
+            "xxx.0.gz",
+            "xxx.1.gap",
+            "xxx.3.gz",
+            "xxx",
+        ]
+        assert logger.read_log(path) == (
+            "aaaa\nbbbb\n\n... 20 bytes truncated ...\ngggg\nhhhh\nii"
+        )
+        # offsets are unchanged
+        assert b"".join(logger.read_log_from(path, 30)) == b"gggg\nhhhh\nii"
+
+
+def test_logwriter_retention_many_rolls():
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        writer = logger.LogWriter(segment_size=2 ** 10, max_head=10, max_tail=10)
+
+        letters = "abcdefghijklmnopqrst"
+        for c in letters:
+            writer.write(path, c * 4 + "\n")
+            writer.flush()
+
+        # segments rolled after the gap do not overwrite kept ones
+        assert [p.name for p in logger.log_segments(path)] == [
+            "xxx.0.gz",
+            "xxx.1.gap",
+            "xxx.9.gz",
+            "xxx",
+        ]
+        assert logger.read_log(path) == (
+            "aaaa\nbbbb\n\n... 80 bytes truncated ...\nssss\ntttt\n"
+        )
+        # offsets are unchanged
+        assert b"".join(logger.read_log_from(path, 90)) == b"ssss\ntttt\n"
+
+
+def test_logwriter_retention_index():
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx.idx"
+        writer = logger.LogWriter(segment_size=2 ** 10, max_head=0, max_total=0)
+        assert writer.roll_size == 1
+
+        for i in range(3):
+            writer.write(path, f"{i} {i * 10} {i}\n")
+            writer.flush()
+
+        # index of log is not rolled nor truncated
+        assert [p.name for p in Path(f).iterdir()] == ["xxx.idx"]
+        assert path.read_text() == "0 0 0\n1 10 1\n2 20 2\n"
+
+
+def test_logwriter_total():
+    with tempfile.TemporaryDirectory() as f:
+        path = Path(f) / "xxx"
+        writer = logger.LogWriter(segment_size=10, max_total=0)
+
+        for c in "abcd":
+            writer.write(path, c * 4 + "\n")
+            writer.flush()
+
+        # rolled segments are truncated into a gap
+        assert [p.name for p in logger.log_segments(path)] == ["xxx.0.gap", "xxx"]
+        assert logger.read_log(path) == "\n... 20 bytes truncated ...\n"
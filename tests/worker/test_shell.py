@@ -1,13 +1,24 @@
 import asyncio
+import tempfile
 from asyncio.events import AbstractEventLoop
+from pathlib import Path
 from signal import SIGINT
-from typing import Any, Callable, Optional, Type
+from typing import Any, Callable, List, Optional, Type
 
 import pytest
+import requests
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
 
-from drudgeyer.job_scheduler.queue import BaseQueueModel, Status
+from drudgeyer.job_scheduler.cache import ResultCache
+from drudgeyer.job_scheduler.dependency import CopyDep
+from drudgeyer.job_scheduler.lease import LeaseManager
+from drudgeyer.job_scheduler.queue import BaseQueueModel, FileQueue, Status
+from drudgeyer.log_tracker.broadcasting import BaseReadStreamer, create_app
+from drudgeyer.metrics import LOG_BYTES, LOG_LINES, SUBPROCESSES
 from drudgeyer.worker.logger import BaseLog
-from drudgeyer.worker.shell import BaseWorker, Worker
+from drudgeyer.worker.shell import BaseWorker, RemoteWorker, Worker
 
 
 class ValidDequeueTerminateRun(BaseWorker):
@@ -85,11 +96,184 @@ async def test_exec_command() -> None:
     worker = Worker(logger=DummyLogger(), queue=None)  # type: ignore
 
     # success
+    lines, size = LOG_LINES.get(), LOG_BYTES.get()
     task = BaseQueueModel(id="111-111", command="echo 1", order=0)
     status = await worker.run(task, loop)
     assert status == Status.done
+    assert (LOG_LINES.get() - lines, LOG_BYTES.get() - size) == (1, 2)
+    assert SUBPROCESSES.get() == 0
 
     # failure
     task = BaseQueueModel(id="111-111", command="python3 -c 'print())'", order=0)
     status = await worker.run(task, loop)
     assert status == Status.failed
+
+
+@pytest.mark.timeout(3)
+@pytest.mark.asyncio
+async def test_cancel(capsys) -> None:
+    loop = asyncio.get_event_loop()
+    worker = Worker(logger=DummyLogger(), queue=None)  # type: ignore
+    assert not worker.cancel("111-111"), "no running job"
+
+    for preempt, expected in [(False, Status.failed), (True, Status.todo)]:
+        task = BaseQueueModel(id="111-111", command="sleep 10 && echo 1", order=0)
+        run = loop.create_task(worker.run(task, loop))
+        await asyncio.sleep(0.2)
+        assert not worker.cancel("222-222"), "not running"
+        assert worker.cancel("111-111", preempt=preempt)
+        status = await run
+        assert status == expected
+        assert not worker.cancel("111-111")
+        worker._cancelled = None
+
+    out = capsys.readouterr().out
+    assert "Task cancelled" in out
+    assert "Task preempted" in out
+    assert "Task finished" not in out
+
+
+@pytest.mark.asyncio
+async def test_exec_command_cached(capsys) -> None:
+    loop = asyncio.get_event_loop()
+    with tempfile.TemporaryDirectory() as tempdir:
+        cache = ResultCache(Path(tempdir) / "cache")
+        worker = Worker(logger=DummyLogger(), queue=None, cache=cache)  # type: ignore
+        dep = Path(tempdir) / "dep"
+        dep.mkdir()
+
+        task = BaseQueueModel(id="111-111", command="echo 1", order=0, workdir=dep)
+        status = await worker.run(task, loop)
+        assert status == Status.done
+        await asyncio.sleep(0.01)
+        assert "Cached" not in capsys.readouterr().out
+
+        # same job is skipped
+        task = BaseQueueModel(id="222-222", command="echo 1", order=0, workdir=dep)
+        status = await worker.run(task, loop)
+        assert status == Status.done
+        assert "as 111-111 succeeded" in capsys.readouterr().out
+
+        # failed job is not cached
+        task = BaseQueueModel(id="333-333", command="exit 1", order=0, workdir=dep)
+        assert await worker.run(task, loop) == Status.failed
+        assert await worker.run(task, loop) == Status.failed
+        assert "Cached" not in capsys.readouterr().out
+
+        # job without dependency is always run
+        task = BaseQueueModel(id="444-444", command="echo 2", order=0)
+        assert await worker.run(task, loop) == Status.done
+        assert await worker.run(task, loop) == Status.done
+        assert "Cached" not in capsys.readouterr().out
+
+
+class ToyReadStreamer(BaseReadStreamer):
+    async def get(self, key: str) -> str:
+        ...  # pragma: no cover
+
+    async def add_client(
+        self,
+        id: str,
+        key: str,
+        start: Optional[int] = None,
+        tail: Optional[int] = None,
+        offset: Optional[int] = None,
+    ) -> None:
+        ...  # pragma: no cover
+
+    async def delete(self, key: str) -> None:
+        ...  # pragma: no cover
+
+
+@pytest.mark.timeout(5)
+def test_remote_worker(mocker, event_loop: AbstractEventLoop) -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        root = Path(tempdir)
+        src = root / "src"
+        src.mkdir()
+        (src / "a.txt").write_text("a")
+
+        # server side
+        queue = FileQueue(path=root / "queue", depends=CopyDep(src, root / "dep"))
+        queue.enqueue("cat a.txt")
+        queue.enqueue("exit 1")
+        client = TestClient(
+            create_app(ToyReadStreamer(), LeaseManager(queue, queue.depends))
+        )
+
+        def request(method: str, url: str, **kwargs: Any) -> Any:
+            # requests run in executor thread
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            return client.request(method, url, **kwargs)
+
+        mocker.patch("drudgeyer.worker.shell.requests.request", request)
+
+        # remote side
+        logs: List[str] = []
+
+        class ListLogger(BaseLog):
+            @property
+            def log(self) -> Callable[[str], Any]:
+                return logs.append
+
+        depends = CopyDep(None, root / "remote")
+        worker = RemoteWorker(ListLogger(), "testserver", depends, name="a", ttl=0.03)
+
+        async def flow() -> None:
+            task = await worker.dequeue()
+            assert task.workdir == root / "remote" / task.id / "src"
+            status = await worker.run(task, event_loop)
+            await asyncio.sleep(0.01)
+            assert status == Status.done
+            assert "a" in logs
+            await worker.worked(task, status)
+            assert not (root / "remote" / task.id).is_dir()
+
+            task = await worker.dequeue()
+            status = await worker.run(task, event_loop)
+            assert status == Status.failed
+            await worker.worked(task, status)
+
+            assert not await worker.dequeue()
+
+        event_loop.run_until_complete(flow())
+        assert len(queue.list(status=Status.done)) == 1
+        assert len(queue.list(status=Status.failed)) == 1
+
+
+@pytest.mark.timeout(5)
+def test_remote_worker_unreachable(mocker, event_loop: AbstractEventLoop) -> None:
+    with tempfile.TemporaryDirectory() as tempdir:
+        root = Path(tempdir)
+        src = root / "src"
+        src.mkdir()
+        queue = FileQueue(path=root / "queue", depends=CopyDep(src, root / "dep"))
+        queue.enqueue("ls")
+        client = TestClient(
+            create_app(ToyReadStreamer(), LeaseManager(queue, queue.depends))
+        )
+
+        def request(method: str, url: str, **kwargs: Any) -> Any:
+            if "/queue/dep/" in url:
+                raise requests.ConnectionError
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            return client.request(method, url, **kwargs)
+
+        mocker.patch("drudgeyer.worker.shell.requests.request", request)
+        depends = CopyDep(None, root / "remote")
+        worker = RemoteWorker(DummyLogger(), "testserver", depends, name="a")
+
+        # dependency is not fetched, and the job is put back
+        assert event_loop.run_until_complete(worker.dequeue()) is None
+        assert len(queue.list(status=Status.todo)) == 1
+        assert not list((root / "remote").glob("*"))
+
+        # not the queue API
+        app = FastAPI()
+        app.post("/queue/lease")(lambda: PlainTextResponse("<html>"))
+        client = TestClient(app)
+        mocker.patch(
+            "drudgeyer.worker.shell.requests.request",
+            lambda method, url, **kwargs: client.request(method, url, **kwargs),
+        )
+        assert event_loop.run_until_complete(worker.dequeue()) is None